@@ -0,0 +1,59 @@
+"""Стоимость маршрутизации одного callback: прежняя цепочка if/startswith против CallbackRouter.
+
+Запуск: python benchmarks/bench_callback_routing.py [--number 200000]
+"""
+import argparse
+import os
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:BENCHMARK-TOKEN")
+
+from bot import callback_router  # noqa: E402
+
+# Порядок проверок прежнего handle_callback: (точное совпадение?, ключ)
+LEGACY_CHAIN = [
+    (True, "button_new_note"), (True, "button_list_notes"), (False, "nav_year:"), (False, "sel_month:"),
+    (False, "nav_days:"), (False, "page_week:"), (False, "view_month:"), (True, "noop"),
+    (False, "back_months:"), (False, "sel_day:"), (True, "button_main_menu"), (True, "export_open_filter"),
+    (True, "export_txt"), (True, "export_pdf"), (True, "export_scope:all"), (True, "export_scope:year"),
+    (True, "export_scope:month"), (True, "export_cancel"), (True, "export_back_root"),
+    (True, "export_back_years"), (False, "export_year:"), (False, "export_month:"), (False, "export_make:"),
+    (True, "button_delete_note"), (False, "del_nav_year:"), (False, "del_sel_month:"),
+    (False, "del_nav_days:"), (False, "del_back_months:"), (False, "del_sel_day:"), (False, "button_cancel"),
+]
+
+SAMPLES = {
+    "button_new_note": "button_new_note",
+    "nav_year": "nav_year:2024:prev",
+    "sel_day": "sel_day:2024:5:17",
+    "export_make": "export_make:pdf:month:2024:5",
+    "del_nav_days": "del_nav_days:2024:5:2",
+    "del_sel_day": "del_sel_day:2024:5:17",
+    "button_cancel": "button_cancel",
+}
+
+
+def legacy_route(data: str):
+    for exact, key in LEGACY_CHAIN:
+        if (data == key) if exact else data.startswith(key):
+            return key, data.split(":")
+    return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+    print(f"{'callback':<16}{'legacy ns':>12}{'router ns':>12}")
+    for name, data in SAMPLES.items():
+        legacy = timeit.timeit(lambda: legacy_route(data), number=args.number) / args.number * 1e9
+        router = timeit.timeit(lambda: callback_router.resolve(data), number=args.number) / args.number * 1e9
+        print(f"{name:<16}{legacy:>12.0f}{router:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
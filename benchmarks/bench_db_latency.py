@@ -0,0 +1,92 @@
+"""Латентность callback'ов под конкурентной нагрузкой: синхронный sqlite3 против пула database.py.
+
+Запуск: python benchmarks/bench_db_latency.py [--users 200] [--notes 2000] [--rounds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def seed(path: str, users: int, notes_per_user: int):
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            strength INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            datetime TEXT NOT NULL
+        )
+    ''')
+    rnd = random.Random(42)
+    rows = []
+    for uid in range(1, users + 1):
+        for _ in range(notes_per_user):
+            rows.append((uid, rnd.randint(1, 10), "синтетическая запись",
+                         f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(2020, 2025)} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"))
+    conn.executemany("INSERT INTO notes (user_id, strength, text, datetime) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def sync_get_notes(path: str, user_id: int):
+    # Поведение до изменений: новое соединение на каждый запрос прямо в event loop
+    conn = sqlite3.connect(path)
+    cur = conn.cursor()
+    cur.execute("SELECT id, strength, text, datetime FROM notes WHERE user_id = ?", (user_id,))
+    notes = cur.fetchall()
+    conn.close()
+    return notes
+
+
+async def run(label: str, get_notes, users: int, rounds: int):
+    latencies = []
+
+    async def callback(uid: int):
+        start = time.perf_counter()
+        await asyncio.sleep(0)  # имитация ожидания сети до обработчика
+        await get_notes(uid)
+        latencies.append(time.perf_counter() - start)
+
+    for _ in range(rounds):
+        await asyncio.gather(*(callback(uid) for uid in range(1, users + 1)))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:>8}: n={len(latencies)} mean={statistics.mean(latencies) * 1000:.1f}ms p50={p50:.1f}ms p99={p99:.1f}ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.users, args.notes)
+        os.environ["NOTES_DB_PATH"] = path
+        import database
+
+        async def before(uid):
+            return sync_get_notes(path, uid)
+
+        await run("before", before, args.users, args.rounds)
+        await database.init_db()
+        await run("after", database.get_notes, args.users, args.rounds)
+        database.close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""Задержка callback'ов других пользователей во время рендеринга больших экспортов:
+рендер прямо в event loop против пула процессов export.run_export.
+
+Запуск: python benchmarks/bench_export_pool.py [--notes 20000] [--exports 4]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+USER_ID = 1
+
+
+def seed(path: str, count: int):
+    os.environ["NOTES_DB_PATH"] = path
+    import database
+    asyncio.run(database.init_db())
+    database.close_db()
+    rnd = random.Random(42)
+    rows = []
+    for _ in range(count):
+        dt = f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(2015, 2025)} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+        rows.append((USER_ID, rnd.randint(1, 10), "синтетическая запись " * 3, dt, database.legacy_to_ts(dt)))
+    conn = sqlite3.connect(path)
+    conn.executemany("INSERT INTO notes (user_id, strength, text, datetime, ts) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+async def probe(stop: asyncio.Event, latencies: list, interval: float = 0.01):
+    """Имитация callback'ов других пользователей: насколько позже ожидаемого они обслуживаются."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - start - interval)
+
+
+async def run(label: str, render, exports: int):
+    stop = asyncio.Event()
+    latencies = []
+    prober = asyncio.create_task(probe(stop, latencies))
+    started = time.perf_counter()
+    await asyncio.gather(*(render() for _ in range(exports)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000 if latencies else 0.0
+    worst = latencies[-1] * 1000 if latencies else 0.0
+    print(f"{label:>7}: exports={exports} wall={elapsed:.2f}s probes={len(latencies)} p99 lag={p99:.1f}ms max lag={worst:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--exports", type=int, default=4)
+    args = parser.parse_args()
+    header = ["Экспорт заметок", "=================", ""]
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.notes)
+        import export
+
+        async def inline():
+            export.render_export("pdf", header, path, USER_ID)
+            await asyncio.sleep(0)
+
+        async def pooled():
+            await export.run_export("pdf", header, path, USER_ID)
+
+        async def runner():
+            await run("inline", inline, args.exports)
+            await run("pool", pooled, args.exports)
+            export.shutdown_export_pool()
+
+        asyncio.run(runner())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Форматирование месяца из 10k заметок: кортежи со strptime на каждую строку
+против записей database.Note с датой, разобранной один раз при чтении из БД.
+
+Запуск: python benchmarks/bench_format_month.py [--notes 10000] [--repeat 5]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:BENCHMARK-TOKEN")
+
+from bot import format_notes_for_days  # noqa: E402
+from database import NOTES_TZ, Note  # noqa: E402
+from export import WEEKDAY_ABBR_RU  # noqa: E402
+
+
+def legacy_format(notes) -> str:
+    # Прежняя реализация: strptime для каждой строки при каждом показе
+    parts = []
+    for note in notes:
+        dt = datetime.datetime.strptime(note[3], "%d.%m.%Y %H:%M")
+        dow = WEEKDAY_ABBR_RU[dt.weekday()]
+        parts.append(
+            f"---id:{note[0]}---\n"
+            f"Дата: {dt.strftime('%d.%m.%Y %H:%M')} ({dow})\n"
+            f"Сила боли: {note[1]}\n"
+            f"Комментарий: {note[2]}\n"
+        )
+    return "".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    rnd = random.Random(42)
+    rows = []
+    for i in range(args.notes):
+        dt = datetime.datetime(2024, 5, rnd.randint(1, 31), rnd.randint(0, 23), rnd.randint(0, 59), tzinfo=NOTES_TZ)
+        rows.append((i, rnd.randint(1, 10), "синтетическая запись", dt))
+    tuples = [(i, s, t, dt.strftime("%d.%m.%Y %H:%M")) for i, s, t, dt in rows]
+    records = [Note(i, s, t, dt, dt.weekday()) for i, s, t, dt in rows]
+    assert legacy_format(tuples) == format_notes_for_days(records)
+
+    legacy = min(timeit.repeat(lambda: legacy_format(tuples), number=1, repeat=args.repeat))
+    typed = min(timeit.repeat(lambda: format_notes_for_days(records), number=1, repeat=args.repeat))
+    print(f"notes={args.notes} legacy={legacy * 1000:.1f}ms typed={typed * 1000:.1f}ms speedup={legacy / typed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Импорт дневника (/import): время на N записей для TXT (формат экспорта), CSV и JSON,
+затем повторный импорт того же файла (все записи — дубликаты).
+
+Запуск: python benchmarks/bench_import.py [--rows 100000]
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synthetic import seed_db, synthetic_rows  # noqa: E402
+
+
+def write_files(tmp: str, rows: int) -> dict[str, str]:
+    from database import legacy_to_ts, Note, NOTES_TZ
+    from datetime import datetime
+    from export import export_lines, render_txt
+
+    data = sorted(synthetic_rows(0, rows, random.Random(7)), key=lambda row: row[4])
+    paths = {fmt: os.path.join(tmp, f"diary.{fmt}") for fmt in ("txt", "csv", "json")}
+    notes = []
+    for i, (_, strength, text, dt, ts) in enumerate(data, 1):
+        local = datetime.fromtimestamp(legacy_to_ts(dt), NOTES_TZ)
+        notes.append(Note(i, strength, text, local, local.weekday()))
+    with open(paths["txt"], "wb") as f:
+        f.write(render_txt(export_lines(["Экспорт заметок", "=================", ""], notes)))
+    with open(paths["csv"], "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["datetime", "strength", "text"])
+        writer.writerows((dt, strength, text) for _, strength, text, dt, _ in data)
+    with open(paths["json"], "w", encoding="utf-8") as f:
+        json.dump([{"datetime": dt, "strength": strength, "text": text} for _, strength, text, dt, _ in data],
+                  f, ensure_ascii=False)
+    return paths
+
+
+async def run(paths: dict[str, str]):
+    import database
+    from importer import import_file
+
+    await database.init_db()
+    try:
+        for user_id, (fmt, path) in enumerate(paths.items(), 1):
+            size = os.path.getsize(path) / 1024 / 1024
+            for attempt in ("новые", "повтор"):
+                started = time.perf_counter()
+                report = await import_file(user_id, path, fmt)
+                elapsed = time.perf_counter() - started
+                print(f"{fmt:<5} {size:6.1f} МБ {attempt:<7} {elapsed:6.2f}s  {report.read / elapsed:9.0f} строк/с  "
+                      f"добавлено {report.added}, дубликатов {report.duplicates}, ошибок {report.invalid}")
+    finally:
+        database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        seed_db(os.path.join(tmp, "notes.db"), {})
+        paths = write_files(tmp, args.rows)
+        asyncio.run(run(paths))
+
+
+if __name__ == "__main__":
+    main()
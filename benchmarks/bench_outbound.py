@@ -0,0 +1,87 @@
+"""Исходящие вызовы при всплеске нагрузки: напрямую против outbound.OutboundScheduler.
+
+Заглушка Bot API отвечает 429 при превышении лимитов (в чат и глобально). Каждый
+"пользователь" листает календарь (правка + answerCallbackQuery на каждое нажатие,
+часть правок повторяется) и одновременно запрашивает экспорт (sendDocument).
+
+Запуск: python benchmarks/bench_outbound.py [--chats 30] [--edits 6]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.types import BufferedInputFile  # noqa: E402
+
+from fake_bot_api import FakeBotAPI  # noqa: E402
+from outbound import OutboundScheduler  # noqa: E402
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def user_burst(bot: Bot, chat_id: int, edits: int, click_latency: list, failures: list):
+    async def clicks():
+        # Как в обработчиках: правка сообщения, затем ответ на callback.
+        # Каждая вторая правка повторяет предыдущий текст (пользователь жмёт ту же кнопку)
+        for i in range(edits):
+            start = time.perf_counter()
+            await bot.edit_message_text(f"Страница {i // 2}", chat_id=chat_id, message_id=1)
+            await bot.answer_callback_query(f"{chat_id}:{i}")
+            click_latency.append(time.perf_counter() - start)
+
+    async def guarded(coro):
+        try:
+            await coro
+        except TelegramRetryAfter:
+            failures.append(chat_id)
+
+    await asyncio.gather(guarded(clicks()),
+                         guarded(bot.send_document(chat_id, BufferedInputFile(b"x" * 4096, "notes.txt"))))
+
+
+async def run(label: str, scheduler: OutboundScheduler | None, args) -> None:
+    api = FakeBotAPI(port=args.port, chat_limit=args.chat_limit, global_limit=args.global_limit)
+    await api.start()
+    bot = Bot(token="1:bench", session=AiohttpSession(api=TelegramAPIServer.from_base(api.base)))
+    if scheduler is not None:
+        bot.session.middleware(scheduler)
+    click_latency, failures = [], []
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(user_burst(bot, chat_id, args.edits, click_latency, failures)
+                               for chat_id in range(1, args.chats + 1)))
+    finally:
+        elapsed = time.perf_counter() - started
+        await bot.session.close()
+        await api.stop()
+    print(f"{label:>9}: wall={elapsed:.2f}s api_calls={sum(api.calls.values())} 429={api.flood_errors} "
+          f"failed={len(failures)} click p50={percentile(click_latency, 0.5):.0f}ms p99={percentile(click_latency, 0.99):.0f}ms")
+    if scheduler is not None:
+        print(f"{'':>9}  {scheduler.stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=30)
+    parser.add_argument("--edits", type=int, default=6)
+    parser.add_argument("--chat-limit", type=int, default=4, help="сообщений в чат за секунду до 429")
+    parser.add_argument("--global-limit", type=int, default=40, help="сообщений всего за секунду до 429")
+    parser.add_argument("--port", type=int, default=8082)
+    args = parser.parse_args()
+    asyncio.run(run("direct", None, args))
+    asyncio.run(run("scheduler", OutboundScheduler(), args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Планировщик напоминаний на 100k подписанных пользователей, отправка — заглушка.
+
+1. Ежедневные напоминания равномерно по суткам: время старта, память и CPU в простое
+   (для сравнения — по спящей корутине на пользователя).
+2. Массовое время: все напоминания в одну секунду — за сколько разосланы при заданном rate,
+   сколько записей одновременно в памяти.
+
+Запуск: python benchmarks/bench_reminders.py [--users 100000] [--burst 20000] [--rate 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def seed(path: str, rows):
+    os.environ["NOTES_DB_PATH"] = path
+    import database
+    database.close_db()
+    database.DB_PATH = path
+    asyncio.run(database.init_db())
+    database.close_db()
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("DELETE FROM reminders")
+        conn.executemany("INSERT INTO reminders (user_id, kind, due_ts) VALUES (?, 'daily', ?)", rows)
+    conn.close()
+
+
+async def idle(users: int, seconds: float):
+    from reminders import ReminderScheduler
+
+    async def send(user_id, kind):
+        pass
+
+    tracemalloc.start()
+    started, cpu = time.perf_counter(), time.process_time()
+    scheduler = ReminderScheduler(send)
+    scheduler.start()
+    while scheduler.stats["loads"] == 0:
+        await asyncio.sleep(0.001)
+    startup = time.perf_counter() - started
+    cpu_started = time.process_time()
+    await asyncio.sleep(seconds)
+    idle_cpu = (time.process_time() - cpu_started) / seconds * 100
+    memory = tracemalloc.get_traced_memory()[1]
+    await scheduler.stop()
+    tracemalloc.stop()
+    print(f"планировщик: старт {startup * 1000:.0f} ms, в памяти {scheduler.stats['in_memory']} из {users}, "
+          f"пик памяти {memory / 1024 / 1024:.1f} МБ, CPU в простое {idle_cpu:.2f}%, отправлено {scheduler.stats['sent']}, "
+          f"всего CPU {time.process_time() - cpu:.2f}s")
+
+    # Для сравнения: спящая корутина на каждого пользователя
+    tracemalloc.start()
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(asyncio.sleep(random.uniform(60, 86400))) for _ in range(users)]
+    await asyncio.sleep(0)
+    startup = time.perf_counter() - started
+    memory = tracemalloc.get_traced_memory()[1]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    tracemalloc.stop()
+    print(f"корутина на пользователя: старт {startup * 1000:.0f} ms, пик памяти {memory / 1024 / 1024:.1f} МБ")
+
+
+async def burst(users: int, rate: float, due_ts: int):
+    from reminders import ReminderScheduler
+
+    sent = []
+
+    async def send(user_id, kind):
+        sent.append(time.time())
+
+    scheduler = ReminderScheduler(send, rate=rate)
+    peak = 0
+    scheduler.start()
+    cpu = time.process_time()
+    while len(sent) < users:
+        peak = max(peak, len(scheduler._heap))
+        await asyncio.sleep(0.05)
+    cpu = time.process_time() - cpu
+    await scheduler.stop()
+    spread = sent[-1] - due_ts
+    print(f"массовое время: {users} напоминаний за {spread:.1f}s (ожидаемо {users / rate:.1f}s при {rate:.0f}/s), "
+          f"пик в памяти {peak}, загрузок окна {scheduler.stats['loads']}, CPU {cpu / users * 1e6:.0f} мкс на напоминание")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--burst", type=int, default=20000, help="напоминаний на одну секунду")
+    parser.add_argument("--rate", type=float, default=2000, help="отправок в секунду для массового времени")
+    parser.add_argument("--idle", type=float, default=5, help="секунд наблюдения в простое")
+    args = parser.parse_args()
+    import database
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "notes.db")
+        now = int(time.time())
+        rnd = random.Random(1)
+        seed(path, [(user_id, now + rnd.randint(60, 86400)) for user_id in range(1, args.users + 1)])
+        asyncio.run(idle(args.users, args.idle))
+        database.close_db()
+        due_ts = int(time.time()) + 3
+        seed(path, [(user_id, due_ts) for user_id in range(1, args.burst + 1)])
+        asyncio.run(burst(args.burst, args.rate, due_ts))
+        database.close_db()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Поиск /search (FTS5) на большой таблице: по умолчанию 1M заметок — один пользователь со 100k
+заметок и 900 пользователей по 1000. Время search_notes для частых и редких слов, с фильтрами
+и без слов; первая страница и общее число найденных.
+
+Запуск: python benchmarks/bench_search.py [--heavy 100000] [--users 900] [--notes 1000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synthetic import seed_db  # noqa: E402
+
+HEAVY_USER = 1
+QUERIES = [
+    "мигрень",                      # частое слово
+    "таблетку",                     # другая форма слова из комментариев
+    "аура тошнота",                 # два слова
+    "приняла таблетку отпустило",   # три слова
+    "ибупрофен",                    # нет в комментариях
+    "боль сила:7-10",               # слово и сила
+    "компьютер с:2020 по:2021",     # слово и даты
+    "сила:10 с:06.2024",            # только фильтры
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+
+async def run(users: list[int], runs: int):
+    import database
+    from search import parse_query
+
+    await database.init_db()
+    print(f"{'запрос':<30} {'польз.':>7} {'найдено':>8} {'p50':>8} {'p99':>8}  (ms)")
+    try:
+        for text in QUERIES:
+            query = parse_query(text)
+            for label, sample in (("100k", [HEAVY_USER]), ("1k", users)):
+                times = []
+                found = 0
+                for i in range(runs):
+                    user_id = sample[i % len(sample)]
+                    started = time.perf_counter()
+                    total, _ = await database.search_notes(user_id, query.terms, query.min_strength, query.max_strength,
+                                                           query.start, query.end)
+                    times.append(time.perf_counter() - started)
+                    found = total
+                print(f"{text:<30} {label:>7} {found:>8} {percentile(times, 0.5):8.2f} {percentile(times, 0.99):8.2f}")
+    finally:
+        database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--heavy", type=int, default=100000, help="заметок у самого активного пользователя")
+    parser.add_argument("--users", type=int, default=900, help="обычных пользователей")
+    parser.add_argument("--notes", type=int, default=1000, help="заметок у обычного пользователя")
+    parser.add_argument("--runs", type=int, default=50, help="замеров на запрос")
+    args = parser.parse_args()
+    users = {HEAVY_USER: args.heavy, **{user_id: args.notes for user_id in range(2, args.users + 2)}}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "notes.db")
+        started = time.perf_counter()
+        seed_db(path, users)
+        conn = sqlite3.connect(path)
+        rows = conn.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        index = conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name LIKE 'notes_fts%'").fetchone()[0]
+        conn.close()
+        print(f"{rows} заметок, индекс {index / 1024 / 1024:.1f} МБ, заполнение {time.perf_counter() - started:.0f}s")
+        sample = random.Random(1).sample(range(2, args.users + 2), min(args.users, args.runs))
+        asyncio.run(run(sample, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Набор бенчмарков горячих путей бота на синтетических пользователях (от 10 до 100k заметок).
+
+Работает офлайн: временная БД, Bot API заменён заглушкой сессии. Результаты пишутся
+в JSON, их можно сравнить с результатами другого коммита.
+
+Запуск:
+    python benchmarks/bench_suite.py --out before.json
+    python benchmarks/bench_suite.py --out after.json --compare before.json
+    python benchmarks/bench_suite.py --sizes 10 1000 --min-time 0.1   # быстрый прогон
+"""
+import argparse
+import asyncio
+import datetime
+import inspect
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from synthetic import seed_db  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+# Выше этого размера PDF по всем заметкам не строится (десятки тысяч страниц)
+PDF_ALL_LIMIT = 10000
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def measure(fn, min_time: float, setup=None, min_runs: int = 5, max_runs: int = 2000) -> dict:
+    """Повторяет fn (обычную или корутинную функцию) не меньше min_time секунд."""
+    times = []
+    total = 0.0
+    while (total < min_time or len(times) < min_runs) and len(times) < max_runs:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        if inspect.isawaitable(result):
+            await result
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+    times.sort()
+    return {
+        "runs": len(times),
+        "mean_ms": total / len(times) * 1000,
+        "p50_ms": times[len(times) // 2] * 1000,
+        "p99_ms": times[min(len(times) - 1, int(len(times) * 0.99))] * 1000,
+        "min_ms": times[0] * 1000,
+    }
+
+
+def mock_session():
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import Message
+
+    class MockSession(BaseSession):
+        """Отвечает на любой вызов Bot API без сети."""
+
+        async def make_request(self, bot, method, timeout=None):
+            if type(method).__name__.startswith(("Send", "Edit")):
+                # Как и настоящая сессия, привязывает ответ к боту: у него можно вызывать edit_text и т.п.
+                return Message.model_validate({"message_id": 1, "date": 0, "text": "ok",
+                                               "chat": {"id": getattr(method, "chat_id", 0) or 0, "type": "private"}},
+                                              context={"bot": bot})
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    return MockSession()
+
+
+def callback_update(update_id: int, user_id: int, data: str):
+    from aiogram.types import Update
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "bench"},
+        "message": {"message_id": 1, "date": 0, "text": "menu", "chat": {"id": user_id, "type": "private"}},
+    }})
+
+
+def callback_cases(y: int, m: int, d: int) -> list[str]:
+    """По одному callback_data на каждый тип кнопки."""
+    from callbacks import (
+        NavYear, SelMonth, NavDays, PageWeek, ViewMonth, MonthChart, BackMonths, SelDay,
+        DelNavYear, DelSelMonth, DelNavDays, DelBackMonths, DelSelDay,
+        ExportScope, ExportYear, ExportMonth, ExportMake, StatsView,
+    )
+    return [
+        "button_list_notes", NavYear(year=y, direction="prev").pack(), SelMonth(year=y, month=m).pack(),
+        NavDays(year=y, month=m, page=0).pack(), PageWeek(year=y, month=m, page=0).pack(),
+        ViewMonth(year=y, month=m).pack(), MonthChart(year=y, month=m).pack(), BackMonths(year=y).pack(),
+        SelDay(year=y, month=m, day=d).pack(),
+        "noop", "button_main_menu", "export_open_filter", ExportScope(scope="year").pack(), "export_back_root",
+        ExportYear(year=y).pack(), "export_back_years", ExportMonth(year=y, month=m).pack(),
+        ExportMake(fmt="txt", scope="month", year=y, month=m).pack(),
+        ExportMake(fmt="pdf", scope="month", year=y, month=m).pack(),
+        ExportMake(fmt="png", scope="month", year=y, month=m).pack(), "export_cancel",
+        "button_delete_note", DelNavYear(year=y, direction="prev").pack(), DelSelMonth(year=y, month=m).pack(),
+        DelNavDays(year=y, month=m, page=0).pack(), DelBackMonths(year=y).pack(),
+        DelSelDay(year=y, month=m, day=d).pack(), "button_cancel",
+        "button_stats", StatsView(year=y).pack(), StatsView(year=y, month=m).pack(), "bogus:1",
+    ]
+
+
+async def run_suite(sizes: list[int], min_time: float) -> list[dict]:
+    import bot as app
+    import database
+    import keyboards
+    from database import get_notes, get_stats, search_notes
+    from export import export_lines, month_chart_drawing, render_pdf, render_txt
+    from keyboards import kb_days, kb_year_months
+
+    app.bot.session = mock_session()
+    results = []
+
+    async def case(name: str, size: int, fn, setup=None):
+        stats = await measure(fn, min_time, setup)
+        results.append({"name": name, "notes": size, **stats})
+        print(f"{name:<40} notes={size:<7} p50={stats['p50_ms']:9.3f}ms p99={stats['p99_ms']:9.3f}ms runs={stats['runs']}")
+
+    header = ["Экспорт заметок", "=================", ""]
+    update_id = 0
+    for size in sizes:
+        user_id = size
+        structure, years = await app.calendar_structure(user_id)
+        # Самый заполненный месяц последнего года и его самый заполненный день
+        y = years[-1]
+        m = max(structure[y], key=lambda month: sum(structure[y][month].values()))
+        d = max(structure[y][m], key=structure[y][m].get)
+        days = app.available_days(structure, y, m)
+        month_notes = await app.get_notes_between(user_id, *app.scope_bounds('month', y, m))
+        all_notes = await get_notes(user_id)
+
+        await case("calendar_structure", size, lambda: app.calendar_structure(user_id))
+        await case("notes_for_days(page)", size, lambda: app.notes_for_days(user_id, y, m, app.slice_days(days, 0)))
+        await case("format_notes_for_days(month)", size, lambda: app.format_notes_for_days(month_notes))
+        await case("paginate_notes(month)", size, lambda: app.paginate_notes(month_notes))
+        month_view = app.paginate_notes(month_notes)
+        await case("month_page_text", size, lambda: app.month_page_text(month_view, len(month_view.pages) - 2))
+        await case("days_text(page)", size, lambda: app.days_text(month_view, app.slice_days(days, 0)))
+        await case("render_txt(all)", size, lambda: render_txt(export_lines(header, all_notes)))
+        await case("render_txt(month)", size, lambda: render_txt(export_lines(header, month_notes)))
+        await case("render_pdf(month)", size, lambda: render_pdf(export_lines(header, month_notes)))
+        await case("month_chart_drawing", size, lambda: month_chart_drawing("bench", y, m, month_notes))
+        if size <= PDF_ALL_LIMIT:
+            await case("render_pdf(all)", size, lambda: render_pdf(export_lines(header, all_notes)))
+        # Без кэша готовой статистики: меряется чтение агрегатов
+        await case("get_stats(all)", size, lambda: get_stats(user_id), database._stats_cache.clear)
+        await case("get_stats(year)", size, lambda: get_stats(user_id, y), database._stats_cache.clear)
+        await case("search_notes(word)", size, lambda: search_notes(user_id, ("таблет",)))
+        await case("search_notes(filters)", size, lambda: search_notes(user_id, (), 7, 10, *app.scope_bounds('year', y)))
+        # Без кэша клавиатур — построение разметки, с кэшем — повторный клик
+        await case("kb_year_months(cold)", size, lambda: kb_year_months(y, app.available_months(structure, y), True, True),
+                   keyboards._kb_year_months.cache_clear)
+        await case("kb_year_months", size, lambda: kb_year_months(y, app.available_months(structure, y), True, True))
+        await case("kb_days(cold)", size, lambda: kb_days(y, m, app.slice_days(days, 0), 0, app.total_day_pages(days)),
+                   keyboards._kb_days.cache_clear)
+        await case("kb_days", size, lambda: kb_days(y, m, app.slice_days(days, 0), 0, app.total_day_pages(days)))
+
+        for data in callback_cases(y, m, d):
+            async def dispatch(data=data):
+                nonlocal update_id
+                update_id += 1
+                await app.dp.feed_update(app.bot, callback_update(update_id, user_id, data))
+            # Экспорт меряется без кэша готовых файлов, иначе после первого прогона это поиск в словаре
+            prefix, _, rest = data.partition(":")
+            setup = None
+            if prefix in ("export_make", "month_chart"):
+                if prefix == "export_make":
+                    prefix += ":" + rest.split(":")[0]
+                setup = app.export_cache.clear
+            elif prefix == "stats":
+                prefix += ":" + ("month" if ":" in rest else "year")
+            await case(f"handle_callback[{prefix}]", size, dispatch, setup)
+    return results
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], r["notes"]): r for r in json.load(f)["results"]}
+    print(f"\nСравнение p50 с {baseline_path} (порог {threshold:.2f}x):")
+    regressions = 0
+    for r in results:
+        old = baseline.get((r["name"], r["notes"]))
+        if old is None or not old["p50_ms"]:
+            continue
+        ratio = r["p50_ms"] / old["p50_ms"]
+        mark = "  REGRESSION" if ratio > threshold else ""
+        regressions += bool(mark)
+        if mark or ratio < 1 / threshold:
+            print(f"{r['name']:<40} notes={r['notes']:<7} {old['p50_ms']:9.3f} -> {r['p50_ms']:9.3f}ms ({ratio:.2f}x){mark}")
+    print(f"Регрессий: {regressions}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="число заметок у пользователей")
+    parser.add_argument("--min-time", type=float, default=0.3, help="минимальное время замера одного случая, с")
+    parser.add_argument("--out", default=None, help="куда записать JSON (по умолчанию benchmarks/results-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="JSON с результатами другого коммита")
+    parser.add_argument("--threshold", type=float, default=1.2, help="во сколько раз медленнее считается регрессией")
+    args = parser.parse_args()
+
+    commit = git_commit()
+    out = Path(args.out or ROOT / "benchmarks" / f"results-{commit}.json").resolve()
+    tmp = tempfile.mkdtemp(prefix="bench-suite-")
+    os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:BENCHMARK")
+    seed_db(os.path.join(tmp, "notes.db"), {size: size for size in args.sizes})
+    os.chdir(tmp)
+    # Логи бота — в logfile.log временного каталога, как при запуске bot.py
+    logging.basicConfig(level=logging.INFO, filename="logfile.log", filemode="w",
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    results = asyncio.run(run_suite(args.sizes, args.min_time))
+    report = {
+        "commit": commit,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sizes": args.sizes,
+        "min_time": args.min_time,
+        "results": results,
+    }
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"\nРезультаты: {out}")
+    if args.compare:
+        sys.exit(1 if compare(results, args.compare, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
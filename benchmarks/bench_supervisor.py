@@ -0,0 +1,98 @@
+"""Пропускная способность supervisor.py при разном числе воркеров на синтетической нагрузке:
+пользователи листают "Весь месяц" (чтение из SQLite + форматирование), Bot API — заглушка.
+Перед замером — экспорт TXT от каждого пользователя: рендер идёт в пуле процессов внутри воркера.
+
+Запуск: python benchmarks/bench_supervisor.py [--workers 1 2 4] [--users 64] [--updates 2000]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import random
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_bot_api import FakeBotAPI, callback_update  # noqa: E402
+
+
+def seed(path: str, users: int, per_user: int, year: int, month: int):
+    os.environ["NOTES_DB_PATH"] = path
+    import database
+    asyncio.run(database.init_db())
+    database.close_db()
+    rnd = random.Random(42)
+    conn = sqlite3.connect(path)
+    for user_id in range(1, users + 1):
+        for _ in range(per_user):
+            dt = f"{rnd.randint(1, 28):02d}.{month:02d}.{year} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}"
+            conn.execute("INSERT INTO notes (user_id, strength, text, datetime, ts) VALUES (?, ?, ?, ?, ?)",
+                         (user_id, rnd.randint(1, 10), "синтетическая запись", dt, database.legacy_to_ts(dt)))
+    database.rebuild_derived(conn)
+    conn.commit()
+    conn.close()
+
+
+async def run(workers: int, db_path: str, users: int, updates: int, year: int, month: int,
+              port: int) -> tuple[float, float]:
+    api = FakeBotAPI(port=port)
+    await api.start()
+    env = dict(os.environ, TELEGRAM_API_TOKEN="1:bench", TELEGRAM_API_SERVER=api.base,
+               NOTES_DB_PATH=db_path, BOT_WORKERS=str(workers), BOT_MODE="polling",
+               # Меряется обработка, а не лимиты Telegram из outbound.py
+               OUTBOUND_GLOBAL_RATE="1000000", OUTBOUND_GLOBAL_BURST="1000000",
+               OUTBOUND_CHAT_RATE="1000000", OUTBOUND_CHAT_BURST="1000000")
+    proc = subprocess.Popen([sys.executable, str(ROOT / "supervisor.py")], env=env,
+                            cwd=os.path.dirname(db_path), stdout=subprocess.DEVNULL)
+    try:
+        # Прогрев: по одному обновлению на пользователя, чтобы воркеры импортировали бота
+        api.push(*(callback_update(i, i, f"view_month:{year}:{month}") for i in range(1, users + 1)))
+        await api.wait_calls("answerCallbackQuery", users)
+        # Экспорт: пул процессов экспорта заводится в каждом воркере
+        started = time.perf_counter()
+        api.push(*(callback_update(users + i, i, "export_txt") for i in range(1, users + 1)))
+        await api.wait_calls("sendDocument", users, timeout=60)
+        await api.wait_calls("answerCallbackQuery", 2 * users)
+        export_time = time.perf_counter() - started
+        base = api.calls["answerCallbackQuery"]
+        rnd = random.Random(1)
+        batch = [callback_update(2 * users + 1 + i, rnd.randint(1, users), f"view_month:{year}:{month}")
+                 for i in range(updates)]
+        started = time.perf_counter()
+        api.push(*batch)
+        await api.wait_calls("answerCallbackQuery", base + updates)
+        return updates / (time.perf_counter() - started), export_time
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(30)
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=64)
+    parser.add_argument("--notes", type=int, default=60, help="записей в месяце у каждого пользователя")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    today = datetime.date.today()
+    print(f"CPU: {os.cpu_count()}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "notes.db")
+        seed(db_path, args.users, args.notes, today.year, today.month)
+        for workers in args.workers:
+            rate, export_time = asyncio.run(run(workers, db_path, args.users, args.updates, today.year, today.month,
+                                                args.port))
+            print(f"workers={workers}: {rate:.0f} updates/s, экспорт TXT ×{args.users} за {export_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
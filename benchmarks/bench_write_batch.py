@@ -0,0 +1,135 @@
+"""Запись заметок под одновременной нагрузкой через настоящие обработчики (process_text,
+process_get_note_id): отдельная транзакция на каждую запись против групповой записи database.py.
+
+Каждый пользователь в цикле добавляет заметку (FSM: кнопка, сила, текст) и через раз удаляет
+последнюю (выбор дня, id). Bot API — заглушка сессии, БД — временная.
+
+Запуск: python benchmarks/bench_write_batch.py [--users 200] [--rounds 10]
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_bot_api import callback_update, message_update  # noqa: E402
+from synthetic import seed_db  # noqa: E402
+
+# (название, WRITE_BATCH_MAX, окно в мс, synchronous)
+MODES = [
+    ("транзакция на запись, NORMAL", 1, 0, "NORMAL"),
+    ("транзакция на запись, FULL", 1, 0, "FULL"),
+    ("групповая запись, NORMAL", 256, 2, "NORMAL"),
+    ("групповая запись, FULL", 256, 2, "FULL"),
+]
+
+
+def mode_db_path(tmp: str, index: int) -> str:
+    return os.path.join(tmp, f"notes-{index}.db")
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def run_mode(app, users: int, rounds: int) -> dict:
+    from callbacks import DelSelDay
+    from database import NOTES_TZ
+
+    update_ids = itertools.count(1)
+    latencies = {"process_text": [], "process_get_note_id": []}
+    writes = 0
+
+    async def feed(update: dict, kind: str | None = None):
+        update["update_id"] = next(update_ids)
+        started = time.perf_counter()
+        await app.dp.feed_raw_update(app.bot, update)
+        if kind is not None:
+            latencies[kind].append(time.perf_counter() - started)
+
+    async def user(user_id: int):
+        nonlocal writes
+        for i in range(rounds):
+            await feed(callback_update(0, user_id, "button_new_note"))
+            await feed(message_update(0, user_id, str(i % 10 + 1)))
+            await feed(message_update(0, user_id, "синтетическая запись"), "process_text")
+            writes += 1
+            if i % 2:
+                today = datetime.datetime.now(NOTES_TZ)
+                await feed(callback_update(0, user_id, DelSelDay(year=today.year, month=today.month, day=today.day).pack()))
+                note_id = app.last_note_ids.get(user_id, 0)
+                await feed(message_update(0, user_id, str(note_id)), "process_get_note_id")
+                writes += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(1, users + 1)))
+    elapsed = time.perf_counter() - started
+    return {"writes_per_s": writes / elapsed, **{f"{kind}_p50": percentile(v, 0.5) for kind, v in latencies.items()},
+            **{f"{kind}_p99": percentile(v, 0.99) for kind, v in latencies.items()}}
+
+
+async def main_async(args, tmp: str):
+    import bot as app
+    import database
+    from bench_suite import mock_session
+
+    app.bot.session = mock_session()
+    # id последней заметки пользователя для сценария удаления
+    app.last_note_ids = {}
+    add_note = database.add_note
+
+    async def tracking_add_note(user_id, strength, text, datetime):
+        note_id = await add_note(user_id, strength, text, datetime)
+        app.last_note_ids[user_id] = note_id
+        return note_id
+
+    app.add_note = tracking_add_note
+    # Прогрев (импорты, кэши aiogram) на отдельной БД, чтобы первый режим не был в проигрыше
+    database.close_db()
+    database.DB_PATH = mode_db_path(tmp, len(MODES))
+    await run_mode(app, args.users, 2)
+    print(f"{'режим':<32} {'записей/с':>10} {'text p50':>9} {'text p99':>9} {'del p50':>9} {'del p99':>9}  (ms)")
+    try:
+        for index, (name, batch_max, window_ms, synchronous) in enumerate(MODES):
+            database.close_db()
+            database.DB_PATH = mode_db_path(tmp, index)
+            database.WRITE_BATCH_MAX = batch_max
+            database.WRITE_BATCH_WINDOW = window_ms / 1000
+            database.DB_SYNCHRONOUS = synchronous
+            r = await run_mode(app, args.users, args.rounds)
+            print(f"{name:<32} {r['writes_per_s']:>10.0f} {r['process_text_p50']:>9.1f} {r['process_text_p99']:>9.1f} "
+                  f"{r['process_get_note_id_p50']:>9.1f} {r['process_get_note_id_p99']:>9.1f}")
+    finally:
+        app.shutdown_export_pool()
+        database.close_db()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200, help="одновременных пользователей")
+    parser.add_argument("--rounds", type=int, default=10, help="заметок на пользователя")
+    parser.add_argument("--dir", default=None, help="каталог для БД (по умолчанию временный; fsync зависит от ФС)")
+    args = parser.parse_args()
+    tmp = tempfile.mkdtemp(prefix="bench-write-", dir=args.dir)
+    os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:BENCHMARK")
+    # Отдельная пустая БД на каждый режим
+    for index in range(len(MODES) + 1):
+        seed_db(mode_db_path(tmp, index), {})
+    os.chdir(tmp)
+    # Логи бота — в logfile.log временного каталога, как при запуске bot.py
+    logging.basicConfig(level=logging.INFO, filename="logfile.log", filemode="w",
+                        format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main_async(args, tmp))
+
+
+if __name__ == "__main__":
+    main()
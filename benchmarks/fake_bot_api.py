@@ -0,0 +1,128 @@
+"""Заглушка Telegram Bot API на aiohttp для нагрузочных тестов.
+
+getUpdates раздаёт заранее поставленные в очередь обновления, send*/edit*
+возвращают сообщение, остальные методы — True. Бот подключается к ней через
+TELEGRAM_API_SERVER=http://127.0.0.1:<port>.
+
+С chat_limit/global_limit заглушка, как настоящий Bot API, отвечает 429 с
+retry_after, если за последнюю секунду в чат (или всего) ушло больше сообщений.
+"""
+import asyncio
+import time
+from collections import Counter, defaultdict, deque
+
+from aiohttp import web
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": str(user_id), "data": data,
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "message": {
+                "message_id": 1, "date": int(time.time()), "text": "menu",
+                "chat": {"id": user_id, "type": "private"},
+            },
+        },
+    }
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081,
+                 chat_limit: int | None = None, global_limit: int | None = None):
+        self.host = host
+        self.port = port
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.calls: Counter[str] = Counter()
+        self.flood_errors = 0
+        self._sent: defaultdict[str, deque] = defaultdict(deque)
+        self._updates: list[dict] = []
+        self._has_updates = asyncio.Event()
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def push(self, *updates: dict):
+        self._updates.extend(updates)
+        self._has_updates.set()
+
+    async def wait_calls(self, method: str, count: int, timeout: float = 120):
+        """Ждёт, пока метод будет вызван count раз (например, answerCallbackQuery)."""
+        deadline = time.monotonic() + timeout
+        while self.calls[method] < count:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{method}: {self.calls[method]}/{count}")
+            await asyncio.sleep(0.01)
+
+    async def _get_updates(self, form) -> list[dict]:
+        offset = int(form.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._has_updates.clear()
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), min(float(form.get("timeout") or 0), 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+    def _flooded(self, key: str, limit: int | None) -> bool:
+        if limit is None:
+            return False
+        now = time.monotonic()
+        window = self._sent[key]
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if len(window) >= limit:
+            return True
+        window.append(now)
+        return False
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        form = await request.post()
+        if method != "getUpdates":
+            # Как у Telegram: лимит на чат не касается правок сообщений
+            chat_id = form.get("chat_id") if not method.startswith("edit") else None
+            if (chat_id and self._flooded(f"chat:{chat_id}", self.chat_limit)) or self._flooded("*", self.global_limit):
+                self.flood_errors += 1
+                return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                          "parameters": {"retry_after": 1}})
+        self.calls[method] += 1
+        if method == "getUpdates":
+            result = await self._get_updates(form)
+        elif method.startswith(("send", "edit")):
+            chat_id = int(form.get("chat_id") or 0)
+            result = {"message_id": 1, "date": int(time.time()), "text": "ok",
+                      "chat": {"id": chat_id, "type": "private"}}
+        elif method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,237 @@
+"""Нагрузочный генератор: последовательности обновлений Telegram от множества
+пользователей подаются в настоящий Dispatcher (dp.feed_update) с заданной частотой,
+Bot API — заглушка сессии, сети нет.
+
+Сценарии пользователя: /start, новая запись (FSM), просмотр год/месяц/день,
+удаление, экспорт. Поток можно записать в JSONL (--record) и воспроизвести (--replay).
+Нагрузка открытая: обновления приходят по расписанию независимо от скорости
+обработки; обновления одного пользователя обрабатываются по порядку, время ожидания
+своей очереди входит в задержку.
+
+Отчёт: пропускная способность, перцентили задержки по типам обновлений, лаг event loop.
+Несколько значений --rates дают ступенчатый прогон до точки, где бот не справляется.
+
+Запуск:
+    python benchmarks/load_replay.py --users 200 --rates 50 100 200 400 --duration 10
+    python benchmarks/load_replay.py --users 50 --rates 100 --record flow.jsonl
+    python benchmarks/load_replay.py --replay flow.jsonl --rates 300
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from fake_bot_api import callback_update, message_update  # noqa: E402
+from synthetic import COMMENTS, seed_db  # noqa: E402
+
+# Подставляется id последней записи пользователя в момент отправки
+NOTE_ID = "$NOTE_ID"
+
+
+def user_script(user_id: int, days: list[tuple[int, int, int]], rnd: random.Random):
+    """Бесконечная последовательность (тип, update без update_id) одного пользователя."""
+    from callbacks import (
+        NavYear, SelMonth, NavDays, ViewMonth, BackMonths, SelDay,
+        DelSelMonth, DelSelDay, ExportScope, ExportYear, ExportMake,
+    )
+
+    def cb(data: str):
+        return "callback:" + data.split(":")[0], callback_update(0, user_id, data)
+
+    def msg(kind: str, text: str):
+        return "message:" + kind, message_update(0, user_id, text)
+
+    flows = {
+        "start": lambda y, m, d: [msg("/start", "/start")],
+        "new_note": lambda y, m, d: [cb("button_new_note"), msg("strength", str(rnd.randint(1, 10))),
+                                     msg("text", rnd.choice(COMMENTS) or "без комментария")],
+        "browse": lambda y, m, d: [cb("button_list_notes"), cb(NavYear(year=y, direction="prev").pack()),
+                                   cb(SelMonth(year=y, month=m).pack()), cb(NavDays(year=y, month=m, page=0).pack()),
+                                   cb(ViewMonth(year=y, month=m).pack()), cb(SelDay(year=y, month=m, day=d).pack()),
+                                   cb(BackMonths(year=y).pack()), cb("button_main_menu")],
+        "delete": lambda y, m, d: [cb("button_delete_note"), cb(DelSelMonth(year=y, month=m).pack()),
+                                   cb(DelSelDay(year=y, month=m, day=d).pack()), msg("note_id", NOTE_ID)],
+        "export": lambda y, m, d: [cb("export_open_filter"), cb(ExportScope(scope="year").pack()),
+                                   cb(ExportYear(year=y).pack()), cb(ExportMake(fmt="txt", scope="year", year=y).pack())],
+    }
+    # Просмотр встречается чаще всего, экспорт и удаление — реже
+    names, weights = zip(("start", 1), ("new_note", 3), ("browse", 8), ("delete", 1), ("export", 1))
+    yield from flows["start"](*rnd.choice(days))
+    while True:
+        yield from flows[rnd.choices(names, weights)[0]](*rnd.choice(days))
+
+
+def generated_stream(users: dict[int, list], seed: int):
+    """Поток (user_id, тип, update): пользователи по очереди делают следующий шаг своего сценария."""
+    rnd = random.Random(seed)
+    scripts = {user_id: user_script(user_id, days, random.Random(rnd.random())) for user_id, days in users.items()}
+    order = list(scripts)
+    while True:
+        rnd.shuffle(order)
+        for user_id in order:
+            kind, update = next(scripts[user_id])
+            yield user_id, kind, update
+
+
+def replay_stream(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                update = record["update"]
+                event = update.get("message") or update.get("callback_query")
+                yield event["from"]["id"], record.get("kind", "update"), update
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(len(values) * q))] * 1000 if values else 0.0
+
+
+async def loop_lag_probe(stop: asyncio.Event, samples: list, interval: float = 0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def run_stage(app, stream, rate: float, duration: float, db_path: str, record=None, update_ids=itertools.count(1)):
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    locks = defaultdict(asyncio.Lock)
+    lag = []
+    stop = asyncio.Event()
+    probe = asyncio.create_task(loop_lag_probe(stop, lag))
+    conn = sqlite3.connect(db_path)
+    tasks = set()
+
+    async def deliver(user_id: int, kind: str, update: dict, arrived: float):
+        async with locks[user_id]:
+            message = update.get("message")
+            if message and message.get("text") == NOTE_ID:
+                row = conn.execute("SELECT max(id) FROM notes WHERE user_id = ?", (user_id,)).fetchone()
+                message["text"] = str(row[0] or 0)
+            try:
+                await app.dp.feed_raw_update(app.bot, update)
+            except Exception:
+                errors[kind] += 1
+            latencies[kind].append(time.perf_counter() - arrived)
+
+    started = time.perf_counter()
+    sent = 0
+    # Открытая нагрузка: i-е обновление приходит в started + i / rate
+    while (now := time.perf_counter()) - started < duration:
+        due = started + sent / rate
+        if due > now:
+            await asyncio.sleep(due - now)
+        user_id, kind, update = next(stream, (None, None, None))
+        if user_id is None:
+            break
+        update = json.loads(json.dumps(update))
+        update["update_id"] = next(update_ids)
+        if record is not None:
+            record.write(json.dumps({"kind": kind, "update": update}, ensure_ascii=False) + "\n")
+        task = asyncio.create_task(deliver(user_id, kind, update, due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        sent += 1
+    offered = time.perf_counter() - started
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe
+    conn.close()
+
+    total = [v for values in latencies.values() for v in values]
+    total.sort()
+    lag.sort()
+    print(f"\n=== rate={rate:.0f}/s: отправлено {sent} за {offered:.1f}s, обработано за {elapsed:.1f}s, "
+          f"пропускная способность {sent / elapsed:.0f}/s, ошибок {sum(errors.values())}")
+    print(f"{'тип':<28} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for kind in sorted(latencies):
+        values = sorted(latencies[kind])
+        print(f"{kind:<28} {len(values):>6} {percentile(values, 0.5):>9.1f} {percentile(values, 0.95):>9.1f} "
+              f"{percentile(values, 0.99):>9.1f} {values[-1] * 1000:>9.1f}" + (f"  ошибок {errors[kind]}" if errors[kind] else ""))
+    print(f"{'ВСЕ':<28} {len(total):>6} {percentile(total, 0.5):>9.1f} {percentile(total, 0.95):>9.1f} "
+          f"{percentile(total, 0.99):>9.1f} {(total[-1] if total else 0) * 1000:>9.1f}")
+    print(f"лаг event loop: p50={percentile(lag, 0.5):.1f}ms p99={percentile(lag, 0.99):.1f}ms max={percentile(lag, 1):.1f}ms")
+    return {"rate": rate, "sent": sent, "throughput": sent / elapsed, "p99_ms": percentile(total, 0.99),
+            "errors": sum(errors.values())}
+
+
+def user_days(db_path: str, user_ids) -> dict[int, list]:
+    conn = sqlite3.connect(db_path)
+    days = {user_id: conn.execute("SELECT year, month, day FROM note_days WHERE user_id = ?", (user_id,)).fetchall()
+            for user_id in user_ids}
+    conn.close()
+    return days
+
+
+async def main_async(args, db_path: str):
+    import bot as app
+    from bench_suite import mock_session
+
+    app.bot.session = mock_session()
+    if args.with_outbound:
+        app.bot.session.middleware(app.outbound)
+    await app.init_db()
+
+    if args.replay:
+        stream = replay_stream(args.replay)
+    else:
+        stream = generated_stream(user_days(db_path, range(1, args.users + 1)), args.seed)
+    record = open(args.record, "w", encoding="utf-8") if args.record else None
+    summary = []
+    try:
+        for rate in args.rates:
+            summary.append(await run_stage(app, stream, rate, args.duration, db_path, record))
+    finally:
+        if record is not None:
+            record.close()
+        app.shutdown_export_pool()
+        app.close_db()
+
+    print(f"\n{'rate':>8} {'throughput':>11} {'p99 ms':>9}  итог (SLO p99 <= {args.slo_ms:.0f}ms)")
+    for stage in summary:
+        ok = stage["p99_ms"] <= args.slo_ms and stage["throughput"] >= 0.9 * stage["rate"] and not stage["errors"]
+        print(f"{stage['rate']:>8.0f} {stage['throughput']:>11.0f} {stage['p99_ms']:>9.1f}  {'ok' if ok else 'ПЕРЕГРУЗКА'}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200, help="число симулируемых пользователей")
+    parser.add_argument("--notes", type=int, default=200, help="заметок у каждого пользователя в начальной БД")
+    parser.add_argument("--rates", type=float, nargs="+", default=[50, 100, 200], help="обновлений в секунду по ступеням")
+    parser.add_argument("--duration", type=float, default=10, help="длительность ступени, с")
+    parser.add_argument("--slo-ms", type=float, default=500, help="допустимый p99 задержки")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record", help="записать сгенерированные обновления в JSONL")
+    parser.add_argument("--replay", help="воспроизвести обновления из JSONL вместо генерации")
+    parser.add_argument("--with-outbound", action="store_true",
+                        help="пропускать вызовы Bot API через планировщик лимитов (outbound.py)")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="load-replay-")
+    db_path = os.path.join(tmp, "notes.db")
+    os.environ.setdefault("TELEGRAM_API_TOKEN", "123456:LOADTEST")
+    seed_db(db_path, {user_id: args.notes for user_id in range(1, args.users + 1)})
+    os.chdir(tmp)
+    # Логи бота — в logfile.log временного каталога, как при запуске bot.py
+    logging.basicConfig(level=logging.INFO, filename="logfile.log", filemode="w",
+                        format="%(asctime)s %(levelname)s %(message)s")
+    asyncio.run(main_async(args, db_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""Синтетические данные для бенчмарков: пользователи с заданным числом заметок
+в отдельной временной БД (рабочий notes.db не трогается)."""
+import asyncio
+import os
+import random
+import sqlite3
+
+COMMENTS = ["утро, после сна", "вечер мигрень", "давящая боль в висках", "после работы за компьютером",
+            "аура, тошнота", "погода меняется", "приняла таблетку, отпустило через час", ""]
+
+
+def synthetic_rows(user_id: int, count: int, rnd: random.Random, years=(2015, 2025)):
+    import database
+    for _ in range(count):
+        dt = (f"{rnd.randint(1, 28):02d}.{rnd.randint(1, 12):02d}.{rnd.randint(*years)} "
+              f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}")
+        yield user_id, rnd.randint(1, 10), rnd.choice(COMMENTS), dt, database.legacy_to_ts(dt)
+
+
+def seed_db(path: str, users: dict[int, int], seed: int = 42):
+    """Создаёт БД со схемой бота и заметками: users = {user_id: число заметок}.
+    NOTES_DB_PATH указывает на path, поэтому импортируемый позже bot работает с этой БД."""
+    os.environ["NOTES_DB_PATH"] = path
+    import database
+    database.DB_PATH = path
+    asyncio.run(database.init_db())
+    database.close_db()
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    with conn:
+        for user_id, count in users.items():
+            conn.executemany("INSERT INTO notes (user_id, strength, text, datetime, ts) VALUES (?, ?, ?, ?, ?)",
+                             synthetic_rows(user_id, count, rnd))
+        database.rebuild_derived(conn)
+    conn.close()
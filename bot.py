@@ -1,42 +1,77 @@
 import asyncio
+import bisect
+import csv
 import logging
 import os
+import re
+import tempfile
+import time
 import datetime
+from typing import NamedTuple
 from pathlib import Path
 from dotenv import load_dotenv
-import tempfile
-from contextlib import contextmanager
-from aiogram import Bot, Dispatcher, types
-from aiogram.filters.command import Command
+from aiogram import Bot, Dispatcher, F, types
+from aiogram.filters.command import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+
+# Загрузка .env если есть (до импорта модулей проекта: они читают настройки при импорте)
+env_path = Path(__file__).parent / '.env'
+if env_path.exists():
+    load_dotenv(env_path)
+
 from keyboards import (
     keyboard_main,
     keyboard_cancel,
+    keyboard_reminder,
     kb_year_months,
     kb_days,
     kb_export_root,
     kb_export_years,
     kb_export_months,
-    kb_export_format
+    kb_export_format,
+    kb_stats,
+    kb_search,
+    kb_reminders,
+    keyboard_cache_stats
+)
+from callbacks import (
+    CallbackRouter,
+    NavYear, SelMonth, NavDays, PageWeek, ViewMonth, MonthChart, BackMonths, SelDay,
+    DelNavYear, DelSelMonth, DelNavDays, DelBackMonths, DelSelDay,
+    ExportScope, ExportYear, ExportMonth, ExportMake, StatsView, SearchPage, Remind
+)
+from export import HAS_REPORTLAB, HAS_RENDERPM, WEEKDAY_ABBR_RU, export_cache, run_export, run_month_chart, shutdown_export_pool
+from importer import IMPORT_MAX_BYTES, detect_format, import_file
+from search import SEARCH_PAGE_SIZE, has_conditions, parse_query
+from reminders import (
+    DAILY, FOLLOWUP, REMINDER_FOLLOWUP_HOURS, REMINDER_FOLLOWUP_STRENGTH, REMINDER_RATE, ReminderScheduler
 )
-from database import init_db, add_note, get_notes, delete_note
+from webhook import run_webhook
+from outbound import OutboundScheduler, OUTBOUND_GLOBAL_RATE
+from metrics import GaugeFunc, HandlerMetricsMiddleware, start_metrics_server
+from database import init_db, add_note, get_notes_between, get_calendar, get_stats, delete_note, search_notes, get_reminder_settings, delete_reminders, close_db, data_version, to_ts, DB_PATH, NOTES_TZ
 
-# Загрузка .env если есть
-env_path = Path(__file__).parent / '.env'
-if env_path.exists():
-    load_dotenv(env_path)
 BOT_TOKEN = os.getenv("TELEGRAM_API_TOKEN")
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Свой сервер Bot API (локальный telegram-bot-api или заглушка для нагрузочных тестов)
+TELEGRAM_API_SERVER = os.getenv("TELEGRAM_API_SERVER")
 offset_timezone = datetime.timezone(datetime.timedelta(hours=3), name='MSK') 
 
-# Включаем логирование, чтобы видеть сообщения в консоли
-logging.basicConfig(level=logging.INFO, filename="logfile.log",filemode="w",
-                    format="%(asctime)s %(levelname)s %(message)s")
-
 # Инициализация бота и диспетчера
 if not BOT_TOKEN:
     raise RuntimeError("Не найден TELEGRAM_API_TOKEN в переменных окружения или .env файле.")
-bot = Bot(token=BOT_TOKEN)
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_SERVER)) if TELEGRAM_API_SERVER else None
+bot = Bot(token=BOT_TOKEN, session=session)
+# Все исходящие вызовы идут через планировщик с учётом лимитов Telegram.
+# Под supervisor.py глобальный лимит делится между воркерами
+_workers = int(os.getenv("BOT_WORKERS", "1")) if os.getenv("BOT_WORKER_INDEX") else 1
+outbound = OutboundScheduler(global_rate=OUTBOUND_GLOBAL_RATE / _workers)
+bot.session.middleware(outbound)
 dp = Dispatcher()
 
 # Определяем состояния FSM
@@ -47,32 +82,46 @@ class AddNoteStates(StatesGroup):
 class DeleteNoteStates(StatesGroup):
     waiting_for_id = State()
 
+class ImportStates(StatesGroup):
+    waiting_for_file = State()
+
 # ================= Вспомогательные функции для навигации заметок ====================
 MONTH_NAMES_RU = [
     "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
     "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
 ]
-WEEKDAY_ABBR_RU = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-
-def _parse_note_datetime(dt_str: str) -> datetime.datetime:
-    """Парсит строку даты из БД формата '%d.%m.%Y %H:%M'."""
-    return datetime.datetime.strptime(dt_str, "%d.%m.%Y %H:%M")
 
-def group_notes_structure(user_id: int):
-    """Возвращает структуру: {year: {month: {day: [notes]}}} + отсортированные списки годов.
-    note: tuple(id, strength, text, datetime)
+async def calendar_structure(user_id: int):
+    """Возвращает календарный индекс {year: {month: {day: count}}} + отсортированный список годов.
+    Текст заметок при этом не читается.
     """
-    notes = get_notes(user_id)
-    structure = {}
-    for n in notes:
-        dt = _parse_note_datetime(n[3])
-        structure.setdefault(dt.year, {})\
-                 .setdefault(dt.month, {})\
-                 .setdefault(dt.day, [])\
-                 .append(n)
+    structure = await get_calendar(user_id)
     years = sorted(structure.keys())
     return structure, years
 
+async def notes_for_days(user_id: int, year: int, month: int, days: list[int]):
+    """Загружает записи выбранных дней одним диапазонным запросом.
+    days — срез отсортированного списка дней с записями, поэтому в промежутках записей нет.
+    note: database.Note
+    """
+    if not days:
+        return []
+    start = datetime.datetime(year, month, days[0], tzinfo=NOTES_TZ)
+    end = datetime.datetime(year, month, days[-1], tzinfo=NOTES_TZ) + datetime.timedelta(days=1)
+    return await get_notes_between(user_id, start, end)
+
+async def month_days(user_id: int, year: int, month: int) -> list[int]:
+    """Отсортированный список дней месяца, для которых есть записи (из календарного индекса)."""
+    structure = await get_calendar(user_id, year, month)
+    return available_days(structure, year, month)
+
+async def set_cursor(state: FSMContext, mode: str, year: int, month: int | None = None, page: int = 0):
+    """Сохраняет в FSM лёгкий курсор навигации (режим, год, месяц, страница) вместо снимка заметок."""
+    await state.update_data(cursor={"mode": mode, "year": year, "month": month, "page": page})
+
+async def get_cursor(state: FSMContext) -> dict:
+    return (await state.get_data()).get("cursor") or {}
+
 def available_months(structure, year: int):
     """Возвращает отсортированный список месяцев для года."""
     return sorted(structure.get(year, {}).keys())
@@ -96,40 +145,156 @@ def total_day_pages(days: list[int], page_size: int = 5) -> int:
 def month_title(month: int, year: int) -> str:
     return f"{MONTH_NAMES_RU[month-1]} {year}"
 
-def format_notes_for_days(structure, year: int, month: int, days: list[int]) -> str:
-    """Формирует текст заметок для выбранных дней (каждый день отдельно)."""
-    if not days:
+def format_note(note) -> str:
+    return (
+        f"---id:{note.id}---\n"
+        f"Дата: {note.dt:%d.%m.%Y %H:%M} ({WEEKDAY_ABBR_RU[note.weekday]})\n"
+        f"Сила боли: {note.strength}\n"
+        f"Комментарий: {note.text}\n"
+    )
+
+def format_notes_for_days(notes) -> str:
+    """Формирует текст заметок выбранных дней (notes уже отсортированы по времени)."""
+    if not notes:
         return "Нет записей."
-    parts = []
-    for d in days:
-        notes = structure[year][month][d]
-        for note in notes:
-            dt = _parse_note_datetime(note[3])
-            dow = WEEKDAY_ABBR_RU[dt.weekday()]
-            parts.append(
-                f"---id:{note[0]}---\n"
-                f"Дата: {dt.strftime('%d.%m.%Y %H:%M')} ({dow})\n"
-                f"Сила боли: {note[1]}\n"
-                f"Комментарий: {note[2]}\n"
-            )
-    return "".join(parts)
+    return "".join(format_note(note) for note in notes)
+
+# ================= Постраничный текст месяца ====================
+# Лимит Telegram на текст сообщения — 4096 UTF-16 единиц; запас оставлен под заголовок
+MESSAGE_LIMIT = 4096
+PAGE_TEXT_LIMIT = MESSAGE_LIMIT - 256
+MONTH_TEXT_CACHE_SIZE = 256
+
+class MonthText(NamedTuple):
+    """Текст всех заметок месяца, отформатированный один раз, и разметка по нему.
+    Страницы и диапазоны дней — срезы text по готовым смещениям."""
+    text: str
+    starts: list[int]                  # начало i-й заметки в text, последний элемент — len(text)
+    units: list[int]                   # то же в UTF-16 единицах (так длину считает Telegram)
+    days: dict[int, tuple[int, int]]   # день -> (первая заметка, последняя + 1)
+    pages: list[int]                   # заметки, с которых начинаются страницы; последний элемент — число заметок
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+def paginate_notes(notes, limit: int = PAGE_TEXT_LIMIT) -> MonthText:
+    """Форматирует заметки (по времени) и делит текст на страницы не длиннее limit по границам заметок."""
+    parts = [format_note(note) for note in notes]
+    starts, units = [0], [0]
+    days = {}
+    for i, (note, part) in enumerate(zip(notes, parts)):
+        starts.append(starts[-1] + len(part))
+        units.append(units[-1] + utf16_len(part))
+        first, _ = days.get(note.dt.day, (i, i))
+        days[note.dt.day] = (first, i + 1)
+    pages = [0]
+    for i in range(len(parts)):
+        if i > pages[-1] and units[i + 1] - units[pages[-1]] > limit:
+            pages.append(i)
+    pages.append(len(parts))
+    return MonthText("".join(parts), starts, units, days, pages)
+
+def clip_text(text: str, limit: int = PAGE_TEXT_LIMIT) -> str:
+    """Обрезает одну слишком длинную заметку, чтобы сообщение всё равно отправилось."""
+    encoded = text.encode("utf-16-le")
+    if len(encoded) <= limit * 2:
+        return text
+    # Разрезанная суррогатная пара отбрасывается при декодировании
+    return encoded[:(limit - 1) * 2].decode("utf-16-le", errors="ignore") + "…"
+
+def page_text(view: MonthText, pages: list[int], page: int) -> str:
+    first, end = pages[page], pages[page + 1]
+    return clip_text(view.text[view.starts[first]:view.starts[end]])
+
+def month_page_text(view: MonthText, page: int) -> str:
+    return page_text(view, view.pages, page)
+
+def day_pages(view: MonthText, days: list[int]) -> list[int]:
+    """Страницы текста среза дней в том же виде, что MonthText.pages (номера заметок view);
+    пустой список, если записей нет."""
+    spans = [view.days[d] for d in days if d in view.days]
+    if not spans:
+        return []
+    pages, end = [spans[0][0]], spans[-1][1]
+    while pages[-1] < end:
+        first = pages[-1]
+        fit = bisect.bisect_right(view.units, view.units[first] + PAGE_TEXT_LIMIT, first, end + 1) - 1
+        pages.append(max(fit, first + 1))
+    return pages
 
-def format_notes_for_day(structure, year: int, month: int, day: int) -> str:
+def days_text(view: MonthText, days: list[int]) -> str:
+    """Заметки среза дней. Если они не помещаются в сообщение, показывается начало
+    и сколько записей осталось (их можно пролистать в «Весь месяц»)."""
+    pages = day_pages(view, days)
+    if not pages:
+        return "Нет записей."
+    text = page_text(view, pages, 0)
+    if len(pages) > 2:
+        text += f"\n… ещё {pages[-1] - pages[1]} зап. — листайте «Весь месяц»"
+    return text
+
+_month_texts: dict[tuple, MonthText] = {}
+
+async def month_text(user_id: int, year: int, month: int) -> MonthText:
+    """Текст месяца из кэша; ключ включает версию данных, поэтому после записи месяц форматируется заново."""
+    key = (user_id, year, month, data_version(user_id))
+    view = _month_texts.get(key)
+    if view is None:
+        view = paginate_notes(await get_notes_between(user_id, *scope_bounds('month', year, month)))
+        if len(_month_texts) >= MONTH_TEXT_CACHE_SIZE:
+            _month_texts.pop(next(iter(_month_texts)))
+        _month_texts[key] = view
+    return view
+
+def format_notes_for_day(notes) -> str:
     """Формирует текст заметок для выбранного дня."""
-    if day not in structure.get(year, {}).get(month, {}):
+    if not notes:
         return "Нет записей."
     parts = []
-    notes = structure[year][month][day]
     for note in notes:
-        dt = _parse_note_datetime(note[3])
         parts.append(
-            f"---id:{note[0]}---\n"
-            f"Дата: {dt.strftime('%d.%m.%Y %H:%M')}\n"
-            f"Сила боли: {note[1]}\n"
-            f"Комментарий: {note[2]}\n"
+            f"---id:{note.id}---\n"
+            f"Дата: {note.dt:%d.%m.%Y %H:%M}\n"
+            f"Сила боли: {note.strength}\n"
+            f"Комментарий: {note.text}\n"
         )
     return "".join(parts)
 
+def format_stats(stats, year: int | None = None, month: int | None = None) -> str:
+    """Текст статистики (database.Stats) за всё время, год или месяц."""
+    if year is None:
+        title = "всё время"
+    elif month is None:
+        title = f"{year} год"
+    else:
+        title = month_title(month, year).lower()
+    lines = [f"Статистика за {title}", ""]
+    if stats.count:
+        lines.append(f"Записей: {stats.count}, дней с болью: {stats.days}")
+        lines.append(f"Сила боли: средняя {stats.avg_strength:.1f}, максимальная {stats.max_strength}")
+        if month is None and stats.months:
+            recent = stats.months[-12:]
+            lines += ["", "По месяцам" + (" (последние 12):" if len(stats.months) > 12 else ":")]
+            for y, m, count, avg, max_strength in recent:
+                lines.append(f"{month_title(m, y)}: {count} зап., средняя {avg:.1f}, макс. {max_strength}")
+        lines += ["", "По дням недели:", " · ".join(f"{WEEKDAY_ABBR_RU[i]} {c}" for i, c in enumerate(stats.weekdays))]
+    else:
+        lines.append("Нет записей.")
+    if stats.free_streak:
+        days, first, last = stats.free_streak
+        if days:
+            lines += ["", f"Дольше всего без боли: {days} дн. ({first:%d.%m.%Y} – {last:%d.%m.%Y})"]
+        else:
+            lines += ["", "Записи каждый день, без перерывов."]
+    return "\n".join(lines)
+
+async def stats_view(user_id: int, year: int | None = None, month: int | None = None):
+    """Текст и клавиатура статистики; читаются только агрегаты и календарный индекс."""
+    stats = await get_stats(user_id, year, month)
+    structure, years = await calendar_structure(user_id)
+    months = available_months(structure, year) if year is not None else None
+    return format_stats(stats, year, month), kb_stats(years, year, months, month)
+
 # ================= Конец вспомогательных функций ====================
 
 def fmt_date(y: int, m: int, d: int) -> str:
@@ -142,83 +307,49 @@ def fmt_date_dow(y: int, m: int, d: int) -> str:
     except Exception:
         return f"{d:02d}.{m:02d}.{y}"
 
-def export_notes_text(user_id: int) -> str:
-    notes = get_notes(user_id)
-    if not notes:
-        return "Нет записей."
-    lines = ["Экспорт заметок", "=================", ""]
-    for note in notes:
-        dt = _parse_note_datetime(note[3])
-        dow = WEEKDAY_ABBR_RU[dt.weekday()]
-        lines.append(f"ID: {note[0]}")
-        lines.append(f"Дата: {dt.strftime('%d.%m.%Y %H:%M')} ({dow})")
-        lines.append(f"Сила: {note[1]}")
-        lines.append(f"Комментарий: {note[2]}")
-        lines.append("")
-    return "\n".join(lines)
+def scope_bounds(scope: str, year: int | None = None, month: int | None = None):
+    """Границы [start, end) периода экспорта в NOTES_TZ или None для 'all'."""
+    if scope == 'year' and year:
+        return datetime.datetime(year, 1, 1, tzinfo=NOTES_TZ), datetime.datetime(year + 1, 1, 1, tzinfo=NOTES_TZ)
+    if scope == 'month' and year and month:
+        start = datetime.datetime(year, month, 1, tzinfo=NOTES_TZ)
+        end = datetime.datetime(year + month // 12, month % 12 + 1, 1, tzinfo=NOTES_TZ)
+        return start, end
+    return None
 
-def export_notes_filtered_text(user_id: int, scope: str, year: int | None = None, month: int | None = None) -> str:
-    notes = get_notes(user_id)
-    if not notes:
-        return "Нет записей."
-    filtered = []
-    for n in notes:
-        dt = _parse_note_datetime(n[3])
-        if scope == 'all':
-            filtered.append(n)
-        elif scope == 'year' and year == dt.year:
-            filtered.append(n)
-        elif scope == 'month' and year == dt.year and month == dt.month:
-            filtered.append(n)
-    if not filtered:
-        return "Нет записей."
-    lines = ["Экспорт заметок", f"Область: {scope} {year or ''} {month or ''}", "=================", ""]
-    for note in filtered:
-        dt = _parse_note_datetime(note[3])
-        dow = WEEKDAY_ABBR_RU[dt.weekday()]
-        lines.append(f"ID: {note[0]}")
-        lines.append(f"Дата: {dt.strftime('%d.%m.%Y %H:%M')} ({dow})")
-        lines.append(f"Сила: {note[1]}")
-        lines.append(f"Комментарий: {note[2]}")
-        lines.append("")
-    return "\n".join(lines)
+async def export_document(user_id: int, fmt: str, scope: str = 'all', year: int | None = None, month: int | None = None, with_scope: bool = True) -> bytes | None:
+    """Рендерит файл экспорта в пуле процессов; записи читаются там же потоком из БД. None — записей нет.
+    fmt 'png' — картинка месяца (только scope 'month').
+    Готовые файлы берутся из export_cache, пока данные пользователя не менялись."""
+    key = (user_id, fmt, scope, year, month, with_scope, data_version(user_id))
+    content = export_cache.get(key)
+    if content is not None:
+        return content
+    bounds = scope_bounds(scope, year, month)
+    if bounds is None and scope != 'all':
+        return None
+    start_ts, end_ts = (to_ts(bounds[0]), to_ts(bounds[1])) if bounds else (None, None)
+    if fmt == 'png':
+        title = f"{month_title(month, year)} — сила боли"
+        content = await run_month_chart(title, DB_PATH, user_id, year, month, start_ts, end_ts)
+    else:
+        header = ["Экспорт заметок"]
+        if with_scope:
+            header.append(f"Область: {scope} {year or ''} {month or ''}")
+        header += ["=================", ""]
+        content = await run_export(fmt, header, DB_PATH, user_id, start_ts, end_ts)
+    if content is None:
+        return None
+    export_cache.put(key, content)
+    logging.debug(f"Экспорт {fmt} user_id={user_id}: {len(content)} байт, кэш {export_cache.stats()}")
+    return content
 
-@contextmanager
-def tmp_file(suffix: str):
-    fd, path = tempfile.mkstemp(suffix=suffix)
-    os.close(fd)
-    try:
-        yield path
-    finally:
-        if os.path.exists(path):
-            os.remove(path)
-
-def find_cyr_font():
-    """Ищет ttf шрифт с поддержкой кириллицы среди типичных Windows шрифтов и локальной папки fonts/. 
-    Возвращает (name, path) или None."""
-    candidates_fixed = [
-        'C:/Windows/Fonts/arial.ttf',
-        'C:/Windows/Fonts/Arial.ttf',
-        'C:/Windows/Fonts/segoeui.ttf',
-        'C:/Windows/Fonts/tahoma.ttf',
-        'C:/Windows/Fonts/verdana.ttf',
-        'C:/Windows/Fonts/calibri.ttf',
-        'C:/Windows/Fonts/times.ttf',
-        'C:/Windows/Fonts/timesbd.ttf',
-        'C:/Windows/Fonts/DejaVuSans.ttf',
-        'C:/Windows/Fonts/DejaVuSansCondensed.ttf'
-    ]
-    fonts_dir = Path(__file__).parent / 'fonts'
-    dynamic = []
-    if fonts_dir.exists():
-        for p in fonts_dir.glob('*.ttf'):
-            dynamic.append(str(p))
-    for p in dynamic + candidates_fixed:
-        if os.path.exists(p):
-            # имя шрифта берём из имени файла без расширения, убирая пробелы
-            name = Path(p).stem.replace(' ', '_')
-            return name, p
-    return None
+def export_filename(fmt: str, scope: str = 'all', year: int | None = None, month: int | None = None) -> str:
+    if scope == 'year' and year:
+        return f'notes_{year}.{fmt}'
+    if scope == 'month' and year and month:
+        return f'notes_{year}_{month}.{fmt}'
+    return f'notes_export.{fmt}'
 
 # Хэндлер на команду /start
 @dp.message(Command("start"))
@@ -228,483 +359,623 @@ async def send_welcome(message: types.Message):
     """
     await message.answer("Привет! Я Мигребот. Помогаю вести дневник мигреней", reply_markup=keyboard_main)
 
-# Хэндлер на нажатие инлайн-кнопок
-@dp.callback_query()
-async def handle_callback(callback: types.CallbackQuery, state: FSMContext):
-    data = callback.data
-    user_id = callback.from_user.id
+# Хэндлер на команду /stats
+@dp.message(Command("stats"))
+async def send_stats(message: types.Message):
+    text, kb = await stats_view(message.from_user.id)
+    await message.answer(text, reply_markup=kb)
 
-    # Новая запись
-    if data == "button_new_note":
-        logging.debug(f"Нажата кнопка 'Новая запись' user_id={user_id}")
-        await callback.message.answer("Давайте добавим новую запись. \nНа сколько сильно болит голова по 10-балльной шкале?", reply_markup=keyboard_cancel)
-        await state.set_state(AddNoteStates.waiting_for_strength)
-        await callback.answer()
+# Таблица обработчиков инлайн-кнопок: callback_data -> обработчик
+callback_router = CallbackRouter()
+
+# Метрики: время обработчиков (для callback — по префиксу), размер данных FSM, состояние кэшей
+dp.callback_query.middleware(HandlerMetricsMiddleware("callback_query", lambda event, data: callback_router.label(event.data or "")))
+dp.message.middleware(HandlerMetricsMiddleware("message"))
+GaugeFunc("bot_export_cache", "Кэш готовых файлов экспорта", lambda: {(k,): v for k, v in export_cache.stats().items()}, ("stat",))
+GaugeFunc("bot_outbound", "Планировщик исходящих вызовов Bot API", lambda: {(k,): v for k, v in outbound.stats.items()}, ("stat",))
+GaugeFunc("bot_keyboard_cache", "Кэш клавиатур навигации", keyboard_cache_stats, ("keyboard", "stat"))
+GaugeFunc("bot_fsm_records", "Записей в хранилище FSM", lambda: {(): len(getattr(dp.storage, "storage", ()))})
+
+# ================= Импорт дневника из файла ====================
+# Сообщение о ходе импорта обновляется не чаще раза в столько секунд
+IMPORT_PROGRESS_INTERVAL = 2.0
+
+def format_import_report(report, done: bool = True) -> str:
+    text = (f"{'Импорт завершён' if done else 'Импорт…'}\n"
+            f"Прочитано записей: {report.read}\n"
+            f"Добавлено: {report.added}\n"
+            f"Уже были в дневнике: {report.duplicates}\n"
+            f"С ошибками: {report.invalid}")
+    if report.errors:
+        text += "\n\n" + "\n".join(report.errors)
+        if report.invalid > len(report.errors):
+            text += "\n…"
+    return text
+
+@dp.message(Command("import"))
+async def start_import(message: types.Message, state: FSMContext):
+    await state.set_state(ImportStates.waiting_for_file)
+    await message.answer("Пришлите файл с записями документом:\n"
+                         "• TXT — в формате экспорта бота;\n"
+                         "• CSV — столбцы дата, сила, комментарий (datetime, strength, text);\n"
+                         "• JSON — массив объектов с теми же полями или JSON Lines.\n"
+                         "Дата: дд.мм.гггг чч:мм или ISO 8601, сила — от 1 до 10. Совпадающие записи не дублируются.",
+                         reply_markup=keyboard_cancel)
+
+@dp.message(ImportStates.waiting_for_file, F.document)
+async def process_import_file(message: types.Message, state: FSMContext):
+    document = message.document
+    fmt = detect_format(document.file_name or "")
+    if fmt is None:
+        await message.reply("Поддерживаются файлы .txt, .csv, .json и .jsonl.")
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_BYTES:
+        await message.reply(f"Файл больше {IMPORT_MAX_BYTES // (1024 * 1024)} МБ.")
         return
+    await state.clear()
+    user_id = message.from_user.id
+    status = await message.answer("Импорт: загрузка файла…")
+    last_update = time.monotonic()
 
-    # Просмотр записей: выбор года/месяца
-    if data == "button_list_notes":
-        logging.debug(f"Нажата кнопка 'Посмотреть записи' user_id={user_id}")
-        structure, years = group_notes_structure(user_id)
-        if not years:
-            await callback.message.answer("У вас пока нет ни одной записи.")
-            await callback.answer()
+    async def progress(report):
+        nonlocal last_update
+        if time.monotonic() - last_update >= IMPORT_PROGRESS_INTERVAL:
+            last_update = time.monotonic()
+            await status.edit_text(format_import_report(report, done=False))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "import." + fmt)
+        await bot.download(document, destination=path)
+        try:
+            report = await import_file(user_id, path, fmt, progress)
+        except UnicodeDecodeError:
+            await status.edit_text("Не удалось прочитать файл: нужна кодировка UTF-8.")
             return
-        # Берем последний (самый новый) год
-        current_year = years[-1]
-        months = available_months(structure, current_year)
-        has_prev = len(years) > 1 and current_year != years[0]
-        has_next = False  # так как выбран последний
-        if current_year != years[-1]:
-            has_next = True
-        await state.update_data(view_structure=structure, years=years, current_year=current_year)
-        await callback.message.answer(f"Год: {current_year}\nВыберите месяц:", reply_markup=kb_year_months(current_year, months, has_prev, has_next))
-        await callback.answer()
+        except (ValueError, csv.Error) as err:
+            await status.edit_text(f"Не удалось разобрать файл: {err}")
+            return
+    logging.info(f"Импорт {fmt} user_id={user_id}: добавлено {report.added} из {report.read}")
+    await status.edit_text(format_import_report(report), reply_markup=keyboard_main)
+
+@dp.message(ImportStates.waiting_for_file)
+async def process_import_not_file(message: types.Message):
+    await message.reply("Пришлите файл документом или нажмите «Отмена».", reply_markup=keyboard_cancel)
+
+# ================= Поиск по комментариям ====================
+SEARCH_HELP = ("Поиск по комментариям: /search слова\n"
+               "Находятся записи, где встречаются все слова в любой форме: «таблетка» найдёт и «таблетку».\n"
+               "Фильтры можно добавить к словам или задать без них:\n"
+               "• сила:7 или сила:5-10\n"
+               "• с:01.03.2025 и по:31.03.2025 (также мм.гггг или гггг)\n"
+               "Пример: /search таблетка сила:6-10 с:2025")
+
+async def search_view(user_id: int, query_text: str, page: int = 0):
+    """Текст и клавиатура страницы результатов. ValueError, если запрос не разобран."""
+    query = parse_query(query_text)
+    if not has_conditions(query):
+        raise ValueError("нет слов для поиска")
+    total, notes = await search_notes(user_id, query.terms, query.min_strength, query.max_strength, query.start,
+                                      query.end, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    total_pages = max(1, (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE)
+    if page >= total_pages:
+        # Часть записей удалили после поиска — показываем последнюю страницу
+        page = total_pages - 1
+        total, notes = await search_notes(user_id, query.terms, query.min_strength, query.max_strength, query.start,
+                                          query.end, SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    # Запрос в заголовке укорачивается: место под заметки рассчитано на короткий заголовок
+    title = f"Поиск: {clip_text(query_text, 100)}"
+    if not total:
+        return f"{title}\n\nНичего не найдено.", kb_search(0, 1)
+    header = f"{title}\nНайдено: {total}"
+    if total_pages > 1:
+        header += f" (стр. {page+1}/{total_pages})"
+    return f"{header}\n\n" + clip_text(format_notes_for_days(notes)), kb_search(page, total_pages)
+
+@dp.message(Command("search"))
+async def send_search(message: types.Message, state: FSMContext, command: CommandObject):
+    query_text = (command.args or "").strip()
+    if not query_text:
+        await message.answer(SEARCH_HELP)
         return
+    try:
+        text, kb = await search_view(message.from_user.id, query_text)
+    except ValueError as err:
+        await message.reply(f"Не получилось выполнить поиск: {err}.\n\n{SEARCH_HELP}")
+        return
+    # Запрос нужен кнопкам листания результатов
+    await state.update_data(search=query_text)
+    await message.answer(text, reply_markup=kb)
+
+@callback_router.register(SearchPage)
+async def on_search_page(callback: types.CallbackQuery, state: FSMContext, cb: SearchPage):
+    query_text = (await state.get_data()).get("search")
+    if not query_text:
+        await callback.answer("Результаты устарели, повторите /search", show_alert=True)
+        return
+    text, kb = await search_view(callback.from_user.id, query_text, max(0, cb.page))
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+# ================= Напоминания ====================
+REMINDER_TEXTS = {
+    DAILY: "Как голова сегодня? Если болела — добавьте запись.",
+    FOLLOWUP: f"Прошло {REMINDER_FOLLOWUP_HOURS:g} ч после сильной боли. Как вы сейчас?",
+}
+REMINDER_TIME_RE = re.compile(r"(\d{1,2})[:.](\d{2})")
 
-    # Навигация по годам
-    if data.startswith("nav_year:"):
-        _, year_str, direction = data.split(":")
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        years = st.get("years", [])
-        if not structure or not years:
-            await callback.answer()
+async def send_reminder(user_id: int, kind: str):
+    try:
+        await bot.send_message(user_id, REMINDER_TEXTS[kind], reply_markup=keyboard_reminder)
+    except TelegramForbiddenError:
+        # Бот заблокирован пользователем: напоминания ему больше не нужны
+        await delete_reminders(user_id)
+        logging.info(f"Напоминания user_id={user_id} отключены: бот заблокирован")
+
+# Один планировщик на процесс; под supervisor.py — только пользователи своего шарда и своя доля лимита
+reminders = ReminderScheduler(send_reminder, REMINDER_RATE / _workers, int(os.getenv("BOT_WORKER_INDEX", "0")), _workers)
+GaugeFunc("bot_reminders", "Планировщик напоминаний", lambda: {(k,): v for k, v in reminders.stats.items()}, ("stat",))
+
+async def reminders_view(user_id: int):
+    settings = await get_reminder_settings(user_id)
+    if settings.daily_minute is not None:
+        daily = f"каждый день в {settings.daily_minute // 60:02d}:{settings.daily_minute % 60:02d}"
+    else:
+        daily = "выключен"
+    if settings.followup:
+        followup = f"через {REMINDER_FOLLOWUP_HOURS:g} ч после записи с силой от {REMINDER_FOLLOWUP_STRENGTH}"
+    else:
+        followup = "выключен"
+    text = ("Напоминания\n"
+            f"Ежедневный вопрос: {daily}\n"
+            f"Вопрос после сильной боли: {followup}\n\n"
+            "Время ежедневного вопроса (по Москве): /remind ЧЧ:ММ\n"
+            "Выключить все напоминания: /remind off")
+    return text, kb_reminders(settings.daily_minute is not None, settings.followup)
+
+@dp.message(Command("remind"))
+async def send_reminders_settings(message: types.Message, command: CommandObject):
+    user_id = message.from_user.id
+    arg = (command.args or "").strip().lower()
+    if arg in ("off", "выкл"):
+        await reminders.set_daily(user_id, None)
+        await reminders.set_followup(user_id, False)
+    elif arg:
+        match = REMINDER_TIME_RE.fullmatch(arg)
+        if match is None or int(match[1]) > 23 or int(match[2]) > 59:
+            await message.reply("Укажите время как ЧЧ:ММ, например /remind 21:30")
             return
-        current_index = years.index(int(year_str)) if int(year_str) in years else len(years)-1
-        if direction == "prev" and current_index > 0:
-            current_index -= 1
-        elif direction == "next" and current_index < len(years)-1:
-            current_index += 1
-        current_year = years[current_index]
-        months = available_months(structure, current_year)
-        has_prev = current_index > 0
-        has_next = current_index < len(years)-1
-        await state.update_data(current_year=current_year)
-        await callback.message.edit_text(f"Год: {current_year}\nВыберите месяц:", reply_markup=kb_year_months(current_year, months, has_prev, has_next))
+        await reminders.set_daily(user_id, int(match[1]) * 60 + int(match[2]))
+    text, kb = await reminders_view(user_id)
+    await message.answer(text, reply_markup=kb)
+
+@callback_router.register("button_reminders")
+async def on_reminders(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    text, kb = await reminders_view(callback.from_user.id)
+    await callback.message.answer(text, reply_markup=kb)
+    await callback.answer()
+
+@callback_router.register(Remind)
+async def on_remind(callback: types.CallbackQuery, state: FSMContext, cb: Remind):
+    user_id = callback.from_user.id
+    if cb.kind == DAILY and not cb.on:
+        await reminders.set_daily(user_id, None)
+    elif cb.kind == FOLLOWUP:
+        await reminders.set_followup(user_id, bool(cb.on))
+    text, kb = await reminders_view(user_id)
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+# Хэндлер на нажатие инлайн-кнопок: один поиск по префиксу вместо цепочки if
+@dp.callback_query()
+async def handle_callback(callback: types.CallbackQuery, state: FSMContext):
+    try:
+        handler, payload = callback_router.resolve(callback.data or "")
+    except (ValueError, TypeError) as err:
+        logging.warning(f"Некорректный callback_data={callback.data!r}: {err}")
+        handler = None
+    if handler is None:
         await callback.answer()
         return
+    handled = False
+    try:
+        await handler(callback, state, payload)
+        handled = True
+    except Exception:
+        logging.exception(f"Ошибка обработки callback_data={callback.data!r}")
+    finally:
+        # Обработчик упал до ответа — кнопка не должна остаться с «часиками».
+        # Если ответ уже был, Telegram вернёт ошибку: её можно не замечать
+        if not handled:
+            try:
+                await callback.answer("Не удалось выполнить действие. Попробуйте ещё раз.")
+            except TelegramAPIError:
+                pass
 
-    # Выбор месяца -> показываем дни (пагинация по 5)
-    if data.startswith("sel_month:"):
-        _, year_str, month_str = data.split(":")
-        year = int(year_str); month = int(month_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        days = available_days(structure, year, month)
-        page = 0
-        total_pages = total_day_pages(days)
-        days_slice = slice_days(days, page)
-        await state.update_data(current_year=year, current_month=month, current_day_page=page)
-        await callback.message.edit_text(f"{month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb_days(year, month, days_slice, page, total_pages))
+# Новая запись
+@callback_router.register("button_new_note")
+async def on_new_note(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    user_id = callback.from_user.id
+    logging.debug(f"Нажата кнопка 'Новая запись' user_id={user_id}")
+    await callback.message.answer("Давайте добавим новую запись. \nНа сколько сильно болит голова по 10-балльной шкале?", reply_markup=keyboard_cancel)
+    await state.set_state(AddNoteStates.waiting_for_strength)
+    await callback.answer()
+
+# Просмотр записей: выбор года/месяца
+@callback_router.register("button_list_notes")
+async def on_list_notes(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    user_id = callback.from_user.id
+    logging.debug(f"Нажата кнопка 'Посмотреть записи' user_id={user_id}")
+    structure, years = await calendar_structure(user_id)
+    if not years:
+        await callback.message.answer("У вас пока нет ни одной записи.")
         await callback.answer()
         return
+    # Берем последний (самый новый) год
+    current_year = years[-1]
+    months = available_months(structure, current_year)
+    has_prev = len(years) > 1 and current_year != years[0]
+    has_next = False  # так как выбран последний
+    if current_year != years[-1]:
+        has_next = True
+    await set_cursor(state, "view", current_year)
+    await callback.message.answer(f"Год: {current_year}\nВыберите месяц:", reply_markup=kb_year_months(current_year, months, has_prev, has_next))
+    await callback.answer()
 
-    # Пагинация дней
-    if data.startswith("nav_days:"):
-        _, year_str, month_str, page_str = data.split(":")
-        year = int(year_str); month = int(month_str); page = int(page_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        days = available_days(structure, year, month)
-        total_pages = total_day_pages(days)
-        page = max(0, min(page, total_pages-1))
-        days_slice = slice_days(days, page)
-        await state.update_data(current_day_page=page)
-        text = format_notes_for_days(structure, year, month, days_slice)
-        header = f"{month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}\n\n"
-        await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, days_slice, page, total_pages))
+# Навигация по годам
+@callback_router.register(NavYear)
+async def on_nav_year(callback: types.CallbackQuery, state: FSMContext, cb: NavYear):
+    user_id = callback.from_user.id
+    structure, years = await calendar_structure(user_id)
+    if not years:
         await callback.answer()
         return
+    current_index = years.index(cb.year) if cb.year in years else len(years)-1
+    if cb.direction == "prev" and current_index > 0:
+        current_index -= 1
+    elif cb.direction == "next" and current_index < len(years)-1:
+        current_index += 1
+    current_year = years[current_index]
+    months = available_months(structure, current_year)
+    has_prev = current_index > 0
+    has_next = current_index < len(years)-1
+    await set_cursor(state, "view", current_year)
+    await callback.message.edit_text(f"Год: {current_year}\nВыберите месяц:", reply_markup=kb_year_months(current_year, months, has_prev, has_next))
+    await callback.answer()
 
-    # Быстрая навигация по неделям (страницам) из режима просмотра
-    if data.startswith("page_week:"):
-        _, year_str, month_str, page_str = data.split(":")
-        year = int(year_str); month = int(month_str); page = int(page_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        days = available_days(structure, year, month)
-        total_pages = total_day_pages(days)
-        page = max(0, min(page, total_pages-1))
-        days_slice = slice_days(days, page)
-        await state.update_data(current_day_page=page)
-        text = format_notes_for_days(structure, year, month, days_slice)
-        header = f"{month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}\n\n"
-        await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, days_slice, page, total_pages))
-        await callback.answer(); return
+# Выбор месяца -> показываем дни (пагинация по 5)
+@callback_router.register(SelMonth)
+async def on_sel_month(callback: types.CallbackQuery, state: FSMContext, cb: SelMonth):
+    user_id = callback.from_user.id
+    year, month = cb.year, cb.month
+    days = await month_days(user_id, year, month)
+    page = 0
+    total_pages = total_day_pages(days)
+    days_slice = slice_days(days, page)
+    await set_cursor(state, "view", year, month, page)
+    await callback.message.edit_text(f"{month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb_days(year, month, days_slice, page, total_pages))
+    await callback.answer()
 
-    # Просмотр всего месяца
-    if data.startswith("view_month:"):
-        _, year_str, month_str = data.split(":")
-        year = int(year_str); month = int(month_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        if not structure or month not in structure.get(year, {}):
-            await callback.answer("Нет записей в этом месяце.")
-            return
-        days = available_days(structure, year, month)
-        text = format_notes_for_days(structure, year, month, days)
-        header = f"{month_title(month, year)} | Весь месяц\n\n"
-        page = 0
-        total_pages = total_day_pages(days)
-        days_slice = slice_days(days, page)
-        await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, days_slice, page, total_pages))
-        await callback.answer(); return
+# Пагинация дней
+@callback_router.register(NavDays)
+async def on_nav_days(callback: types.CallbackQuery, state: FSMContext, cb: NavDays):
+    user_id = callback.from_user.id
+    year, month, page = cb.year, cb.month, cb.page
+    days = await month_days(user_id, year, month)
+    total_pages = total_day_pages(days)
+    page = max(0, min(page, total_pages-1))
+    days_slice = slice_days(days, page)
+    await set_cursor(state, "view", year, month, page)
+    text = days_text(await month_text(user_id, year, month), days_slice)
+    header = f"{month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}\n\n"
+    await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, days_slice, page, total_pages))
+    await callback.answer()
 
-    if data == "noop":
-        await callback.answer()
+# Быстрая навигация по неделям (страницам) из режима просмотра
+@callback_router.register(PageWeek)
+async def on_page_week(callback: types.CallbackQuery, state: FSMContext, cb: PageWeek):
+    user_id = callback.from_user.id
+    year, month, page = cb.year, cb.month, cb.page
+    days = await month_days(user_id, year, month)
+    total_pages = total_day_pages(days)
+    page = max(0, min(page, total_pages-1))
+    days_slice = slice_days(days, page)
+    await set_cursor(state, "view", year, month, page)
+    text = days_text(await month_text(user_id, year, month), days_slice)
+    header = f"{month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}\n\n"
+    await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, days_slice, page, total_pages))
+    await callback.answer()
+
+# Просмотр всего месяца
+@callback_router.register(ViewMonth)
+async def on_view_month(callback: types.CallbackQuery, state: FSMContext, cb: ViewMonth):
+    user_id = callback.from_user.id
+    year, month = cb.year, cb.month
+    days = await month_days(user_id, year, month)
+    if not days:
+        await callback.answer("Нет записей в этом месяце.")
         return
+    # Листание страниц — срез готового текста, заметки заново не читаются и не форматируются
+    view = await month_text(user_id, year, month)
+    view_pages = len(view.pages) - 1
+    view_page = max(0, min(cb.page or 0, view_pages - 1))
+    header = f"{month_title(month, year)} | Весь месяц"
+    if view_pages > 1:
+        header += f" (стр. {view_page+1}/{view_pages})"
+    kb = kb_days(year, month, slice_days(days, 0), 0, total_day_pages(days), view_page=view_page, view_pages=view_pages)
+    await callback.message.edit_text(f"{header}\n\n{month_page_text(view, view_page)}", reply_markup=kb)
+    await callback.answer()
 
-    # Возврат к месяцам
-    if data.startswith("back_months:"):
-        _, year_str = data.split(":")
-        year = int(year_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        years = st.get("years", [])
-        if not structure or year not in years:
-            await callback.answer()
-            return
-        idx = years.index(year)
-        months = available_months(structure, year)
-        has_prev = idx > 0
-        has_next = idx < len(years)-1
-        await callback.message.edit_text(f"Год: {year}\nВыберите месяц:", reply_markup=kb_year_months(year, months, has_prev, has_next))
-        await callback.answer()
+@callback_router.register(MonthChart)
+async def on_month_chart(callback: types.CallbackQuery, state: FSMContext, cb: MonthChart):
+    if not HAS_RENDERPM:
+        await callback.answer("Графики недоступны: установите rl_renderPM", show_alert=True)
         return
+    content = await export_document(callback.from_user.id, 'png', 'month', cb.year, cb.month)
+    if content is None:
+        await callback.answer("Нет записей в этом месяце.")
+        return
+    await callback.message.answer_photo(types.BufferedInputFile(content, filename=export_filename('png', 'month', cb.year, cb.month)),
+                                        caption=month_title(cb.month, cb.year))
+    await callback.answer()
 
-    # Выбор дня -> показываем записи выбранного дня требование: вывод записей (текущий формат) по выбранным дням страницы.
-    if data.startswith("sel_day:"):
-        _, year_str, month_str, day_str = data.split(":")
-        year = int(year_str); month = int(month_str)
-        st = await state.get_data()
-        structure = st.get("view_structure")
-        day = int(day_str)
-        if day not in structure.get(year, {}).get(month, {}):
-            await callback.answer("Нет записей в этот день.")
-            return
-        page = st.get("current_day_page", 0)
-        # Формируем текст всех дней текущей страницы
-        text = format_notes_for_day(structure, year, month, day)
-        header = f"{month_title(month, year)} | Дата: {fmt_date_dow(year, month, day)}\n\n"
-        await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, [day], page, total_day_pages([day])))
-        # Дополнительная клавиатура действий (экспорт / удаление / главное меню) - перегрузка интерфейса
-        # await callback.message.answer("Действия:", reply_markup=kb_after_notes())
+@callback_router.register("noop")
+async def on_noop(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.answer()
+
+# Возврат к месяцам
+@callback_router.register(BackMonths)
+async def on_back_months(callback: types.CallbackQuery, state: FSMContext, cb: BackMonths):
+    user_id = callback.from_user.id
+    year = cb.year
+    structure, years = await calendar_structure(user_id)
+    if year not in years:
         await callback.answer()
         return
+    idx = years.index(year)
+    months = available_months(structure, year)
+    has_prev = idx > 0
+    has_next = idx < len(years)-1
+    await callback.message.edit_text(f"Год: {year}\nВыберите месяц:", reply_markup=kb_year_months(year, months, has_prev, has_next))
+    await callback.answer()
 
-    # Главное меню
-    if data == "button_main_menu":
-        await callback.message.answer("Выберите действие.", reply_markup=keyboard_main)
-        await callback.answer()
+# Выбор дня -> показываем записи выбранного дня требование: вывод записей (текущий формат) по выбранным дням страницы.
+@callback_router.register(SelDay)
+async def on_sel_day(callback: types.CallbackQuery, state: FSMContext, cb: SelDay):
+    user_id = callback.from_user.id
+    year, month, day = cb.year, cb.month, cb.day
+    if day not in await month_days(user_id, year, month):
+        await callback.answer("Нет записей в этот день.")
         return
+    page = (await get_cursor(state)).get("page", 0)
+    # Формируем текст всех дней текущей страницы
+    text = clip_text(format_notes_for_day(await notes_for_days(user_id, year, month, [day])))
+    header = f"{month_title(month, year)} | Дата: {fmt_date_dow(year, month, day)}\n\n"
+    await callback.message.edit_text(header + text, reply_markup=kb_days(year, month, [day], page, total_day_pages([day])))
+    # Дополнительная клавиатура действий (экспорт / удаление / главное меню) - перегрузка интерфейса
+    # await callback.message.answer("Действия:", reply_markup=kb_after_notes())
+    await callback.answer()
 
-    if data == "export_open_filter":
-        await callback.message.answer("Область экспорта:", reply_markup=kb_export_root())
-        await callback.answer(); return
+# Главное меню
+@callback_router.register("button_main_menu")
+async def on_main_menu(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.message.answer("Выберите действие.", reply_markup=keyboard_main)
+    await callback.answer()
 
-    # Экспорт TXT
-    if data == "export_txt":
-        txt = export_notes_text(user_id)
-        if txt.strip() == "Нет записей.":
-            await callback.message.answer("Нет записей для экспорта.")
-            await callback.answer(); return
-        with tmp_file('.txt') as path:
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(txt)
-            await callback.message.answer_document(types.FSInputFile(path, filename='notes_export.txt'))
-        await callback.answer(); return
+# Статистика из главного меню
+@callback_router.register("button_stats")
+async def on_stats(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    text, kb = await stats_view(callback.from_user.id)
+    await callback.message.answer(text, reply_markup=kb)
+    await callback.answer()
 
-    # Экспорт PDF (попытка через reportlab)
-    if data == "export_pdf":
-        try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-        except ImportError:
-            await callback.message.answer("Модуль reportlab не установлен. Установите: pip install reportlab")
-            await callback.answer(); return
-        txt = export_notes_text(user_id)
-        if txt.strip() == "Нет записей.":
-            await callback.message.answer("Нет записей для экспорта.")
-            await callback.answer(); return
-        with tmp_file('.pdf') as path:
-            c = canvas.Canvas(path, pagesize=A4)
-            width, height = A4
-            y = height - 40
-            max_chars = 100
-            font_info = find_cyr_font()
-            font_name = 'Helvetica'
-            if font_info:
-                try:
-                    pdfmetrics.registerFont(TTFont(font_info[0], font_info[1]))
-                    font_name = font_info[0]
-                except Exception:
-                    pass
-            c.setFont(font_name, 11)
-            for line in txt.split('\n'):
-                # перенос длинных строк
-                parts = [line[i:i+max_chars] for i in range(0, len(line), max_chars)] or ['']
-                for part in parts:
-                    if y < 50:
-                        c.showPage(); y = height - 40
-                        c.setFont(font_name, 11)
-                    c.drawString(40, y, part)
-                    y -= 14
-            c.save()
-            await callback.message.answer_document(types.FSInputFile(path, filename='notes_export.pdf'))
-        await callback.answer(); return
+# Фильтр статистики по году/месяцу
+@callback_router.register(StatsView)
+async def on_stats_view(callback: types.CallbackQuery, state: FSMContext, cb: StatsView):
+    text, kb = await stats_view(callback.from_user.id, cb.year, cb.year and cb.month)
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
 
-    # ===== Расширенный экспорт с фильтром =====
-    if data == 'export_scope:all':
-        await callback.message.answer("Выберите формат:", reply_markup=kb_export_format('all'))
-        await callback.answer(); return
-    if data == 'export_scope:year':
-        structure, years = group_notes_structure(user_id)
-        if not years:
-            await callback.message.answer("Нет данных.")
-            await callback.answer(); return
-        await callback.message.answer("Выберите год:", reply_markup=kb_export_years(years))
-        await callback.answer(); return
-    if data == 'export_scope:month':
-        structure, years = group_notes_structure(user_id)
-        if not years:
-            await callback.message.answer("Нет данных.")
-            await callback.answer(); return
-        await callback.message.answer("Сначала выберите год:", reply_markup=kb_export_years(years))
+@callback_router.register("export_open_filter")
+async def on_export_open_filter(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.message.answer("Область экспорта:", reply_markup=kb_export_root())
+    await callback.answer()
+
+# Экспорт TXT / PDF всех записей
+@callback_router.register("export_txt")
+@callback_router.register("export_pdf")
+async def on_export_all(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    fmt = callback.data.removeprefix("export_")
+    if fmt == 'pdf' and not HAS_REPORTLAB:
+        await callback.message.answer("Модуль reportlab не установлен. Установите: pip install reportlab")
         await callback.answer(); return
-    if data == 'export_cancel':
-        await callback.message.answer("Экспорт отменён.")
+    content = await export_document(callback.from_user.id, fmt, with_scope=False)
+    if content is None:
+        await callback.message.answer("Нет записей для экспорта.")
         await callback.answer(); return
-    if data == 'export_back_root':
-        await callback.message.answer("Область экспорта:", reply_markup=kb_export_root())
+    await callback.message.answer_document(types.BufferedInputFile(content, filename=export_filename(fmt)))
+    await callback.answer()
+
+# ===== Расширенный экспорт с фильтром =====
+@callback_router.register(ExportScope)
+async def on_export_scope(callback: types.CallbackQuery, state: FSMContext, cb: ExportScope):
+    if cb.scope == 'all':
+        await callback.message.answer("Выберите формат:", reply_markup=kb_export_format('all'))
         await callback.answer(); return
-    if data == 'export_back_years':
-        structure, years = group_notes_structure(user_id)
-        await callback.message.answer("Выберите год:", reply_markup=kb_export_years(years))
+    structure, years = await calendar_structure(callback.from_user.id)
+    if not years:
+        await callback.message.answer("Нет данных.")
         await callback.answer(); return
-    if data.startswith('export_year:'):
-        _, year_str = data.split(':')
-        year = int(year_str)
-        # Если сценарий был "по месяцу", дадим выбор месяцев
-        # Определить сценарий: просто повторно спросим выбор формата/или месяцев.
-        structure, years = group_notes_structure(user_id)
-        months = available_months(structure, year)
-        if months:
-            # await callback.message.answer("Выберите месяц или формат для всего года:", reply_markup=kb_export_months(year, months))
-            # Также отдельно можно предложить форматы для года
-            await callback.message.answer("Формат: ", reply_markup=kb_export_format('year', year))
-        else:
-            await callback.message.answer("Нет месяцев в этом году.")
+    prompt = "Сначала выберите год:" if cb.scope == 'month' else "Выберите год:"
+    await callback.message.answer(prompt, reply_markup=kb_export_years(years))
+    await callback.answer()
+
+@callback_router.register("export_cancel")
+async def on_export_cancel(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.message.answer("Экспорт отменён.")
+    await callback.answer()
+
+@callback_router.register("export_back_root")
+async def on_export_back_root(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.message.answer("Область экспорта:", reply_markup=kb_export_root())
+    await callback.answer()
+
+@callback_router.register("export_back_years")
+async def on_export_back_years(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    user_id = callback.from_user.id
+    structure, years = await calendar_structure(user_id)
+    await callback.message.answer("Выберите год:", reply_markup=kb_export_years(years))
+    await callback.answer()
+
+@callback_router.register(ExportYear)
+async def on_export_year(callback: types.CallbackQuery, state: FSMContext, cb: ExportYear):
+    user_id = callback.from_user.id
+    year = cb.year
+    # Если сценарий был "по месяцу", дадим выбор месяцев
+    # Определить сценарий: просто повторно спросим выбор формата/или месяцев.
+    structure, years = await calendar_structure(user_id)
+    months = available_months(structure, year)
+    if months:
+        # await callback.message.answer("Выберите месяц или формат для всего года:", reply_markup=kb_export_months(year, months))
+        # Также отдельно можно предложить форматы для года
+        await callback.message.answer("Формат: ", reply_markup=kb_export_format('year', year))
+    else:
+        await callback.message.answer("Нет месяцев в этом году.")
+    await callback.answer()
+
+@callback_router.register(ExportMonth)
+async def on_export_month(callback: types.CallbackQuery, state: FSMContext, cb: ExportMonth):
+    year, month = cb.year, cb.month
+    await callback.message.answer("Выберите формат:", reply_markup=kb_export_format('month', year, month))
+    await callback.answer()
+
+@callback_router.register(ExportMake)
+async def on_export_make(callback: types.CallbackQuery, state: FSMContext, cb: ExportMake):
+    if cb.fmt == 'pdf' and not HAS_REPORTLAB:
+        await callback.message.answer("reportlab не установлен.")
         await callback.answer(); return
-    if data.startswith('export_month:'):
-        _, year_str, month_str = data.split(':')
-        year = int(year_str); month = int(month_str)
-        await callback.message.answer("Выберите формат:", reply_markup=kb_export_format('month', year, month))
+    if cb.fmt == 'png' and (not HAS_RENDERPM or cb.scope != 'month'):
+        await callback.message.answer("Картинка недоступна: нужен месяц и модуль rl_renderPM.")
         await callback.answer(); return
-    if data.startswith('export_make:'):
-        parts = data.split(':')
-        # export_make : fmt : scope (: year) (: month)
-        fmt = parts[1]
-        scope = parts[2]
-        year = int(parts[3]) if len(parts) > 3 else None
-        month = int(parts[4]) if len(parts) > 4 else None
-        txt = export_notes_filtered_text(user_id, scope, year, month)
-        if txt.strip() == 'Нет записей.':
-            await callback.message.answer("Нет записей под выбранный фильтр.")
-            await callback.answer(); return
-        if fmt == 'txt':
-            with tmp_file('.txt') as path:
-                with open(path, 'w', encoding='utf-8') as f:
-                    f.write(txt)
-                fname = 'notes_export.txt'
-                if scope == 'year' and year:
-                    fname = f'notes_{year}.txt'
-                if scope == 'month' and year and month:
-                    fname = f'notes_{year}_{month}.txt'
-                await callback.message.answer_document(types.FSInputFile(path, filename=fname))
-        elif fmt == 'pdf':
-            try:
-                from reportlab.lib.pagesizes import A4
-                from reportlab.pdfgen import canvas
-                from reportlab.pdfbase import pdfmetrics
-                from reportlab.pdfbase.ttfonts import TTFont
-            except ImportError:
-                await callback.message.answer("reportlab не установлен.")
-                await callback.answer(); return
-            with tmp_file('.pdf') as path:
-                c = canvas.Canvas(path, pagesize=A4)
-                width, height = A4
-                y = height - 40
-                max_chars = 100
-                font_info = find_cyr_font()
-                font_name = 'Helvetica'
-                if font_info:
-                    try:
-                        pdfmetrics.registerFont(TTFont(font_info[0], font_info[1]))
-                        font_name = font_info[0]
-                    except Exception:
-                        pass
-                c.setFont(font_name, 11)
-                for line in txt.split('\n'):
-                    parts_line = [line[i:i+max_chars] for i in range(0, len(line), max_chars)] or ['']
-                    for pl in parts_line:
-                        if y < 50:
-                            c.showPage(); y = height - 40
-                            c.setFont(font_name, 11)
-                        c.drawString(40, y, pl)
-                        y -= 14
-                c.save()
-                fname = 'notes_export.pdf'
-                if scope == 'year' and year:
-                    fname = f'notes_{year}.pdf'
-                if scope == 'month' and year and month:
-                    fname = f'notes_{year}_{month}.pdf'
-                await callback.message.answer_document(types.FSInputFile(path, filename=fname))
+    content = await export_document(callback.from_user.id, cb.fmt, cb.scope, cb.year, cb.month)
+    if content is None:
+        await callback.message.answer("Нет записей под выбранный фильтр.")
         await callback.answer(); return
+    await callback.message.answer_document(types.BufferedInputFile(content, filename=export_filename(cb.fmt, cb.scope, cb.year, cb.month)))
+    await callback.answer()
 
-    # Удаление: запускаем ту же навигацию, но с префиксом режима удаления
-    if data == "button_delete_note":
-        structure, years = group_notes_structure(user_id)
-        if not years:
-            await callback.message.answer("Нет записей для удаления.")
-            await callback.answer()
-            return
-        current_year = years[-1]
-        months = available_months(structure, current_year)
-        has_prev = len(years) > 1 and current_year != years[0]
-        has_next = False
-        await state.update_data(del_structure=structure, del_years=years, del_current_year=current_year)
-        # Используем ту же клавиатуру, но callback менять префиксы через замену (простое решение)
-        kb = kb_year_months(current_year, months, has_prev, has_next)
-        # Перезаписываем callback_data в режиме удаления
-        for row in kb.inline_keyboard:
-            for btn in row:
-                if btn.callback_data and btn.callback_data.startswith("sel_month:"):
-                    btn.callback_data = btn.callback_data.replace("sel_month:", "del_sel_month:")
-                if btn.callback_data and btn.callback_data.startswith("nav_year:"):
-                    btn.callback_data = btn.callback_data.replace("nav_year:", "del_nav_year:")
-        await callback.message.answer(f"[Удаление] Год: {current_year}\nВыберите месяц:", reply_markup=kb)
+# Удаление: запускаем ту же навигацию, но с префиксом режима удаления
+@callback_router.register("button_delete_note")
+async def on_delete_note(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    user_id = callback.from_user.id
+    structure, years = await calendar_structure(user_id)
+    if not years:
+        await callback.message.answer("Нет записей для удаления.")
         await callback.answer()
         return
+    current_year = years[-1]
+    months = available_months(structure, current_year)
+    has_prev = len(years) > 1 and current_year != years[0]
+    has_next = False
+    await set_cursor(state, "del", current_year)
+    # Та же клавиатура, что и при просмотре, с префиксами режима удаления
+    kb = kb_year_months(current_year, months, has_prev, has_next, mode="del")
+    await callback.message.answer(f"[Удаление] Год: {current_year}\nВыберите месяц:", reply_markup=kb)
+    await callback.answer()
 
-    # Навигация по годам (удаление)
-    if data.startswith("del_nav_year:"):
-        _, year_str, direction = data.split(":")
-        st = await state.get_data()
-        structure = st.get("del_structure")
-        years = st.get("del_years", [])
-        if not structure or not years:
-            await callback.answer(); return
-        current_index = years.index(int(year_str)) if int(year_str) in years else len(years)-1
-        if direction == "prev" and current_index > 0:
-            current_index -= 1
-        elif direction == "next" and current_index < len(years)-1:
-            current_index += 1
-        current_year = years[current_index]
-        months = available_months(structure, current_year)
-        has_prev = current_index > 0
-        has_next = current_index < len(years)-1
-        await state.update_data(del_current_year=current_year)
-        kb = kb_year_months(current_year, months, has_prev, has_next)
-        for row in kb.inline_keyboard:
-            for btn in row:
-                if btn.callback_data and btn.callback_data.startswith("sel_month:"):
-                    btn.callback_data = btn.callback_data.replace("sel_month:", "del_sel_month:")
-                if btn.callback_data and btn.callback_data.startswith("nav_year:"):
-                    btn.callback_data = btn.callback_data.replace("nav_year:", "del_nav_year:")
-        await callback.message.edit_text(f"[Удаление] Год: {current_year}\nВыберите месяц:", reply_markup=kb)
+# Навигация по годам (удаление)
+@callback_router.register(DelNavYear)
+async def on_del_nav_year(callback: types.CallbackQuery, state: FSMContext, cb: DelNavYear):
+    user_id = callback.from_user.id
+    structure, years = await calendar_structure(user_id)
+    if not years:
         await callback.answer(); return
+    current_index = years.index(cb.year) if cb.year in years else len(years)-1
+    if cb.direction == "prev" and current_index > 0:
+        current_index -= 1
+    elif cb.direction == "next" and current_index < len(years)-1:
+        current_index += 1
+    current_year = years[current_index]
+    months = available_months(structure, current_year)
+    has_prev = current_index > 0
+    has_next = current_index < len(years)-1
+    await set_cursor(state, "del", current_year)
+    kb = kb_year_months(current_year, months, has_prev, has_next, mode="del")
+    await callback.message.edit_text(f"[Удаление] Год: {current_year}\nВыберите месяц:", reply_markup=kb)
+    await callback.answer()
 
-    # Выбор месяца (удаление)
-    if data.startswith("del_sel_month:"):
-        _, year_str, month_str = data.split(":")
-        year = int(year_str); month = int(month_str)
-        st = await state.get_data()
-        structure = st.get("del_structure")
-        days = available_days(structure, year, month)
-        page = 0
-        total_pages = total_day_pages(days)
-        days_slice = slice_days(days, page)
-        await state.update_data(del_current_year=year, del_current_month=month, del_current_day_page=page)
-        kb = kb_days(year, month, days_slice, page, total_pages, include_view_month=False)
-        for row in kb.inline_keyboard:
-            for btn in row:
-                if btn.callback_data and btn.callback_data.startswith("sel_day:"):
-                    btn.callback_data = btn.callback_data.replace("sel_day:", "del_sel_day:")
-                if btn.callback_data and btn.callback_data.startswith("nav_days:"):
-                    btn.callback_data = btn.callback_data.replace("nav_days:", "del_nav_days:")
-                if btn.callback_data and btn.callback_data.startswith("back_months:"):
-                    btn.callback_data = btn.callback_data.replace("back_months:", "del_back_months:")
-        await callback.message.edit_text(f"[Удаление] {month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb)
-        await callback.answer(); return
+# Выбор месяца (удаление)
+@callback_router.register(DelSelMonth)
+async def on_del_sel_month(callback: types.CallbackQuery, state: FSMContext, cb: DelSelMonth):
+    user_id = callback.from_user.id
+    year, month = cb.year, cb.month
+    days = await month_days(user_id, year, month)
+    page = 0
+    total_pages = total_day_pages(days)
+    days_slice = slice_days(days, page)
+    await set_cursor(state, "del", year, month, page)
+    kb = kb_days(year, month, days_slice, page, total_pages, include_view_month=False, mode="del")
+    await callback.message.edit_text(f"[Удаление] {month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb)
+    await callback.answer()
 
-    # Пагинация дней (удаление)
-    if data.startswith("del_nav_days:"):
-        _, year_str, month_str, page_str = data.split(":")
-        year = int(year_str); month = int(month_str); page = int(page_str)
-        st = await state.get_data()
-        structure = st.get("del_structure")
-        days = available_days(structure, year, month)
-        total_pages = total_day_pages(days)
-        page = max(0, min(page, total_pages-1))
-        days_slice = slice_days(days, page)
-        await state.update_data(del_current_day_page=page)
-        kb = kb_days(year, month, days_slice, page, total_pages, include_view_month=False)
-        for row in kb.inline_keyboard:
-            for btn in row:
-                if btn.callback_data and btn.callback_data.startswith("sel_day:"):
-                    btn.callback_data = btn.callback_data.replace("sel_day:", "del_sel_day:")
-                if btn.callback_data and btn.callback_data.startswith("nav_days:"):
-                    btn.callback_data = btn.callback_data.replace("nav_days:", "del_nav_days:")
-                if btn.callback_data and btn.callback_data.startswith("back_months:"):
-                    btn.callback_data = btn.callback_data.replace("back_months:", "del_back_months:")
-        await callback.message.edit_text(f"[Удаление] {month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb)
-        await callback.answer(); return
+# Пагинация дней (удаление)
+@callback_router.register(DelNavDays)
+async def on_del_nav_days(callback: types.CallbackQuery, state: FSMContext, cb: DelNavDays):
+    user_id = callback.from_user.id
+    year, month, page = cb.year, cb.month, cb.page
+    days = await month_days(user_id, year, month)
+    total_pages = total_day_pages(days)
+    page = max(0, min(page, total_pages-1))
+    days_slice = slice_days(days, page)
+    await set_cursor(state, "del", year, month, page)
+    kb = kb_days(year, month, days_slice, page, total_pages, include_view_month=False, mode="del")
+    await callback.message.edit_text(f"[Удаление] {month_title(month, year)}\nДни (стр {page+1}/{total_pages}):", reply_markup=kb)
+    await callback.answer()
 
-    # Возврат к месяцам (удаление)
-    if data.startswith("del_back_months:"):
-        _, year_str = data.split(":")
-        year = int(year_str)
-        st = await state.get_data()
-        structure = st.get("del_structure")
-        years = st.get("del_years", [])
-        if not structure or year not in years:
-            await callback.answer(); return
-        idx = years.index(year)
-        months = available_months(structure, year)
-        has_prev = idx > 0
-        has_next = idx < len(years)-1
-        kb = kb_year_months(year, months, has_prev, has_next)
-        for row in kb.inline_keyboard:
-            for btn in row:
-                if btn.callback_data and btn.callback_data.startswith("sel_month:"):
-                    btn.callback_data = btn.callback_data.replace("sel_month:", "del_sel_month:")
-                if btn.callback_data and btn.callback_data.startswith("nav_year:"):
-                    btn.callback_data = btn.callback_data.replace("nav_year:", "del_nav_year:")
-        await callback.message.edit_text(f"[Удаление] Год: {year}\nВыберите месяц:", reply_markup=kb)
+# Возврат к месяцам (удаление)
+@callback_router.register(DelBackMonths)
+async def on_del_back_months(callback: types.CallbackQuery, state: FSMContext, cb: DelBackMonths):
+    user_id = callback.from_user.id
+    year = cb.year
+    structure, years = await calendar_structure(user_id)
+    if year not in years:
         await callback.answer(); return
+    idx = years.index(year)
+    months = available_months(structure, year)
+    has_prev = idx > 0
+    has_next = idx < len(years)-1
+    kb = kb_year_months(year, months, has_prev, has_next, mode="del")
+    await callback.message.edit_text(f"[Удаление] Год: {year}\nВыберите месяц:", reply_markup=kb)
+    await callback.answer()
 
-    # Выбор дня (удаление) -> показать записи текущей страницы и попросить id
-    if data.startswith("del_sel_day:"):
-        _, year_str, month_str, day_str = data.split(":")
-        year = int(year_str); month = int(month_str)
-        st = await state.get_data()
-        structure = st.get("del_structure")
-        days = available_days(structure, year, month)
-        page = st.get("del_current_day_page", 0)
-        days_slice = slice_days(days, page)
-        text = format_notes_for_days(structure, year, month, days_slice)
-        header = f"[Удаление] {month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}\n\n"
-        await callback.message.edit_text(header + text + "\nОтправьте id записи, которую хотите удалить.")
-        await state.set_state(DeleteNoteStates.waiting_for_id)
-        await callback.answer(); return
-    
-    if data.startswith("button_cancel"):
-        await callback.message.answer("Действие отменено. Выберите действие.", reply_markup=keyboard_main)
-        await state.clear()
+# Выбор дня (удаление) -> показать записи текущей страницы и попросить id
+@callback_router.register(DelSelDay)
+async def on_del_sel_day(callback: types.CallbackQuery, state: FSMContext, cb: DelSelDay):
+    user_id = callback.from_user.id
+    year, month = cb.year, cb.month
+    days = await month_days(user_id, year, month)
+    page = (await get_cursor(state)).get("page", 0)
+    days_slice = slice_days(days, page)
+    # «Весь месяц» в режиме удаления нет: не поместившиеся записи листаются здесь же,
+    # иначе их id не увидеть и не удалить
+    view = await month_text(user_id, year, month)
+    pages = day_pages(view, days_slice)
+    view_pages = len(pages) - 1
+    view_page = max(0, min(cb.page or 0, view_pages - 1))
+    text = page_text(view, pages, view_page) if pages else "Нет записей."
+    header = f"[Удаление] {month_title(month, year)} | Даты: {', '.join(fmt_date_dow(year, month, d) for d in days_slice)}"
+    kb = None
+    if view_pages > 1:
+        header += f" (стр. {view_page+1}/{view_pages})"
+        kb = kb_days(year, month, days_slice, page, total_day_pages(days), include_view_month=False,
+                     view_page=view_page, view_pages=view_pages, mode="del")
+    await callback.message.edit_text(f"{header}\n\n{text}\nОтправьте id записи, которую хотите удалить.", reply_markup=kb)
+    await state.set_state(DeleteNoteStates.waiting_for_id)
+    await callback.answer()
 
+@callback_router.register("button_cancel")
+async def on_cancel(callback: types.CallbackQuery, state: FSMContext, cb: None):
+    await callback.message.answer("Действие отменено. Выберите действие.", reply_markup=keyboard_main)
+    await state.clear()
     await callback.answer()
 
 # Хэндлер, который ловит ответ пользователя о силе боли
@@ -730,12 +1001,13 @@ async def process_text(message: types.Message, state: FSMContext):
     logging.debug(f"Получены комментарий: {text} user_id={message.from_user.id}")
 
     user_data = await state.get_data()
-    add_note(
+    await add_note(
         user_id=message.from_user.id,
         strength=user_data['strength'],
         text=user_data['text'],
         datetime=datetime.datetime.now(offset_timezone).strftime("%d.%m.%Y %H:%M")
     )
+    await reminders.note_added(message.from_user.id, user_data['strength'])
     
     await message.reply("Готово! Запись сохранена.", reply_markup=keyboard_main)
     logging.debug(f"Новая запись для user_id={message.from_user.id}")
@@ -749,7 +1021,7 @@ async def process_get_note_id(message: types.Message, state: FSMContext):
         note_id = int(message.text.strip())
         await state.update_data(note_id=note_id)
         try:
-            delete_note(note_id=note_id)
+            await delete_note(note_id=note_id)
             logging.debug(f"Удалена запись с id={note_id} user_id={message.from_user.id}")
             logging.info("Удалена запись.")
             await message.answer("Запись удалена. \nВыберите действие.", reply_markup=keyboard_main)
@@ -762,11 +1034,30 @@ async def process_get_note_id(message: types.Message, state: FSMContext):
 
 async def main():
     # Создаем таблицу при запуске
-    init_db()
+    await init_db()
+    metrics_runner = await start_metrics_server()
+    # Расписание напоминаний читается из БД
+    reminders.start()
     # Запускаем бота
     logging.debug("Запуск бота.")
-    print("Запуск бота...")
-    await dp.start_polling(bot)
+    print(f"Запуск бота ({BOT_MODE})...")
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Если раньше был включён webhook, getUpdates вернёт конфликт
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await reminders.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        shutdown_export_pool()
+        close_db()
 
 if __name__ == "__main__":
+    # Включаем логирование, чтобы видеть сообщения в консоли.
+    # Только при запуске: процессы пула экспорта импортируют этот модуль заново и не должны обнулять лог
+    logging.basicConfig(level=logging.INFO, filename="logfile.log",filemode="w",
+                        format="%(asctime)s %(levelname)s %(message)s")
     asyncio.run(main())
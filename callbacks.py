@@ -0,0 +1,216 @@
+from types import UnionType
+from typing import Annotated, Literal, NamedTuple, Union, get_args, get_origin
+
+from aiogram.filters.callback_data import CallbackData
+from pydantic import Field
+
+# ================= Фабрики callback_data =====================
+# Формат совпадает с прежними строками вида "prefix:arg1:arg2", поэтому
+# клавиатуры, отправленные до обновления, продолжают работать.
+# Ограничения полей проверяет и CallbackRouter: callback_data присылает клиент, подделать её несложно.
+
+# Верхняя граница — на год меньше datetime.MAXYEAR: конец периода — 1 января следующего года
+Year = Annotated[int, Field(ge=1, le=9998)]
+Month = Annotated[int, Field(ge=1, le=12)]
+Day = Annotated[int, Field(ge=1, le=31)]
+Page = Annotated[int, Field(ge=0)]
+
+class NavYear(CallbackData, prefix="nav_year"):
+    year: Year
+    direction: Literal["prev", "next"]
+
+class SelMonth(CallbackData, prefix="sel_month"):
+    year: Year
+    month: Month
+
+class NavDays(CallbackData, prefix="nav_days"):
+    year: Year
+    month: Month
+    page: Page
+
+class PageWeek(CallbackData, prefix="page_week"):
+    year: Year
+    month: Month
+    page: Page
+
+class _OptionalTail:
+    """Необязательные поля в конце не попадают в строку: "prefix:a:b" вместо "prefix:a:b::"."""
+
+    def pack(self) -> str:
+        return super().pack().rstrip(self.__separator__)
+
+    @classmethod
+    def unpack(cls, value: str):
+        parts = value.split(cls.__separator__)
+        parts += [""] * (len(cls.model_fields) + 1 - len(parts))
+        return super().unpack(cls.__separator__.join(parts))
+
+class ViewMonth(_OptionalTail, CallbackData, prefix="view_month"):
+    """view_month:year:month(:page) — страница текста месяца, по умолчанию первая."""
+    year: Year
+    month: Month
+    page: Page | None = None
+
+class MonthChart(CallbackData, prefix="month_chart"):
+    year: Year
+    month: Month
+
+class BackMonths(CallbackData, prefix="back_months"):
+    year: Year
+
+class SelDay(CallbackData, prefix="sel_day"):
+    year: Year
+    month: Month
+    day: Day
+
+# Те же действия в режиме удаления
+class DelNavYear(NavYear, prefix="del_nav_year"):
+    pass
+
+class DelSelMonth(SelMonth, prefix="del_sel_month"):
+    pass
+
+class DelNavDays(NavDays, prefix="del_nav_days"):
+    pass
+
+class DelBackMonths(BackMonths, prefix="del_back_months"):
+    pass
+
+class DelSelDay(_OptionalTail, SelDay, prefix="del_sel_day"):
+    """del_sel_day:year:month:day(:page) — записи дней текущей страницы; page — страница текста,
+    если они не помещаются в одно сообщение."""
+    page: Page | None = None
+
+class NavFactories(NamedTuple):
+    """Фабрики кнопок навигации по календарю одного режима."""
+    nav_year: type[NavYear]
+    sel_month: type[SelMonth]
+    nav_days: type[NavDays]
+    back_months: type[BackMonths]
+    sel_day: type[SelDay]
+
+# Режимы навигации (совпадают с режимом курсора в FSM): просмотр и удаление отличаются только префиксами
+NAV_MODES = {
+    "view": NavFactories(NavYear, SelMonth, NavDays, BackMonths, SelDay),
+    "del": NavFactories(DelNavYear, DelSelMonth, DelNavDays, DelBackMonths, DelSelDay),
+}
+
+class ExportScope(CallbackData, prefix="export_scope"):
+    scope: Literal["all", "year", "month"]
+
+class ExportYear(CallbackData, prefix="export_year"):
+    year: Year
+
+class ExportMonth(CallbackData, prefix="export_month"):
+    year: Year
+    month: Month
+
+class ExportMake(_OptionalTail, CallbackData, prefix="export_make"):
+    """export_make:fmt:scope(:year)(:month) — год и месяц необязательны."""
+    fmt: Literal["txt", "pdf", "png"]
+    scope: Literal["all", "year", "month"]
+    year: Year | None = None
+    month: Month | None = None
+
+class StatsView(_OptionalTail, CallbackData, prefix="stats"):
+    """stats(:year)(:month) — статистика за всё время, год или месяц."""
+    year: Year | None = None
+    month: Month | None = None
+
+class SearchPage(CallbackData, prefix="search_page"):
+    """Страница результатов /search; сам запрос хранится в данных FSM."""
+    page: Page
+
+class Remind(CallbackData, prefix="remind"):
+    """remind:kind:on — включить (1) или выключить (0) напоминания вида daily/followup."""
+    kind: Literal["daily", "followup"]
+    on: Annotated[int, Field(ge=0, le=1)]
+
+# =================================================================
+
+def _field_type(field) -> tuple:
+    """Тип поля и его ограничения (ge/le) без `| None` и Annotated."""
+    annotation, metadata = field.annotation, list(field.metadata)
+    if get_origin(annotation) in (Union, UnionType):
+        annotation = next(arg for arg in get_args(annotation) if arg is not type(None))
+    if get_origin(annotation) is Annotated:
+        annotation, *extra = get_args(annotation)
+        for item in extra:
+            metadata += getattr(item, "metadata", [item])
+    low = next((m.ge for m in metadata if hasattr(m, "ge")), None)
+    high = next((m.le for m in metadata if hasattr(m, "le")), None)
+    return annotation, low, high
+
+
+def _field_parser(field):
+    """Преобразователь строки payload в значение поля (int, str, Literal, в том числе `| None`)
+    с проверкой ограничений; неподходящее значение — ValueError."""
+    nullable = not field.is_required()
+    annotation, low, high = _field_type(field)
+    if get_origin(annotation) is Literal:
+        allowed = {str(value): value for value in get_args(annotation)}
+
+        def convert(v: str):
+            if v not in allowed:
+                raise ValueError(f"{v!r} is not one of {list(allowed)}")
+            return allowed[v]
+    elif annotation is int:
+        def convert(v: str) -> int:
+            value = int(v)
+            if (low is not None and value < low) or (high is not None and value > high):
+                raise ValueError(f"{value} is out of range [{low}, {high}]")
+            return value
+    else:
+        convert = str
+
+    def parse(v: str):
+        if not v:
+            if nullable:
+                return None
+            raise ValueError("empty value for a required field")
+        return convert(v)
+    return parse
+
+
+class CallbackRouter:
+    """Таблица обработчиков callback_data: поиск по префиксу за O(1).
+
+    Ключ — либо фабрика CallbackData (payload разбирается один раз и передаётся
+    обработчику), либо строка для кнопок без параметров (payload = None).
+    Обработчик: async def handler(callback, state, payload).
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def register(self, key):
+        def decorator(handler):
+            if isinstance(key, str):
+                self._handlers[key] = (None, None, handler)
+            else:
+                # Разбор полей готовим заранее: на горячем пути только split, int() и сравнения
+                fields = [(name, _field_parser(f)) for name, f in key.model_fields.items()]
+                self._handlers[key.__prefix__] = (key, fields, handler)
+            return handler
+        return decorator
+
+    def label(self, data: str) -> str:
+        """Префикс зарегистрированного callback_data (для метрик) или 'unknown'."""
+        prefix = data.partition(":")[0]
+        return prefix if prefix in self._handlers else "unknown"
+
+    def resolve(self, data: str):
+        """Возвращает (handler, payload) или (None, None), если callback неизвестен.
+        Некорректный payload (в том числе значение вне допустимых) приводит к ValueError/TypeError."""
+        prefix, _, rest = data.partition(":")
+        entry = self._handlers.get(prefix)
+        if entry is None:
+            return None, None
+        factory, fields, handler = entry
+        if factory is None:
+            return (handler, None) if not rest else (None, None)
+        parts = rest.split(factory.__separator__)
+        if len(parts) > len(fields):
+            raise TypeError(f"Callback data {factory.__name__!r} takes {len(fields)} arguments but {len(parts)} were given")
+        parts += [""] * (len(fields) - len(parts))
+        return handler, factory.model_construct(**{name: parse(v) for (name, parse), v in zip(fields, parts)})
@@ -1,42 +1,751 @@
+import asyncio
+import os
+import queue
 import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime as _datetime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple
 
-def init_db():
-    """Initializes the database and creates the notes table if it doesn't exist."""
-    conn = sqlite3.connect('notes.db')
-    cur = conn.cursor()
-    cur.execute('''
+from metrics import db_batch_size, db_seconds
+
+# Путь к БД и размер пула читателей можно переопределить через окружение
+DB_PATH = os.getenv("NOTES_DB_PATH", "notes.db")
+DB_READERS = int(os.getenv("NOTES_DB_READERS", "4"))
+# Групповая запись add_note/delete_note: сколько ждать попутчиков после первой записи и предел пачки.
+# Одна транзакция (и один fsync) на пачку позволяет держать synchronous=FULL у писателя
+WRITE_BATCH_WINDOW = float(os.getenv("NOTES_DB_BATCH_WINDOW_MS", "2")) / 1000
+WRITE_BATCH_MAX = int(os.getenv("NOTES_DB_BATCH_MAX", "256"))
+DB_SYNCHRONOUS = os.getenv("NOTES_DB_SYNCHRONOUS", "FULL")
+
+# Часовой пояс, в котором записана legacy-колонка datetime ('%d.%m.%Y %H:%M')
+NOTES_TZ = timezone(timedelta(hours=3), name='MSK')
+LEGACY_DATETIME_FORMAT = "%d.%m.%Y %H:%M"
+
+
+class Note(NamedTuple):
+    """A note with its time parsed once (aware datetime in NOTES_TZ) and its weekday (0 = Monday)."""
+    id: int
+    strength: int
+    text: str
+    dt: _datetime
+    weekday: int
+
+
+class ReminderSettings(NamedTuple):
+    """A user's reminder opt-ins: daily check-in time (minutes after midnight in NOTES_TZ, None if off)
+    and whether follow-ups after strong attacks are enabled."""
+    daily_minute: int | None
+    followup: bool
+
+
+class Stats(NamedTuple):
+    """Aggregated pain statistics for a period (all time, a year or a month)."""
+    count: int
+    days: int
+    avg_strength: float | None
+    max_strength: int | None
+    # (year, month, count, avg_strength, max_strength) ordered by time
+    months: list[tuple[int, int, int, float, int]]
+    # note counts per weekday, Monday first
+    weekdays: list[int]
+    # longest attack-free streak: (days, first_day, last_day) or None if the period is empty
+    free_streak: tuple[int, date, date] | None
+
+
+def _note_factory(cursor, row) -> Note:
+    dt = _datetime.fromtimestamp(row[3], NOTES_TZ)
+    return Note(row[0], row[1], row[2], dt, dt.weekday())
+
+
+class _ConnectionPool:
+    """Long-lived SQLite connections living on worker threads.
+
+    A single writer connection is served by a one-thread executor, so writes
+    are serialized without fighting for the SQLite lock. Reads go through a
+    small pool of connections; WAL mode lets them run alongside the writer.
+
+    Small writes can also go through write_batched(): an asyncio task groups calls
+    queued within WRITE_BATCH_WINDOW into one transaction on the same writer.
+    """
+
+    def __init__(self, path: str, readers: int):
+        self.path = path
+        self._writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._reader_executor = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._writer = self._connect()
+        self._writer.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        self._readers = queue.SimpleQueue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+        self._batch_loop = None
+        self._batch_queue: asyncio.Queue | None = None
+        self._batch_task: asyncio.Task | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _write(self, fn, *args):
+        try:
+            result = fn(self._writer, *args)
+            self._writer.commit()
+            return result
+        except Exception:
+            self._writer.rollback()
+            raise
+
+    def _write_batch(self, calls):
+        """Runs (fn, args) calls in one transaction. Each call is wrapped in a savepoint, so a failing
+        call is rolled back alone. Returns (ok, result or exception) per call after the commit."""
+        conn = self._writer
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args in calls:
+                conn.execute("SAVEPOINT batch_item")
+                try:
+                    results.append((True, fn(conn, *args)))
+                except Exception as err:
+                    conn.execute("ROLLBACK TO batch_item")
+                    results.append((False, err))
+                conn.execute("RELEASE batch_item")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return results
+
+    async def _batch_writer(self, calls: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await calls.get()]
+            # Короткое окно, чтобы к первой записи присоединились одновременные
+            if WRITE_BATCH_WINDOW > 0 and calls.qsize() + 1 < WRITE_BATCH_MAX:
+                await asyncio.sleep(WRITE_BATCH_WINDOW)
+            while len(batch) < WRITE_BATCH_MAX and not calls.empty():
+                batch.append(calls.get_nowait())
+            db_batch_size.observe(len(batch))
+            try:
+                results = await loop.run_in_executor(self._writer_executor, self._write_batch,
+                                                     [(fn, args) for fn, args, _ in batch])
+            except Exception as err:
+                results = [(False, err)] * len(batch)
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue  # вызывающий отменён, запись уже сделана
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _read(self, fn, *args):
+        conn = self._readers.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._readers.put(conn)
+
+    async def write(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with db_seconds.time(fn.__name__.lstrip("_")):
+            return await loop.run_in_executor(self._writer_executor, self._write, fn, *args)
+
+    async def write_batched(self, fn, *args):
+        """Like write(), but shares a transaction with other calls queued within the flush window.
+        Returns after the batch has been committed."""
+        loop = asyncio.get_running_loop()
+        if self._batch_loop is not loop:
+            # Первый вызов в этом event loop (тесты и бенчмарки запускают несколько loop подряд)
+            self._batch_loop = loop
+            self._batch_queue = asyncio.Queue()
+            self._batch_task = loop.create_task(self._batch_writer(self._batch_queue))
+        future = loop.create_future()
+        self._batch_queue.put_nowait((fn, args, future))
+        with db_seconds.time(fn.__name__.lstrip("_")):
+            return await future
+
+    async def read(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        with db_seconds.time(fn.__name__.lstrip("_")):
+            return await loop.run_in_executor(self._reader_executor, self._read, fn, *args)
+
+    def close(self):
+        if self._batch_task is not None:
+            self._batch_task.cancel()
+        self._writer_executor.shutdown(wait=True)
+        self._reader_executor.shutdown(wait=True)
+        self._writer.close()
+        while not self._readers.empty():
+            self._readers.get().close()
+
+
+_pool: _ConnectionPool | None = None
+
+# Версия данных пользователя: растёт при каждом изменении его заметок (для кэшей)
+_versions: dict[int, int] = {}
+
+
+def data_version(user_id) -> int:
+    """Returns the in-process data version of a user's notes."""
+    return _versions.get(user_id, 0)
+
+
+# Готовая статистика: ключ включает версию данных, устаревшие записи вытесняются по мере заполнения
+STATS_CACHE_SIZE = 1024
+_stats_cache: dict[tuple, "Stats"] = {}
+
+
+def _bump_version(user_id):
+    _versions[user_id] = _versions.get(user_id, 0) + 1
+
+
+def _get_pool() -> _ConnectionPool:
+    global _pool
+    if _pool is None:
+        _pool = _ConnectionPool(DB_PATH, DB_READERS)
+    return _pool
+
+
+def legacy_to_ts(value: str) -> int:
+    """Converts a legacy '%d.%m.%Y %H:%M' string (NOTES_TZ) to a UTC epoch."""
+    # Формат фиксированной ширины: срезы вместо strptime (заметно на импорте и пересчётах)
+    return int(_datetime(int(value[6:10]), int(value[3:5]), int(value[0:2]), int(value[11:13]), int(value[14:16]),
+                         tzinfo=NOTES_TZ).timestamp())
+
+
+def _migrate_ts_column(conn):
+    """v1: sortable UTC epoch column `ts` backfilled from the legacy string + (user_id, ts) index."""
+    conn.execute("ALTER TABLE notes ADD COLUMN ts INTEGER")
+    conn.execute('''
+        UPDATE notes SET ts = CAST(strftime('%s',
+            substr(datetime, 7, 4) || '-' || substr(datetime, 4, 2) || '-' || substr(datetime, 1, 2)
+            || ' ' || substr(datetime, 12, 5)) AS INTEGER) - ?
+    ''', (int(NOTES_TZ.utcoffset(None).total_seconds()),))
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_user_ts ON notes(user_id, ts)")
+
+
+def _migrate_calendar_index(conn):
+    """v2: per-user calendar index with note counts per local (year, month, day)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS note_days (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year, month, day)
+        ) WITHOUT ROWID
+    ''')
+    _rebuild_calendar(conn)
+
+
+def _rebuild_calendar(conn):
+    conn.execute("DELETE FROM note_days")
+    conn.execute('''
+        INSERT INTO note_days (user_id, year, month, day, count)
+        SELECT user_id, CAST(substr(datetime, 7, 4) AS INTEGER), CAST(substr(datetime, 4, 2) AS INTEGER),
+               CAST(substr(datetime, 1, 2) AS INTEGER), COUNT(*)
+        FROM notes GROUP BY 1, 2, 3, 4
+    ''')
+
+
+def _migrate_stats(conn):
+    """v3: per-user strength histogram by local (year, month) for /stats."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS note_stats (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            strength INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year, month, strength)
+        ) WITHOUT ROWID
+    ''')
+    _rebuild_stats(conn)
+
+
+def _rebuild_stats(conn):
+    conn.execute("DELETE FROM note_stats")
+    conn.execute('''
+        INSERT INTO note_stats (user_id, year, month, strength, count)
+        SELECT user_id, CAST(substr(datetime, 7, 4) AS INTEGER), CAST(substr(datetime, 4, 2) AS INTEGER), strength, COUNT(*)
+        FROM notes GROUP BY 1, 2, 3, 4
+    ''')
+
+
+# Текст для полнотекстового индекса: unicode61 приводит регистр и снимает диакритику, но «ё» и «е» для него
+# разные буквы. Тот же вид получает запрос (search.normalize)
+_SEARCH_TEXT = "replace(replace({0}.text, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _migrate_search(conn):
+    """v4: FTS5 index over note comments kept in sync with `notes` by triggers."""
+    # Внешнее содержимое: текст не дублируется, индекс хранит только токены и префиксы до 6 букв
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+            text, user_id, content='notes', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6'
+        )
+    ''')
+    insert = f"INSERT INTO notes_fts (rowid, text, user_id) VALUES (new.id, {_SEARCH_TEXT.format('new')}, new.user_id);"
+    # Удаление из индекса с внешним содержимым требует тех же значений, что были вставлены
+    delete = (f"INSERT INTO notes_fts (notes_fts, rowid, text, user_id) "
+              f"VALUES ('delete', old.id, {_SEARCH_TEXT.format('old')}, old.user_id);")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN {delete} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE OF text, user_id ON notes "
+                 f"BEGIN {delete} {insert} END")
+    _rebuild_search(conn)
+
+
+def _rebuild_search(conn):
+    # 'rebuild' читал бы текст из notes как есть, без замены «ё»
+    conn.execute("INSERT INTO notes_fts (notes_fts) VALUES ('delete-all')")
+    conn.execute(f"INSERT INTO notes_fts (rowid, text, user_id) SELECT id, {_SEARCH_TEXT.format('notes')}, user_id FROM notes")
+
+
+def _migrate_reminders(conn):
+    """v5: reminder opt-ins and pending reminders (one row per user and kind) for the scheduler."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_settings (
+            user_id INTEGER PRIMARY KEY,
+            daily_minute INTEGER,
+            followup INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            user_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            due_ts INTEGER NOT NULL,
+            PRIMARY KEY (user_id, kind)
+        ) WITHOUT ROWID
+    ''')
+    # Планировщик читает окно ближайших напоминаний по времени
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(due_ts)")
+
+
+def rebuild_derived(conn):
+    """Recomputes every table derived from `notes` (after bulk inserts that bypass add_note)."""
+    _rebuild_calendar(conn)
+    _rebuild_stats(conn)
+    _rebuild_search(conn)
+
+
+# Миграции схемы по порядку; номер версии хранится в PRAGMA user_version
+MIGRATIONS = [
+    _migrate_ts_column,
+    _migrate_calendar_index,
+    _migrate_stats,
+    _migrate_search,
+    _migrate_reminders,
+]
+
+
+def _init_db(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS notes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
             strength INTEGER NOT NULL,
-            text TEXT NOT NULL, 
+            text TEXT NOT NULL,
             datetime TEXT NOT NULL
         )
     ''')
-    conn.commit()
-    conn.close()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        migration(conn)
+        conn.execute(f"PRAGMA user_version = {number}")
+
+
+def _legacy_ymd(value: str) -> tuple[int, int, int]:
+    return int(value[6:10]), int(value[3:5]), int(value[0:2])
+
+
+def _add_note(conn, user_id, strength, text, datetime):
+    cur = conn.execute("INSERT INTO notes (user_id, strength, text, datetime, ts) VALUES (?, ?, ?, ?, ?)",
+                       (user_id, strength, text, datetime, legacy_to_ts(datetime)))
+    _count_note(conn, user_id, strength, datetime, 1)
+    return cur.lastrowid
 
-def add_note(user_id, strength, text, datetime):
-    """Adds a note to the database for a given user."""
-    conn = sqlite3.connect('notes.db')
-    cur = conn.cursor()
-    cur.execute("INSERT INTO notes (user_id, strength, text, datetime) VALUES (?, ?, ?, ?)", (user_id, strength, text, datetime))
-    conn.commit()
-    conn.close()
 
-def get_notes(user_id):
-    """Retrieves all notes for a given user."""
-    conn = sqlite3.connect('notes.db')
+_UPSERT_DAY = '''
+    INSERT INTO note_days (user_id, year, month, day, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, year, month, day) DO UPDATE SET count = count + excluded.count
+'''
+_UPSERT_STATS = '''
+    INSERT INTO note_stats (user_id, year, month, strength, count) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, year, month, strength) DO UPDATE SET count = count + excluded.count
+'''
+
+
+def _count_note(conn, user_id, strength, datetime, delta):
+    """Applies +1/-1 for one note to the calendar index and the stats aggregates."""
+    y, m, d = _legacy_ymd(datetime)
+    conn.execute(_UPSERT_DAY, (user_id, y, m, d, delta))
+    conn.execute(_UPSERT_STATS, (user_id, y, m, strength, delta))
+    if delta < 0:
+        conn.execute("DELETE FROM note_days WHERE user_id = ? AND year = ? AND month = ? AND day = ? AND count <= 0",
+                     (user_id, y, m, d))
+        conn.execute("DELETE FROM note_stats WHERE user_id = ? AND year = ? AND month = ? AND strength = ? AND count <= 0",
+                     (user_id, y, m, strength))
+
+
+def _import_notes(conn, user_id, rows):
+    """Inserts a chunk of (strength, text, datetime) rows with executemany and updates the aggregates
+    in the same transaction. Rows matching an existing note of the user (same time, strength and text)
+    or an earlier row of the chunk are skipped. Returns the number of inserted notes."""
+    keyed = [(legacy_to_ts(dt), strength, text, dt) for strength, text, dt in rows]
+    if not keyed:
+        return 0
+    low = min(row[0] for row in keyed)
+    high = max(row[0] for row in keyed)
+    seen = set(conn.execute("SELECT ts, strength, text FROM notes WHERE user_id = ? AND ts BETWEEN ? AND ?",
+                            (user_id, low, high)))
+    new = []
+    days = Counter()
+    stats = Counter()
+    for ts, strength, text, dt in keyed:
+        if (ts, strength, text) in seen:
+            continue
+        seen.add((ts, strength, text))
+        new.append((user_id, strength, text, dt, ts))
+        y, m, d = _legacy_ymd(dt)
+        days[y, m, d] += 1
+        stats[y, m, strength] += 1
+    conn.executemany("INSERT INTO notes (user_id, strength, text, datetime, ts) VALUES (?, ?, ?, ?, ?)", new)
+    conn.executemany(_UPSERT_DAY, [(user_id, *key, count) for key, count in days.items()])
+    conn.executemany(_UPSERT_STATS, [(user_id, *key, count) for key, count in stats.items()])
+    return len(new)
+
+
+def _get_notes(conn, user_id):
+    return list(iter_notes(conn, user_id))
+
+
+def to_ts(value) -> int:
+    """Converts an aware datetime (naive ones are treated as NOTES_TZ) to a UTC epoch."""
+    return int((value if value.tzinfo else value.replace(tzinfo=NOTES_TZ)).timestamp())
+
+
+def connect_readonly(path=None) -> sqlite3.Connection:
+    """Opens a read-only connection, e.g. for export worker processes."""
+    return sqlite3.connect(f"{Path(path or DB_PATH).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+
+
+def iter_notes(conn, user_id, start_ts=None, end_ts=None, batch_size=500):
+    """Streams a user's notes ordered by time straight from a cursor, batch_size rows at a time.
+    Bounds are UTC epochs (start inclusive, end exclusive); None means unbounded."""
+    query = "SELECT id, strength, text, ts FROM notes WHERE user_id = ?"
+    params = [user_id]
+    if start_ts is not None:
+        query += " AND ts >= ?"
+        params.append(start_ts)
+    if end_ts is not None:
+        query += " AND ts < ?"
+        params.append(end_ts)
     cur = conn.cursor()
-    cur.execute("SELECT id, strength, text, datetime FROM notes WHERE user_id = ?", (user_id,))
-    notes = cur.fetchall()
-    conn.close()
-    return notes
-
-def delete_note(note_id):
-    """Deletes a note by its ID."""
-    conn = sqlite3.connect('notes.db')
+    cur.row_factory = _note_factory
+    cur.execute(query + " ORDER BY ts, id", params)
+    while rows := cur.fetchmany(batch_size):
+        yield from rows
+
+
+def _get_notes_between(conn, user_id, start_ts, end_ts):
+    return list(iter_notes(conn, user_id, start_ts, end_ts))
+
+
+def _get_calendar(conn, user_id, year=None, month=None):
+    query = "SELECT year, month, day, count FROM note_days WHERE user_id = ?"
+    params = [user_id]
+    if year is not None:
+        query += " AND year = ?"
+        params.append(year)
+        if month is not None:
+            query += " AND month = ?"
+            params.append(month)
+    calendar = {}
+    for y, m, d, count in conn.execute(query + " ORDER BY year, month, day", params):
+        calendar.setdefault(y, {}).setdefault(m, {})[d] = count
+    return calendar
+
+
+def _search_notes(conn, user_id, terms, min_strength, max_strength, start_ts, end_ts, limit, offset):
+    notes_filter = ""
+    params = []
+    for condition, value in (("n.strength >= ?", min_strength), ("n.strength <= ?", max_strength),
+                             ("n.ts >= ?", start_ts), ("n.ts < ?", end_ts)):
+        if value is not None:
+            notes_filter += " AND " + condition
+            params.append(value)
+    if terms:
+        # Все слова запроса — префиксы в комментарии; столбец user_id ограничивает поиск заметками пользователя
+        phrases = " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+        match = f'user_id : "{int(user_id)}" AND text : ({phrases})'
+        # CROSS JOIN фиксирует порядок: иначе планировщик идёт по индексу notes и проверяет MATCH на каждой строке
+        source = "notes_fts f CROSS JOIN notes n ON n.id = f.rowid WHERE notes_fts MATCH ? AND n.user_id = ?"
+        # Вес 0 у user_id: ранжирует только совпадение в тексте
+        order = "bm25(notes_fts, 1.0, 0.0), n.ts DESC"
+        params = [match, user_id, *params]
+    else:
+        source = "notes n WHERE n.user_id = ?"
+        order = "n.ts DESC"
+        params = [user_id, *params]
+    total = conn.execute(f"SELECT COUNT(*) FROM {source}{notes_filter}", params).fetchone()[0]
     cur = conn.cursor()
-    cur.execute("DELETE FROM notes WHERE id = ?", (note_id,))
-    conn.commit()
-    conn.close()
+    cur.row_factory = _note_factory
+    cur.execute(f"SELECT n.id, n.strength, n.text, n.ts FROM {source}{notes_filter} ORDER BY {order} LIMIT ? OFFSET ?",
+                [*params, limit, offset])
+    return total, cur.fetchall()
+
+
+def _get_reminder_settings(conn, user_id) -> ReminderSettings:
+    row = conn.execute("SELECT daily_minute, followup FROM reminder_settings WHERE user_id = ?", (user_id,)).fetchone()
+    return ReminderSettings(row[0], bool(row[1])) if row else ReminderSettings(None, False)
+
+
+def _drop_empty_settings(conn, user_id):
+    conn.execute("DELETE FROM reminder_settings WHERE user_id = ? AND daily_minute IS NULL AND followup = 0", (user_id,))
+
+
+def _set_daily_reminder(conn, user_id, minute, due_ts):
+    conn.execute("INSERT INTO reminder_settings (user_id, daily_minute) VALUES (?, ?) "
+                 "ON CONFLICT (user_id) DO UPDATE SET daily_minute = excluded.daily_minute", (user_id, minute))
+    if minute is None:
+        conn.execute("DELETE FROM reminders WHERE user_id = ? AND kind = 'daily'", (user_id,))
+        _drop_empty_settings(conn, user_id)
+    else:
+        conn.execute("INSERT INTO reminders (user_id, kind, due_ts) VALUES (?, 'daily', ?) "
+                     "ON CONFLICT (user_id, kind) DO UPDATE SET due_ts = excluded.due_ts", (user_id, due_ts))
+
+
+def _set_followup_reminders(conn, user_id, enabled):
+    conn.execute("INSERT INTO reminder_settings (user_id, followup) VALUES (?, ?) "
+                 "ON CONFLICT (user_id) DO UPDATE SET followup = excluded.followup", (user_id, int(enabled)))
+    if not enabled:
+        conn.execute("DELETE FROM reminders WHERE user_id = ? AND kind = 'followup'", (user_id,))
+        _drop_empty_settings(conn, user_id)
+
+
+def _schedule_followup(conn, user_id, due_ts):
+    # Одним запросом: вставка состоится, только если пользователь включил такие напоминания
+    cur = conn.execute("INSERT INTO reminders (user_id, kind, due_ts) "
+                       "SELECT user_id, 'followup', ? FROM reminder_settings WHERE user_id = ? AND followup = 1 "
+                       "ON CONFLICT (user_id, kind) DO UPDATE SET due_ts = excluded.due_ts", (due_ts, user_id))
+    return cur.rowcount > 0
+
+
+def _load_reminders(conn, after, end_ts, shard, workers, limit):
+    return conn.execute(
+        "SELECT due_ts, user_id, kind FROM reminders WHERE (due_ts, user_id, kind) > (?, ?, ?) AND due_ts < ? "
+        "AND user_id % ? = ? ORDER BY due_ts, user_id, kind LIMIT ?", (*after, end_ts, workers, shard, limit)).fetchall()
+
+
+def _advance_reminder(conn, user_id, kind, due_ts, next_ts):
+    # Условие по due_ts: если напоминание успели перенастроить, срабатывание не засчитывается
+    if next_ts is None:
+        cur = conn.execute("DELETE FROM reminders WHERE user_id = ? AND kind = ? AND due_ts = ?", (user_id, kind, due_ts))
+    else:
+        cur = conn.execute("UPDATE reminders SET due_ts = ? WHERE user_id = ? AND kind = ? AND due_ts = ?",
+                           (next_ts, user_id, kind, due_ts))
+    return cur.rowcount > 0
+
+
+def _skip_stale_reminders(conn, before_ts, now_ts, shard, workers):
+    day = 86400
+    daily = conn.execute("UPDATE reminders SET due_ts = due_ts + ? * ((? - due_ts) / ? + 1) "
+                         "WHERE due_ts < ? AND kind = 'daily' AND user_id % ? = ?",
+                         (day, now_ts, day, before_ts, workers, shard)).rowcount
+    other = conn.execute("DELETE FROM reminders WHERE due_ts < ? AND kind != 'daily' AND user_id % ? = ?",
+                         (before_ts, workers, shard)).rowcount
+    return daily + other
+
+
+def _delete_reminders(conn, user_id):
+    conn.execute("DELETE FROM reminders WHERE user_id = ?", (user_id,))
+    conn.execute("DELETE FROM reminder_settings WHERE user_id = ?", (user_id,))
+
+
+def _delete_note(conn, note_id):
+    row = conn.execute("SELECT user_id, strength, datetime FROM notes WHERE id = ?", (note_id,)).fetchone()
+    if row is None:
+        return None
+    conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+    _count_note(conn, row[0], row[1], row[2], -1)
+    return row[0]
+
+
+def _period_filter(year, month) -> tuple[str, list]:
+    if year is None:
+        return "", []
+    if month is None:
+        return " AND year = ?", [year]
+    return " AND year = ? AND month = ?", [year, month]
+
+
+def _get_stats(conn, user_id, year, month, today: date) -> Stats:
+    """Reads only the aggregates: the cost grows with the number of months and of days
+    with notes in the period, not with the number of notes."""
+    where, params = _period_filter(year, month)
+    params = [user_id, *params]
+    months = [(y, m, c, s / c, mx) for y, m, c, s, mx in conn.execute(
+        f"SELECT year, month, SUM(count), SUM(strength * count), MAX(strength) FROM note_stats "
+        f"WHERE user_id = ?{where} GROUP BY year, month ORDER BY year, month", params)]
+    count = sum(row[2] for row in months)
+    total = sum(row[2] * row[3] for row in months)
+    weekdays = [0] * 7
+    days = []
+    for y, m, d, c in conn.execute(
+            f"SELECT year, month, day, count FROM note_days WHERE user_id = ?{where} ORDER BY year, month, day", params):
+        day = date(y, m, d)
+        weekdays[day.weekday()] += c
+        days.append(day)
+
+    # Период, внутри которого ищется самый длинный промежуток без записей
+    if year is None:
+        start, end = (days[0], today) if days else (None, None)
+    elif month is None:
+        start, end = date(year, 1, 1), min(date(year, 12, 31), today)
+    else:
+        start = date(year, month, 1)
+        end = min(date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1), today)
+    free_streak = None
+    if start is not None and start <= end:
+        best = (0, start, start)
+        previous = start - timedelta(days=1)
+        for day in [*days, end + timedelta(days=1)]:
+            gap = (day - previous).days - 1
+            if gap > best[0]:
+                best = (gap, previous + timedelta(days=1), day - timedelta(days=1))
+            previous = day
+        free_streak = best
+    return Stats(count, len(days), total / count if count else None, max((row[4] for row in months), default=None),
+                 months, weekdays, free_streak)
+
+
+async def init_db():
+    """Initializes the database, creates the notes table and applies pending migrations."""
+    await _get_pool().write(_init_db)
+
+
+async def add_note(user_id, strength, text, datetime):
+    """Adds a note to the database for a given user. Concurrent calls are committed in one transaction."""
+    note_id = await _get_pool().write_batched(_add_note, user_id, strength, text, datetime)
+    _bump_version(user_id)
+    return note_id
+
+
+async def import_notes(user_id, rows):
+    """Imports a chunk of (strength, text, datetime) rows for a user in one transaction, skipping duplicates.
+    Returns the number of notes added."""
+    added = await _get_pool().write(_import_notes, user_id, rows)
+    if added:
+        _bump_version(user_id)
+    return added
+
+
+async def get_notes(user_id):
+    """Retrieves all notes for a given user as Note records, ordered by time."""
+    return await _get_pool().read(_get_notes, user_id)
+
+
+async def get_notes_between(user_id, start, end):
+    """Retrieves a user's notes (Note records) with start <= time < end, ordered by time.
+    start/end are timezone-aware datetimes (naive ones are treated as NOTES_TZ)."""
+    return await _get_pool().read(_get_notes_between, user_id, to_ts(start), to_ts(end))
+
+
+async def get_calendar(user_id, year=None, month=None):
+    """Returns the user's calendar index {year: {month: {day: count}}} without reading note text.
+    Optionally narrowed to one year or one month of a year."""
+    return await _get_pool().read(_get_calendar, user_id, year, month)
+
+
+async def search_notes(user_id, terms, min_strength=None, max_strength=None, start=None, end=None, limit=10, offset=0):
+    """Full-text search over a user's note comments. terms are normalized words matched as prefixes,
+    all of them must occur; results are ranked by bm25. Without terms only the filters apply and
+    the newest notes come first. strength bounds are inclusive, start <= time < end (aware datetimes).
+    Returns (total number of matches, list of Note records for the requested page)."""
+    start_ts = to_ts(start) if start is not None else None
+    end_ts = to_ts(end) if end is not None else None
+    return await _get_pool().read(_search_notes, user_id, list(terms), min_strength, max_strength,
+                                  start_ts, end_ts, limit, offset)
+
+
+async def delete_note(note_id):
+    """Deletes a note by its ID. Returns the owner's user_id or None if there was no such note."""
+    user_id = await _get_pool().write_batched(_delete_note, note_id)
+    if user_id is not None:
+        _bump_version(user_id)
+    return user_id
+
+
+async def get_reminder_settings(user_id):
+    """Returns the user's ReminderSettings (everything off if the user never opted in)."""
+    return await _get_pool().read(_get_reminder_settings, user_id)
+
+
+async def set_daily_reminder(user_id, minute, due_ts=None):
+    """Turns the daily check-in on at `minute` (after local midnight) with the first one due at due_ts,
+    or off when minute is None."""
+    await _get_pool().write_batched(_set_daily_reminder, user_id, minute, due_ts)
+
+
+async def set_followup_reminders(user_id, enabled):
+    """Opts the user in or out of follow-ups after strong attacks; opting out drops a pending one."""
+    await _get_pool().write_batched(_set_followup_reminders, user_id, enabled)
+
+
+async def schedule_followup(user_id, due_ts):
+    """Schedules (or moves) the user's follow-up to due_ts if they opted in. Returns whether it was scheduled."""
+    return await _get_pool().write_batched(_schedule_followup, user_id, due_ts)
+
+
+async def load_reminders(after, end_ts, shard=0, workers=1, limit=10000):
+    """Returns up to `limit` pending reminders as (due_ts, user_id, kind), ordered by that key, with
+    key > after and due_ts < end_ts. Only users with user_id % workers == shard are included."""
+    return await _get_pool().read(_load_reminders, tuple(after), end_ts, shard, workers, limit)
+
+
+async def advance_reminder(user_id, kind, due_ts, next_ts):
+    """Marks a reminder due at due_ts as fired: moves it to next_ts or deletes it when next_ts is None.
+    Returns False if the reminder was changed or removed in the meantime."""
+    return await _get_pool().write_batched(_advance_reminder, user_id, kind, due_ts, next_ts)
+
+
+async def skip_stale_reminders(before_ts, now_ts, shard=0, workers=1):
+    """Drops reminders due before before_ts without firing them (e.g. after downtime): daily ones move
+    to their next occurrence after now_ts, others are deleted. Returns the number of reminders skipped."""
+    return await _get_pool().write(_skip_stale_reminders, before_ts, now_ts, shard, workers)
+
+
+async def delete_reminders(user_id):
+    """Removes all reminder settings and pending reminders of a user."""
+    await _get_pool().write_batched(_delete_reminders, user_id)
+
+
+async def get_stats(user_id, year=None, month=None):
+    """Returns Stats for all time, a year or a month of a year, read from aggregate tables only,
+    so the cost does not depend on the number of notes. Results are cached until the user's data changes."""
+    today = _datetime.now(NOTES_TZ).date()
+    key = (user_id, year, month, data_version(user_id), today)
+    stats = _stats_cache.get(key)
+    if stats is None:
+        stats = await _get_pool().read(_get_stats, user_id, year, month, today)
+        if len(_stats_cache) >= STATS_CACHE_SIZE:
+            _stats_cache.pop(next(iter(_stats_cache)))
+        _stats_cache[key] = stats
+    return stats
+
+
+def close_db():
+    """Closes the pooled connections. Call on shutdown."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
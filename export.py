@@ -0,0 +1,359 @@
+import asyncio
+import calendar
+import functools
+import io
+import itertools
+import multiprocessing
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from database import connect_readonly, iter_notes
+from metrics import export_bytes, export_seconds
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    HAS_REPORTLAB = True
+except ImportError:
+    HAS_REPORTLAB = False
+
+# Растровый бэкенд reportlab для графиков: rlPyCairo (по умолчанию в reportlab 4) или rl_renderPM
+RENDERPM_BACKEND = None
+if HAS_REPORTLAB:
+    from reportlab.graphics import renderPM
+    from reportlab.graphics.charts.lineplots import LinePlot
+    from reportlab.graphics.shapes import Drawing, Rect, String
+    from reportlab.lib import colors
+    for _module, _backend in (("rlPyCairo", "rlPyCairo"), ("_rl_renderPM", "_renderPM")):
+        try:
+            __import__(_module)
+            RENDERPM_BACKEND = _backend
+            break
+        except ImportError:
+            pass
+HAS_RENDERPM = RENDERPM_BACKEND is not None
+
+# Число процессов для рендеринга экспорта
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+# Лимит суммарного размера кэша готовых файлов экспорта
+EXPORT_CACHE_BYTES = int(os.getenv("EXPORT_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+WEEKDAY_ABBR_RU = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+
+def export_lines(header: list[str], notes):
+    """Строки экспорта: заголовок и блок на каждую заметку (database.Note)."""
+    yield from header
+    for note in notes:
+        yield f"ID: {note.id}"
+        yield f"Дата: {note.dt:%d.%m.%Y %H:%M} ({WEEKDAY_ABBR_RU[note.weekday]})"
+        yield f"Сила: {note.strength}"
+        yield f"Комментарий: {note.text}"
+        yield ""
+
+
+FONTS_DIR = Path(__file__).parent / 'fonts'
+# Встроенное семейство шрифтов с кириллицей: имя шрифта -> файл в fonts/
+BUNDLED_FONTS = {
+    'times': 'times.ttf',
+    'timesbd': 'timesbd.ttf',
+    'timesi': 'timesi.ttf',
+    'timesbi': 'timesbi.ttf',
+    'arial': 'arial.ttf',
+}
+SYSTEM_FONT_PATHS = [
+    'C:/Windows/Fonts/arial.ttf',
+    'C:/Windows/Fonts/segoeui.ttf',
+    'C:/Windows/Fonts/tahoma.ttf',
+    'C:/Windows/Fonts/verdana.ttf',
+    'C:/Windows/Fonts/calibri.ttf',
+    'C:/Windows/Fonts/times.ttf',
+    'C:/Windows/Fonts/DejaVuSans.ttf',
+]
+SYSTEM_FONT_DIRS = ['/usr/share/fonts', '/usr/local/share/fonts', '~/.local/share/fonts', '~/.fonts']
+SYSTEM_FONT_FILES = ['DejaVuSans.ttf', 'LiberationSans-Regular.ttf', 'LiberationSerif-Regular.ttf', 'FreeSans.ttf', 'NotoSans-Regular.ttf']
+
+
+def find_cyr_font():
+    """Ищет системный ttf шрифт с поддержкой кириллицы (Windows, затем типичные каталоги Linux).
+    Возвращает (name, path) или None."""
+    for p in SYSTEM_FONT_PATHS:
+        if os.path.exists(p):
+            return Path(p).stem.replace(' ', '_'), p
+    for root in SYSTEM_FONT_DIRS:
+        root = os.path.expanduser(root)
+        if not os.path.isdir(root):
+            continue
+        for dirpath, _, filenames in os.walk(root):
+            for filename in SYSTEM_FONT_FILES:
+                if filename in filenames:
+                    return Path(filename).stem.replace(' ', '_'), os.path.join(dirpath, filename)
+    return None
+
+
+@functools.cache
+def pdf_font() -> str:
+    """Один раз на процесс находит и регистрирует шрифты, возвращает имя основного.
+    Повторные вызовы не обращаются к файловой системе."""
+    registered = []
+    for name, filename in BUNDLED_FONTS.items():
+        path = FONTS_DIR / filename
+        if not path.exists():
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(name, str(path)))
+            registered.append(name)
+        except Exception:
+            pass
+    if {'times', 'timesbd', 'timesi', 'timesbi'} <= set(registered):
+        pdfmetrics.registerFontFamily('times', normal='times', bold='timesbd', italic='timesi', boldItalic='timesbi')
+    if registered:
+        return 'times' if 'times' in registered else registered[0]
+    font_info = find_cyr_font()
+    if font_info:
+        try:
+            pdfmetrics.registerFont(TTFont(font_info[0], font_info[1]))
+            return font_info[0]
+        except Exception:
+            pass
+    return 'Helvetica'
+
+
+def render_txt(lines) -> bytes:
+    buf = io.BytesIO()
+    for i, line in enumerate(lines):
+        if i:
+            buf.write(b"\n")
+        buf.write(line.encode("utf-8"))
+    return buf.getvalue()
+
+
+def render_pdf(lines) -> bytes:
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=A4)
+    width, height = A4
+    y = height - 40
+    max_chars = 100
+    font_name = pdf_font()
+    c.setFont(font_name, 11)
+    for line in lines:
+        # перенос длинных строк
+        parts = [line[i:i+max_chars] for i in range(0, len(line), max_chars)] or ['']
+        for part in parts:
+            if y < 50:
+                c.showPage(); y = height - 40
+                c.setFont(font_name, 11)
+            c.drawString(40, y, part)
+            y -= 14
+    c.save()
+    return buf.getvalue()
+
+
+# Картинка месяца: календарная сетка (цвет дня — максимальная сила) и график силы по времени
+CHART_WIDTH, CHART_HEIGHT = 560, 520
+CHART_DPI = 144
+CELL_W, CELL_H = 64, 34
+CHART_EMPTY = "#eeeeee"
+CHART_LOW, CHART_HIGH = "#ffe9a0", "#a50026"
+
+
+def strength_color(strength: int):
+    return colors.linearlyInterpolatedColor(colors.HexColor(CHART_LOW), colors.HexColor(CHART_HIGH), 1, 10, strength)
+
+
+def month_chart_drawing(title: str, year: int, month: int, notes) -> "Drawing":
+    """Рисунок месяца по заметкам (database.Note, по времени)."""
+    font = pdf_font()
+    days_in_month = calendar.monthrange(year, month)[1]
+    day_max = {}
+    points = []
+    for note in notes:
+        day = note.dt.day
+        day_max[day] = max(day_max.get(day, 0), note.strength)
+        points.append((day + (note.dt.hour * 60 + note.dt.minute) / 1440, note.strength))
+
+    d = Drawing(CHART_WIDTH, CHART_HEIGHT)
+    d.add(Rect(0, 0, CHART_WIDTH, CHART_HEIGHT, fillColor=colors.white, strokeColor=None))
+    d.add(String(CHART_WIDTH / 2, CHART_HEIGHT - 30, title, fontName=font, fontSize=16, textAnchor="middle"))
+
+    # Календарь: строки — недели с понедельника
+    left = (CHART_WIDTH - 7 * CELL_W) / 2
+    top = CHART_HEIGHT - 50
+    for i, abbr in enumerate(WEEKDAY_ABBR_RU):
+        d.add(String(left + i * CELL_W + CELL_W / 2, top - 12, abbr, fontName=font, fontSize=10, textAnchor="middle"))
+    top -= 18
+    for row, week in enumerate(calendar.monthcalendar(year, month)):
+        for col, day in enumerate(week):
+            if not day:
+                continue
+            x, y = left + col * CELL_W, top - (row + 1) * CELL_H
+            strength = day_max.get(day)
+            fill = strength_color(strength) if strength else colors.HexColor(CHART_EMPTY)
+            d.add(Rect(x + 1, y + 1, CELL_W - 2, CELL_H - 2, fillColor=fill, strokeColor=None))
+            ink = colors.white if strength and strength >= 6 else colors.black
+            d.add(String(x + 5, y + CELL_H - 12, str(day), fontName=font, fontSize=8, fillColor=ink))
+            if strength:
+                d.add(String(x + CELL_W / 2, y + 7, str(strength), fontName=font, fontSize=13,
+                             fillColor=ink, textAnchor="middle"))
+
+    # Шкала цветов
+    legend_y = 205
+    step = 7 * CELL_W / 10
+    for s in range(1, 11):
+        d.add(Rect(left + (s - 1) * step, legend_y, step, 10, fillColor=strength_color(s), strokeColor=None))
+        d.add(String(left + (s - 0.5) * step, legend_y - 10, str(s), fontName=font, fontSize=7, textAnchor="middle"))
+
+    # Сила по времени: x — день месяца с долей суток
+    plot = LinePlot()
+    plot.x, plot.y = 45, 35
+    plot.width, plot.height = CHART_WIDTH - 70, 140
+    plot.data = [points]
+    plot.lines[0].strokeColor = colors.HexColor(CHART_HIGH)
+    plot.lines[0].strokeWidth = 1.2
+    plot.joinedLines = True
+    plot.lineLabelFormat = None
+    plot.xValueAxis.valueMin, plot.xValueAxis.valueMax = 1, days_in_month + 1
+    plot.xValueAxis.valueSteps = [1, 5, 10, 15, 20, 25, days_in_month]
+    plot.yValueAxis.valueMin, plot.yValueAxis.valueMax = 0, 10
+    plot.yValueAxis.valueSteps = [0, 2, 4, 6, 8, 10]
+    plot.yValueAxis.visibleGrid = True
+    plot.yValueAxis.gridStrokeColor = colors.HexColor(CHART_EMPTY)
+    for axis in (plot.xValueAxis, plot.yValueAxis):
+        axis.labels.fontName = font
+        axis.labels.fontSize = 8
+    d.add(plot)
+    d.add(String(CHART_WIDTH / 2, 8, "день месяца", fontName=font, fontSize=8, textAnchor="middle"))
+    d.add(String(12, 35 + 70, "сила", fontName=font, fontSize=8, textAnchor="middle"))
+    return d
+
+
+def render_lines(fmt: str, lines) -> bytes:
+    if fmt == 'pdf':
+        return render_pdf(lines)
+    return render_txt(lines)
+
+
+# Соединение процесса пула с БД (только чтение), открывается один раз
+_worker_connection = functools.cache(connect_readonly)
+
+
+def render_export(fmt: str, header: list[str], db_path: str, user_id: int,
+                  start_ts: int | None = None, end_ts: int | None = None) -> bytes | None:
+    """Формирует файл экспорта ('txt' или 'pdf'). Выполняется в процессе пула:
+    строки читаются из курсора порциями и сразу пишутся в буфер. None — записей нет."""
+    notes = iter_notes(_worker_connection(db_path), user_id, start_ts, end_ts)
+    first = next(notes, None)
+    if first is None:
+        return None
+    return render_lines(fmt, export_lines(header, itertools.chain([first], notes)))
+
+
+def render_month_chart(title: str, db_path: str, user_id: int, year: int, month: int,
+                       start_ts: int, end_ts: int) -> bytes | None:
+    """PNG с картинкой месяца. Выполняется в процессе пула. None — записей нет."""
+    notes = list(iter_notes(_worker_connection(db_path), user_id, start_ts, end_ts))
+    if not notes:
+        return None
+    drawing = month_chart_drawing(title, year, month, notes)
+    return renderPM.drawToString(drawing, fmt="PNG", dpi=CHART_DPI, backend=RENDERPM_BACKEND)
+
+
+def _init_worker():
+    # Шрифты регистрируются при старте процесса пула, а не на первом экспорте
+    if HAS_REPORTLAB:
+        pdf_font()
+
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Не fork: у процесса бота уже работают потоки SQLite и event loop, блокировка, взятая
+        # одним из них в момент fork, навсегда осталась бы занятой в дочернем процессе
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, initializer=_init_worker,
+                                    mp_context=multiprocessing.get_context(method))
+    return _pool
+
+
+async def run_export(fmt: str, header: list[str], db_path: str, user_id: int,
+                     start_ts: int | None = None, end_ts: int | None = None) -> bytes | None:
+    """Рендерит экспорт в пуле процессов, не блокируя event loop."""
+    loop = asyncio.get_running_loop()
+    with export_seconds.time(fmt):
+        content = await loop.run_in_executor(_get_pool(), render_export, fmt, header, db_path, user_id, start_ts, end_ts)
+    if content is not None:
+        export_bytes.observe(len(content), fmt)
+    return content
+
+
+async def run_month_chart(title: str, db_path: str, user_id: int, year: int, month: int,
+                          start_ts: int, end_ts: int) -> bytes | None:
+    """Рендерит картинку месяца в том же пуле процессов, что и экспорт."""
+    loop = asyncio.get_running_loop()
+    with export_seconds.time("png"):
+        content = await loop.run_in_executor(_get_pool(), render_month_chart, title, db_path, user_id,
+                                             year, month, start_ts, end_ts)
+    if content is not None:
+        export_bytes.observe(len(content), "png")
+    return content
+
+
+def shutdown_export_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+class ExportCache:
+    """LRU-кэш готовых файлов экспорта, ограниченный суммарным размером в байтах.
+    Ключ включает версию данных пользователя, поэтому после записи старые файлы
+    просто перестают запрашиваться и вытесняются."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict[tuple, bytes] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        content = self._items.get(key)
+        if content is None:
+            self.misses += 1
+            return None
+        self._items.move_to_end(key)
+        self.hits += 1
+        return content
+
+    def put(self, key: tuple, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._size -= len(old)
+        self._items[key] = content
+        self._size += len(content)
+        while self._size > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+        self._size = 0
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "items": len(self._items), "bytes": self._size}
+
+
+export_cache = ExportCache(EXPORT_CACHE_BYTES)
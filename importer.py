@@ -0,0 +1,235 @@
+import asyncio
+import csv
+import itertools
+import json
+import math
+import os
+import re
+from datetime import datetime as _datetime
+from typing import NamedTuple
+
+from database import LEGACY_DATETIME_FORMAT, NOTES_TZ, import_notes
+
+# Строк на одну транзакцию импорта: между порциями проходят записи других пользователей
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "5000"))
+# Bot API отдаёт ботам файлы до 20 МБ
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(20 * 1024 * 1024)))
+# Сколько ошибок разбора показать пользователю
+IMPORT_SHOWN_ERRORS = 5
+
+FORMATS = {".txt": "txt", ".csv": "csv", ".json": "json", ".jsonl": "json"}
+
+# Названия полей CSV/JSON (без учёта регистра) -> поле записи
+FIELD_ALIASES = {
+    "datetime": "datetime", "date": "datetime", "time": "datetime", "дата": "datetime",
+    "strength": "strength", "сила": "strength", "сила боли": "strength",
+    "text": "text", "comment": "text", "комментарий": "text",
+}
+# Строки блока заметки в TXT (формат export_lines и текст просмотра в чате): "Поле: значение".
+# None — начало нового блока
+TXT_FIELDS = {"ID": None, "---id": None, "Дата": "datetime", "Сила боли": "strength", "Сила": "strength",
+              "Комментарий": "text"}
+# Основной формат проверяется без strptime — на больших файлах это большая часть разбора
+LEGACY_RE = re.compile(r"(\d{2})\.(\d{2})\.(\d{4}) (\d{2}):(\d{2})")
+DATETIME_FORMATS = ["%d.%m.%Y %H:%M:%S", "%d.%m.%Y"]
+
+
+class ImportRow(NamedTuple):
+    strength: int
+    text: str
+    datetime: str  # '%d.%m.%Y %H:%M' в NOTES_TZ, как в add_note
+
+
+class ImportReport:
+    """Счётчики импорта; обновляются по ходу чтения файла."""
+
+    def __init__(self):
+        self.read = 0
+        self.added = 0
+        self.invalid = 0
+        self.errors: list[str] = []
+
+    @property
+    def duplicates(self) -> int:
+        return self.read - self.invalid - self.added
+
+    def error(self, line: int, reason: str):
+        self.invalid += 1
+        if len(self.errors) < IMPORT_SHOWN_ERRORS:
+            self.errors.append(f"строка {line}: {reason}")
+
+
+def detect_format(filename: str) -> str | None:
+    return FORMATS.get(os.path.splitext(filename.lower())[1])
+
+
+def parse_datetime(value) -> str:
+    """Дата заметки из файла ('дд.мм.гггг чч:мм', ISO 8601, с поясом или без) -> строка в NOTES_TZ."""
+    value = str(value).strip()
+    # Хвост с днём недели из экспорта: "01.03.2025 14:30 (Сб)"
+    value = value.split(" (", 1)[0]
+    match = LEGACY_RE.fullmatch(value)
+    if match:
+        day, month, year, hour, minute = map(int, match.groups())
+        try:
+            _datetime(year, month, day, hour, minute)
+        except ValueError:
+            raise ValueError(f"несуществующая дата {value!r}") from None
+        return value
+    for fmt in DATETIME_FORMATS:
+        try:
+            return _datetime.strptime(value, fmt).strftime(LEGACY_DATETIME_FORMAT)
+        except ValueError:
+            pass
+    try:
+        dt = _datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"не удалось разобрать дату {value[:40]!r}") from None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(NOTES_TZ)
+    return dt.strftime(LEGACY_DATETIME_FORMAT)
+
+
+def parse_strength(value) -> int:
+    """Сила боли из файла: целое 1..10. Таблицы часто сохраняют числа как «7.0» или «7,0» — это тоже 7."""
+    if isinstance(value, bool):
+        raise ValueError(f"сила боли {value} — не число")
+    if isinstance(value, (int, float)):
+        number = value
+    else:
+        text = str(value).strip()
+        try:
+            number = float(text.replace(",", "."))
+        except ValueError:
+            raise ValueError(f"сила боли {text[:20]!r} — не число") from None
+    if not math.isfinite(number) or number != int(number):
+        raise ValueError(f"сила боли {value} — не целое число")
+    strength = int(number)
+    if not 1 <= strength <= 10:
+        raise ValueError(f"сила {strength} вне диапазона 1..10")
+    return strength
+
+
+def validate(line: int, record: dict, report: ImportReport) -> ImportRow | None:
+    report.read += 1
+    try:
+        if record.get("strength") in (None, ""):
+            raise ValueError("нет силы боли")
+        strength = parse_strength(record["strength"])
+        if record.get("datetime") in (None, ""):
+            raise ValueError("нет даты")
+        dt = parse_datetime(record["datetime"])
+    except (ValueError, TypeError) as err:
+        report.error(line, str(err))
+        return None
+    text = record.get("text")
+    return ImportRow(strength, "" if text is None else str(text).strip(), dt)
+
+
+def _normalize(record: dict) -> dict:
+    fields = {}
+    for key, value in record.items():
+        field = FIELD_ALIASES.get(str(key).strip().lower())
+        if field is not None:
+            fields[field] = value
+    return fields
+
+
+def parse_txt(lines):
+    """(номер строки, запись) из TXT экспорта: блоки "ID: ...", "Дата: ...", "Сила: ...", "Комментарий: ...".
+    Комментарий может продолжаться на следующих строках до начала нового блока."""
+    record = None
+    last = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        name, sep, value = line.partition(":")
+        if sep and name in TXT_FIELDS:
+            field = TXT_FIELDS[name]
+            if field is None:
+                if record is not None:
+                    yield record[0], record[1]
+                record, last = (number, {}), None
+            elif record is not None:
+                record[1][field] = value.strip()
+                last = field
+        elif record is not None and last == "text":
+            record[1]["text"] += "\n" + line
+    if record is not None:
+        yield record[0], record[1]
+
+
+def parse_csv(lines):
+    """(номер строки, запись) из CSV с заголовком; разделитель — запятая, точка с запятой или табуляция."""
+    header = next(lines, "")
+    delimiter = max(",;\t", key=header.count)
+    reader = csv.DictReader(itertools.chain([header], lines), delimiter=delimiter)
+    for row in reader:
+        yield reader.line_num, _normalize(row)
+
+
+def parse_json(stream, chunk_size: int = 64 * 1024):
+    """(номер записи, запись) из JSON-массива объектов или JSON Lines.
+    Файл читается порциями, в памяти только текущий кусок."""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    number = 0
+    eof = False
+    while True:
+        # Разделители между объектами: пробелы, запятые и скобки массива
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]":
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                return
+            buf, pos = stream.read(chunk_size), 0
+            eof = not buf
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            more = stream.read(chunk_size)
+            if not more:
+                raise ValueError(f"некорректный JSON после записи {number}") from None
+            buf, pos = buf[pos:] + more, 0
+            continue
+        if end == len(buf) and not eof:
+            # Число или строка могли оборваться на границе куска
+            more = stream.read(chunk_size)
+            if more:
+                buf, pos = buf[pos:] + more, 0
+                continue
+            eof = True
+        number += 1
+        pos = end
+        yield number, _normalize(obj) if isinstance(obj, dict) else {}
+
+
+def iter_rows(fmt: str, stream, report: ImportReport):
+    """Проверенные записи файла; ошибочные строки учитываются в report и пропускаются."""
+    if fmt == "json":
+        records = parse_json(stream)
+    elif fmt == "csv":
+        records = parse_csv(iter(stream))
+    else:
+        records = parse_txt(stream)
+    for line, record in records:
+        row = validate(line, record, report)
+        if row is not None:
+            yield row
+
+
+async def import_file(user_id: int, path: str, fmt: str, progress=None) -> ImportReport:
+    """Импортирует файл порциями по IMPORT_CHUNK_ROWS строк, каждая — в своей транзакции.
+    Разбор идёт в потоке, event loop не блокируется. progress(report) вызывается после каждой порции."""
+    report = ImportReport()
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        rows = iter_rows(fmt, f, report)
+        while True:
+            chunk = await asyncio.to_thread(list, itertools.islice(rows, IMPORT_CHUNK_ROWS))
+            if not chunk:
+                break
+            report.added += await import_notes(user_id, chunk)
+            if progress is not None:
+                await progress(report)
+    return report
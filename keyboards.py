@@ -1,4 +1,10 @@
+import functools
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from callbacks import (
+    NAV_MODES, PageWeek, ViewMonth, MonthChart,
+    ExportScope, ExportYear, ExportMonth, ExportMake, StatsView, SearchPage, Remind
+)
 
 # Базовые статические клавиатуры
 
@@ -7,7 +13,9 @@ keyboard_main = InlineKeyboardMarkup(inline_keyboard=[
     [InlineKeyboardButton(text="Посмотреть записи", callback_data="button_list_notes")],
     [InlineKeyboardButton(text="Удалить запись", callback_data="button_delete_note")],
     [InlineKeyboardButton(text="Экспорт TXT", callback_data="export_txt"), InlineKeyboardButton(text="Экспорт PDF", callback_data="export_pdf")],
-    [InlineKeyboardButton(text="Экспорт по фильтру", callback_data="export_open_filter")]
+    [InlineKeyboardButton(text="Экспорт по фильтру", callback_data="export_open_filter")],
+    [InlineKeyboardButton(text="Статистика", callback_data="button_stats")],
+    [InlineKeyboardButton(text="Напоминания", callback_data="button_reminders")]
 ])
 
 keyboard_cancel = InlineKeyboardMarkup(inline_keyboard=[
@@ -16,12 +24,22 @@ keyboard_cancel = InlineKeyboardMarkup(inline_keyboard=[
 
 # ================= Динамические клавиатуры =====================
 
-def kb_year_months(year: int, months: list[int], has_prev: bool, has_next: bool) -> InlineKeyboardMarkup:
+# Клавиатуры навигации строятся один раз на набор аргументов: повторные клики получают готовую разметку.
+# Разметка из кэша общая для всех вызовов, изменять её после получения нельзя
+KEYBOARD_CACHE_SIZE = 4096
+
+def kb_year_months(year: int, months: list[int], has_prev: bool, has_next: bool, mode: str = "view") -> InlineKeyboardMarkup:
+    """mode — режим навигации из callbacks.NAV_MODES ("view" или "del")."""
+    return _kb_year_months(year, tuple(months), has_prev, has_next, mode)
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _kb_year_months(year: int, months: tuple[int, ...], has_prev: bool, has_next: bool, mode: str) -> InlineKeyboardMarkup:
+    cb = NAV_MODES[mode]
     rows = []
     # Месяцы в 3 столбца
     line = []
     for m in months:
-        line.append(InlineKeyboardButton(text=str(m), callback_data=f"sel_month:{year}:{m}"))
+        line.append(InlineKeyboardButton(text=str(m), callback_data=cb.sel_month(year=year, month=m).pack()))
         if len(line) == 3:
             rows.append(line)
             line = []
@@ -29,49 +47,78 @@ def kb_year_months(year: int, months: list[int], has_prev: bool, has_next: bool)
         rows.append(line)
     nav = []
     if has_prev:
-        nav.append(InlineKeyboardButton(text="<<", callback_data=f"nav_year:{year}:prev"))
+        nav.append(InlineKeyboardButton(text="<<", callback_data=cb.nav_year(year=year, direction="prev").pack()))
     nav.append(InlineKeyboardButton(text="Главное меню", callback_data="button_main_menu"))
     if has_next:
-        nav.append(InlineKeyboardButton(text=">>", callback_data=f"nav_year:{year}:next"))
+        nav.append(InlineKeyboardButton(text=">>", callback_data=cb.nav_year(year=year, direction="next").pack()))
     rows.append(nav)
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
-def kb_days(year: int, month: int, days_slice: list[int], page: int, total_pages: int, include_view_month: bool = True) -> InlineKeyboardMarkup:
+def kb_days(year: int, month: int, days_slice: list[int], page: int, total_pages: int, include_view_month: bool = True,
+            view_page: int = 0, view_pages: int = 0, mode: str = "view") -> InlineKeyboardMarkup:
+    """view_page/view_pages — страница текста («Весь месяц», в режиме удаления — записи дней страницы):
+    если их больше одной, нижний ряд листает их вместо недель. mode — режим навигации из callbacks.NAV_MODES."""
+    return _kb_days(year, month, tuple(days_slice), page, total_pages, include_view_month, view_page, view_pages, mode)
+
+@functools.lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _kb_days(year: int, month: int, days_slice: tuple[int, ...], page: int, total_pages: int, include_view_month: bool,
+             view_page: int, view_pages: int, mode: str) -> InlineKeyboardMarkup:
+    cb = NAV_MODES[mode]
     rows = []
     # дни по 5 (в одну строку или перенести?) оставим в ряд
-    day_buttons = [InlineKeyboardButton(text=str(d), callback_data=f"sel_day:{year}:{month}:{d}") for d in days_slice]
+    day_buttons = [InlineKeyboardButton(text=str(d), callback_data=cb.sel_day(year=year, month=month, day=d).pack()) for d in days_slice]
     # разбить на 5 максимум
     rows.append(day_buttons)
     # Просмотр всех записей месяца
     if include_view_month:
-        rows.append([InlineKeyboardButton(text="Весь месяц", callback_data=f"view_month:{year}:{month}")])
+        rows.append([InlineKeyboardButton(text="Весь месяц", callback_data=ViewMonth(year=year, month=month).pack()),
+                     InlineKeyboardButton(text="График", callback_data=MonthChart(year=year, month=month).pack())])
     nav = []
     if page > 0:
-        nav.append(InlineKeyboardButton(text="< Дни", callback_data=f"nav_days:{year}:{month}:{page-1}"))
-    nav.append(InlineKeyboardButton(text="Месяцы", callback_data=f"back_months:{year}"))
+        nav.append(InlineKeyboardButton(text="< Дни", callback_data=cb.nav_days(year=year, month=month, page=page-1).pack()))
+    nav.append(InlineKeyboardButton(text="Месяцы", callback_data=cb.back_months(year=year).pack()))
     if page < total_pages - 1:
-        nav.append(InlineKeyboardButton(text="Дни >", callback_data=f"nav_days:{year}:{month}:{page+1}"))
+        nav.append(InlineKeyboardButton(text="Дни >", callback_data=cb.nav_days(year=year, month=month, page=page+1).pack()))
     rows.append(nav)
     # Навигация по страницам (неделям) при просмотре записей
     page_nav = []
-    if total_pages > 1:
+    if view_pages > 1:
+        def text_page(p: int) -> str:
+            if mode == "view":
+                return ViewMonth(year=year, month=month, page=p).pack()
+            # В режиме удаления листаются записи всех дней страницы, день в кнопке не важен
+            return cb.sel_day(year=year, month=month, day=days_slice[0], page=p).pack()
+        if view_page > 0:
+            page_nav.append(InlineKeyboardButton(text="< Стр.", callback_data=text_page(view_page-1)))
+        page_nav.append(InlineKeyboardButton(text=f"{view_page+1}/{view_pages}", callback_data="noop"))
+        if view_page < view_pages - 1:
+            page_nav.append(InlineKeyboardButton(text="Стр. >", callback_data=text_page(view_page+1)))
+    elif total_pages > 1:
         if page > 0:
-            page_nav.append(InlineKeyboardButton(text="< Неделя", callback_data=f"page_week:{year}:{month}:{page-1}"))
+            page_nav.append(InlineKeyboardButton(text="< Неделя", callback_data=PageWeek(year=year, month=month, page=page-1).pack()))
         page_nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="noop"))
         if page < total_pages - 1:
-            page_nav.append(InlineKeyboardButton(text="Неделя >", callback_data=f"page_week:{year}:{month}:{page+1}"))
+            page_nav.append(InlineKeyboardButton(text="Неделя >", callback_data=PageWeek(year=year, month=month, page=page+1).pack()))
     if page_nav:
         rows.append(page_nav)
     rows.append([InlineKeyboardButton(text="Главное меню", callback_data="button_main_menu")])
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
+def keyboard_cache_stats() -> dict:
+    """Попадания и размер кэшей клавиатур навигации: {(клавиатура, показатель): значение}."""
+    stats = {}
+    for name, fn in (("year_months", _kb_year_months), ("days", _kb_days)):
+        info = fn.cache_info()
+        stats.update({(name, "hits"): info.hits, (name, "misses"): info.misses, (name, "items"): info.currsize})
+    return stats
+
 # =================================================================
 
 def kb_export_root() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="Все", callback_data="export_scope:all")],
-        [InlineKeyboardButton(text="По году", callback_data="export_scope:year")],
-        [InlineKeyboardButton(text="По месяцу", callback_data="export_scope:month")],
+        [InlineKeyboardButton(text="Все", callback_data=ExportScope(scope="all").pack())],
+        [InlineKeyboardButton(text="По году", callback_data=ExportScope(scope="year").pack())],
+        [InlineKeyboardButton(text="По месяцу", callback_data=ExportScope(scope="month").pack())],
         [InlineKeyboardButton(text="Отмена", callback_data="export_cancel")]
     ])
 
@@ -79,7 +126,7 @@ def kb_export_years(years: list[int]) -> InlineKeyboardMarkup:
     rows = []
     line = []
     for y in years:
-        line.append(InlineKeyboardButton(text=str(y), callback_data=f"export_year:{y}"))
+        line.append(InlineKeyboardButton(text=str(y), callback_data=ExportYear(year=y).pack()))
         if len(line) == 3:
             rows.append(line); line=[]
     if line:
@@ -91,7 +138,7 @@ def kb_export_months(year: int, months: list[int]) -> InlineKeyboardMarkup:
     rows = []
     line = []
     for m in months:
-        line.append(InlineKeyboardButton(text=str(m), callback_data=f"export_month:{year}:{m}"))
+        line.append(InlineKeyboardButton(text=str(m), callback_data=ExportMonth(year=year, month=m).pack()))
         if len(line) == 4:
             rows.append(line); line=[]
     if line:
@@ -100,13 +147,66 @@ def kb_export_months(year: int, months: list[int]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 def kb_export_format(scope: str, year: int | None = None, month: int | None = None) -> InlineKeyboardMarkup:
-    base = f"{scope}"
+    rows = [
+        [InlineKeyboardButton(text="TXT", callback_data=ExportMake(fmt="txt", scope=scope, year=year, month=month).pack())],
+        [InlineKeyboardButton(text="PDF", callback_data=ExportMake(fmt="pdf", scope=scope, year=year, month=month).pack())],
+    ]
+    # Картинка строится только для месяца
+    if scope == 'month':
+        rows.append([InlineKeyboardButton(text="PNG (календарь и график)", callback_data=ExportMake(fmt="png", scope=scope, year=year, month=month).pack())])
+    rows.append([InlineKeyboardButton(text="Отмена", callback_data="export_cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def kb_stats(years: list[int], year: int | None = None, months: list[int] | None = None, month: int | None = None) -> InlineKeyboardMarkup:
+    """Фильтр статистики: годы, месяцы выбранного года, всё время. Текущий выбор отмечен точкой."""
+    rows = []
+    line = []
+    for y in years:
+        text = f"• {y}" if y == year and month is None else str(y)
+        line.append(InlineKeyboardButton(text=text, callback_data=StatsView(year=y).pack()))
+        if len(line) == 3:
+            rows.append(line); line=[]
+    if line:
+        rows.append(line)
     if year is not None:
-        base += f":{year}"
-    if month is not None:
-        base += f":{month}"
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="TXT", callback_data=f"export_make:txt:{base}")],
-        [InlineKeyboardButton(text="PDF", callback_data=f"export_make:pdf:{base}")],
-        [InlineKeyboardButton(text="Отмена", callback_data="export_cancel")]
-    ])
\ No newline at end of file
+        line = []
+        for m in months or []:
+            text = f"• {m}" if m == month else str(m)
+            line.append(InlineKeyboardButton(text=text, callback_data=StatsView(year=year, month=m).pack()))
+            if len(line) == 4:
+                rows.append(line); line=[]
+        if line:
+            rows.append(line)
+    rows.append([
+        InlineKeyboardButton(text="• Всё время" if year is None else "Всё время", callback_data=StatsView().pack()),
+        InlineKeyboardButton(text="Главное меню", callback_data="button_main_menu"),
+    ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def kb_search(page: int, total_pages: int) -> InlineKeyboardMarkup:
+    rows = []
+    if total_pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton(text="< Стр.", callback_data=SearchPage(page=page-1).pack()))
+        nav.append(InlineKeyboardButton(text=f"{page+1}/{total_pages}", callback_data="noop"))
+        if page < total_pages - 1:
+            nav.append(InlineKeyboardButton(text="Стр. >", callback_data=SearchPage(page=page+1).pack()))
+        rows.append(nav)
+    rows.append([InlineKeyboardButton(text="Главное меню", callback_data="button_main_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+def kb_reminders(daily_on: bool, followup_on: bool) -> InlineKeyboardMarkup:
+    rows = []
+    if daily_on:
+        rows.append([InlineKeyboardButton(text="Выключить ежедневный вопрос", callback_data=Remind(kind="daily", on=0).pack())])
+    rows.append([InlineKeyboardButton(text="Выключить вопрос после сильной боли" if followup_on else "Включить вопрос после сильной боли",
+                                      callback_data=Remind(kind="followup", on=int(not followup_on)).pack())])
+    rows.append([InlineKeyboardButton(text="Главное меню", callback_data="button_main_menu")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+# Клавиатура под самим напоминанием
+keyboard_reminder = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="Новая запись", callback_data="button_new_note")],
+    [InlineKeyboardButton(text="Настроить напоминания", callback_data="button_reminders")]
+])
@@ -0,0 +1,171 @@
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+
+# Порт HTTP-эндпоинта /metrics (формат Prometheus); пусто или 0 — выключено.
+# Под supervisor.py воркер i слушает METRICS_PORT + i
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_registry = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        _registry.append(self)
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        return self._header() + [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # счётчики по корзинам (последняя — +Inf), сумма
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class GaugeFunc(_Metric):
+    """Значения читаются в момент запроса: fn() -> {labels_tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn, labels: tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self) -> list[str]:
+        try:
+            values = self.fn()
+        except Exception as err:
+            logging.warning(f"Метрика {self.name}: {err}")
+            return []
+        return self._header() + [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in values.items()]
+
+
+def render() -> str:
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ================= Метрики бота =====================
+
+handler_seconds = Histogram("bot_handler_seconds", "Время обработки события", ("event", "handler"))
+handler_errors = Counter("bot_handler_errors_total", "Исключения в обработчиках", ("event", "handler"))
+db_seconds = Histogram("bot_db_seconds", "Время вызова функции БД, включая ожидание пула", ("function",))
+db_batch_size = Histogram("bot_db_write_batch_size", "Записей в одной групповой транзакции", (),
+                          (1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+export_seconds = Histogram("bot_export_render_seconds", "Время рендеринга экспорта в пуле процессов", ("format",))
+export_bytes = Histogram("bot_export_bytes", "Размер готового файла экспорта", ("format",), SIZE_BUCKETS)
+fsm_data_bytes = Histogram("bot_fsm_data_bytes", "Размер данных FSM пользователя после обработки", (), SIZE_BUCKETS)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: время и ошибки обработчиков, размер данных FSM.
+
+    label_fn(event, data) возвращает метку обработчика; по умолчанию — имя функции.
+    """
+
+    def __init__(self, event_name: str, label_fn=None):
+        self.event_name = event_name
+        self.label_fn = label_fn or (lambda event, data: data["handler"].callback.__name__)
+
+    async def __call__(self, handler, event, data):
+        label = self.label_fn(event, data)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(self.event_name, label)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - start, self.event_name, label)
+            state = data.get("state")
+            if state is not None:
+                fsm_data_bytes.observe(len(json.dumps(await state.get_data(), default=str)))
+
+
+async def start_metrics_server(port: int | None = None, host: str = METRICS_HOST) -> web.AppRunner | None:
+    """Запускает HTTP-сервер с /metrics. Возвращает runner для cleanup() или None, если порт не задан."""
+    if port is None:
+        port = METRICS_PORT and METRICS_PORT + int(os.getenv("BOT_WORKER_INDEX", "0"))
+    if not port:
+        return None
+
+    async def handle(_request):
+        return web.Response(body=render().encode("utf-8"),
+                            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики: http://{host}:{port}/metrics")
+    return runner
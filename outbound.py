@@ -0,0 +1,208 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.methods import AnswerCallbackQuery, EditMessageReplyMarkup, EditMessageText, SendMessage
+
+# Лимиты Bot API: ~30 сообщений в секунду на бота и ~1 в секунду на чат (с небольшим запасом на всплеск)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = int(os.getenv("OUTBOUND_GLOBAL_BURST", "10"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Сколько последних отправленных сообщений помнить для отбрасывания пустых правок
+OUTBOUND_SHOWN_CACHE = int(os.getenv("OUTBOUND_SHOWN_CACHE", "10000"))
+
+# Приоритеты: меньше — раньше. Ответ на callback снимает "часики" с кнопки, поэтому идёт первым
+PRIORITY_ACK = 0
+PRIORITY_TEXT = 1
+PRIORITY_UPLOAD = 2
+_EDIT_METHODS = (EditMessageText, EditMessageReplyMarkup)
+_TEXT_METHODS = (SendMessage, *_EDIT_METHODS)
+
+
+def method_priority(method) -> int:
+    if isinstance(method, AnswerCallbackQuery):
+        return PRIORITY_ACK
+    if isinstance(method, _TEXT_METHODS):
+        return PRIORITY_TEXT
+    return PRIORITY_UPLOAD
+
+
+class TokenBucket:
+    """Token bucket с очередью ожидающих по приоритету.
+
+    Свободный токен выдаётся сразу, только если никто не ждёт; иначе запрос
+    встаёт в кучу (priority, seq) и получает токен в порядке приоритета.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def _refill(self, now: float):
+        # Во время паузы (Retry-After) токены не копятся
+        start = max(self._updated, self._blocked_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(self._updated, now)
+
+    @property
+    def idle(self) -> bool:
+        """Полный и без очереди — такой bucket можно забыть без потери состояния."""
+        now = time.monotonic()
+        self._refill(now)
+        return not self._waiters and self._tokens >= self.capacity and now >= self._blocked_until
+
+    async def acquire(self, priority: int = 0):
+        now = time.monotonic()
+        self._refill(now)
+        if not self._waiters and self._tokens >= 1 and now >= self._blocked_until:
+            self._tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def pause(self, seconds: float):
+        """Retry-After: не выдавать токены ближайшие seconds секунд."""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = 0.0
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._schedule()
+
+    def _schedule(self):
+        if self._timer is not None or not self._waiters:
+            return
+        now = time.monotonic()
+        delay = max(self._blocked_until - now, (1 - self._tokens) / self.rate, 0.0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and self._tokens >= 1 and now >= self._blocked_until:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # ожидающий отменён
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        # Отменённые ожидающие не должны держать таймер
+        while self._waiters and self._waiters[0][2].done():
+            heapq.heappop(self._waiters)
+        self._schedule()
+
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Middleware сессии бота: все исходящие вызовы Bot API проходят через
+    глобальный и per-chat token bucket с приоритетами, TelegramRetryAfter
+    ставит соответствующий bucket на паузу и запрос повторяется.
+    Лимит на чат у Telegram — на новые сообщения: правки и ответы на callback
+    идут только через глобальный bucket, иначе каждое нажатие навигации ждало бы до секунды.
+
+    Правки, текст и клавиатура которых совпадают с уже показанными, не
+    отправляются; "message is not modified" считается успехом.
+    Подключение: bot.session.middleware(OutboundScheduler(...)).
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, global_burst: int = OUTBOUND_GLOBAL_BURST,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: int = OUTBOUND_CHAT_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES, shown_cache: int = OUTBOUND_SHOWN_CACHE):
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chats: dict[int | str, TokenBucket] = {}
+        # (chat_id, message_id) -> (text, reply_markup) последнего отправленного содержимого
+        self._shown: OrderedDict[tuple, tuple] = OrderedDict()
+        self._shown_limit = shown_cache
+        self.stats = {"sent": 0, "retry_after": 0, "skipped_edits": 0, "not_modified": 0}
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= 10000:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _remember(self, key: tuple, content: tuple):
+        self._shown[key] = content
+        self._shown.move_to_end(key)
+        if len(self._shown) > self._shown_limit:
+            self._shown.popitem(last=False)
+
+    def _edit_content(self, key: tuple, method) -> tuple | None:
+        if isinstance(method, EditMessageText):
+            return method.text, method.reply_markup
+        shown = self._shown.get(key)
+        return (shown[0] if shown else None), method.reply_markup
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None and not isinstance(method, AnswerCallbackQuery):
+            # getUpdates, getMe, setWebhook и т.п. — не сообщения, лимиты к ним не относятся
+            return await make_request(bot, method)
+
+        edit_key = content = None
+        if isinstance(method, _EDIT_METHODS) and method.message_id is not None:
+            edit_key = (chat_id, method.message_id)
+            content = self._edit_content(edit_key, method)
+            if self._shown.get(edit_key) == content:
+                self.stats["skipped_edits"] += 1
+                return True
+
+        priority = method_priority(method)
+        chat_limited = chat_id is not None and not isinstance(method, _EDIT_METHODS)
+        chat_bucket = self._chat_bucket(chat_id) if chat_limited else None
+        for attempt in range(self.max_retries + 1):
+            if chat_bucket is not None:
+                await chat_bucket.acquire(priority)
+            await self.global_bucket.acquire(priority)
+            try:
+                result = await make_request(bot, method)
+            except TelegramRetryAfter as err:
+                self.stats["retry_after"] += 1
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Flood control: {type(method).__name__} chat={chat_id}, пауза {err.retry_after} с")
+                if chat_bucket is None and chat_id is not None:
+                    # Правку Telegram всё же ограничил по чату: пауза для сообщений этого чата,
+                    # сама правка повторяется после неё, не останавливая остальные чаты
+                    self._chat_bucket(chat_id).pause(err.retry_after)
+                    await asyncio.sleep(err.retry_after)
+                else:
+                    (chat_bucket or self.global_bucket).pause(err.retry_after)
+                continue
+            except TelegramBadRequest as err:
+                if edit_key is None or "message is not modified" not in err.message:
+                    raise
+                self.stats["not_modified"] += 1
+                self._remember(edit_key, content)
+                return True
+            break
+
+        self.stats["sent"] += 1
+        if edit_key is not None:
+            self._remember(edit_key, content)
+        elif isinstance(method, SendMessage) and hasattr(result, "message_id"):
+            self._remember((chat_id, result.message_id), (method.text, method.reply_markup))
+        return result
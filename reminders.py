@@ -0,0 +1,204 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from datetime import datetime as _datetime, timedelta
+
+from database import (
+    NOTES_TZ, advance_reminder, load_reminders, schedule_followup, set_daily_reminder, set_followup_reminders,
+    skip_stale_reminders
+)
+
+# Напоминаний в секунду на всего бота: остальная часть лимита Bot API (OUTBOUND_GLOBAL_RATE) — ответам
+# на действия пользователей. Под supervisor.py делится между воркерами
+REMINDER_RATE = float(os.getenv("REMINDER_RATE", "10"))
+# Сколько секунд вперёд напоминания держатся в памяти; остальные ждут в SQLite
+REMINDER_HORIZON = int(os.getenv("REMINDER_HORIZON", "600"))
+# Наибольшее число напоминаний в памяти (массовое время вроде 09:00 подгружается частями)
+REMINDER_BATCH = int(os.getenv("REMINDER_BATCH", "10000"))
+# Пропущенные дольше этого (бот был остановлен) не отправляются
+REMINDER_MAX_LATE = int(os.getenv("REMINDER_MAX_LATE", "3600"))
+# Вопрос после сильной боли: начиная с какой силы и через сколько часов
+REMINDER_FOLLOWUP_STRENGTH = int(os.getenv("REMINDER_FOLLOWUP_STRENGTH", "7"))
+REMINDER_FOLLOWUP_HOURS = float(os.getenv("REMINDER_FOLLOWUP_HOURS", "3"))
+
+PACE_MIN_SLEEP = 0.01
+
+DAILY = "daily"
+FOLLOWUP = "followup"
+DAY = 86400
+
+
+def next_daily(minute: int, now: float) -> int:
+    """Ближайший момент после now, когда в NOTES_TZ наступает minute минут от полуночи."""
+    local = _datetime.fromtimestamp(now, NOTES_TZ)
+    due = local.replace(hour=minute // 60, minute=minute % 60, second=0, microsecond=0)
+    if due.timestamp() <= now:
+        due += timedelta(days=1)
+    return int(due.timestamp())
+
+
+class ReminderScheduler:
+    """Одна задача на все напоминания воркера.
+
+    В памяти — куча (due_ts, user_id, kind) только на REMINDER_HORIZON секунд вперёд и не больше
+    REMINDER_BATCH записей; дальше — курсор по индексу reminders(due_ts), окно подгружается по мере
+    продвижения времени. Поэтому память и работа в простое не зависят от числа подписанных пользователей.
+    Отправки идут не чаще rate в секунду: совпавшие по времени напоминания растягиваются.
+
+    send(user_id, kind) — корутина отправки. Воркер обслуживает пользователей с user_id % workers == shard
+    (как supervisor.shard_of), поэтому каждое напоминание отправляется одним процессом.
+    """
+
+    def __init__(self, send, rate: float = REMINDER_RATE, shard: int = 0, workers: int = 1,
+                 horizon: int = REMINDER_HORIZON, batch: int = REMINDER_BATCH, max_late: int = REMINDER_MAX_LATE):
+        self.send = send
+        self.rate = rate
+        self.shard = shard
+        self.workers = workers
+        self.horizon = horizon
+        self.batch = batch
+        self.max_late = max_late
+        self._heap: list[tuple[int, int, str]] = []
+        # (user_id, kind) -> due_ts записи в куче; записи кучи, не совпадающие со словарём, устарели
+        self._due: dict[tuple[int, str], int] = {}
+        # Всё с ключом (due_ts, user_id, kind) не больше курсора уже в куче, дальше — только в SQLite
+        self._cursor = (0, 0, "")
+        self._wake = asyncio.Event()
+        self._next_send = 0.0
+        self._task: asyncio.Task | None = None
+        self._sends: set[asyncio.Task] = set()
+        self.stats = {"sent": 0, "failed": 0, "skipped": 0, "loads": 0, "in_memory": 0}
+
+    def owns(self, user_id: int) -> bool:
+        return user_id % self.workers == self.shard
+
+    # ---------- изменения расписания (вызываются после записи в БД) ----------
+
+    def schedule(self, user_id: int, kind: str, due_ts: int):
+        if not self.owns(user_id):
+            return
+        key = (user_id, kind)
+        if (due_ts, user_id, kind) > self._cursor:
+            # За пределами загруженного окна: прочитается из SQLite в свой черёд
+            self._due.pop(key, None)
+            return
+        if self._due.get(key) == due_ts:
+            return
+        self._due[key] = due_ts
+        heapq.heappush(self._heap, (due_ts, user_id, kind))
+        if self._heap[0][0] == due_ts:
+            self._wake.set()
+
+    def cancel(self, user_id: int, kind: str):
+        self._due.pop((user_id, kind), None)
+
+    async def set_daily(self, user_id: int, minute: int | None):
+        due_ts = next_daily(minute, time.time()) if minute is not None else None
+        await set_daily_reminder(user_id, minute, due_ts)
+        if due_ts is None:
+            self.cancel(user_id, DAILY)
+        else:
+            self.schedule(user_id, DAILY, due_ts)
+
+    async def set_followup(self, user_id: int, enabled: bool):
+        await set_followup_reminders(user_id, enabled)
+        if not enabled:
+            self.cancel(user_id, FOLLOWUP)
+
+    async def note_added(self, user_id: int, strength: int):
+        """После сильной боли — вопрос через REMINDER_FOLLOWUP_HOURS (если пользователь его включил)."""
+        if strength < REMINDER_FOLLOWUP_STRENGTH:
+            return
+        due_ts = int(time.time() + REMINDER_FOLLOWUP_HOURS * 3600)
+        if await schedule_followup(user_id, due_ts):
+            self.schedule(user_id, FOLLOWUP, due_ts)
+
+    # ---------- основной цикл ----------
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.gather(*self._sends, return_exceptions=True)
+
+    async def _refill(self, now: float):
+        end = int(now) + self.horizon
+        limit = self.batch - len(self._heap)
+        rows = await load_reminders(self._cursor, end, self.shard, self.workers, limit)
+        self.stats["loads"] += 1
+        for due_ts, user_id, kind in rows:
+            if self._due.get((user_id, kind)) != due_ts:
+                self._due[(user_id, kind)] = due_ts
+                self._heap.append((due_ts, user_id, kind))
+        heapq.heapify(self._heap)
+        # Окно загружено целиком — курсор сразу за его концом (user_id не бывает отрицательным),
+        # иначе — на последней прочитанной записи
+        self._cursor = (end, -1, "") if len(rows) < limit else tuple(rows[-1])
+
+    async def run(self):
+        now = time.time()
+        skipped = await skip_stale_reminders(int(now) - self.max_late, int(now), self.shard, self.workers)
+        if skipped:
+            self.stats["skipped"] += skipped
+            logging.info(f"Пропущено устаревших напоминаний: {skipped}")
+        while True:
+            now = time.time()
+            refill_at = self._cursor[0] - self.horizon / 2
+            if now >= refill_at and len(self._heap) < self.batch // 2:
+                await self._refill(now)
+                refill_at = self._cursor[0] - self.horizon / 2
+            while self._heap and self._heap[0][0] <= now:
+                due_ts, user_id, kind = heapq.heappop(self._heap)
+                if self._due.get((user_id, kind)) != due_ts:
+                    continue  # перенесено или отключено
+                del self._due[(user_id, kind)]
+                await self._pace()
+                task = asyncio.create_task(self._fire(user_id, kind, due_ts))
+                self._sends.add(task)
+                task.add_done_callback(self._sends.discard)
+                now = time.time()
+            wake_at = self._heap[0][0] if self._heap else refill_at
+            if len(self._heap) < self.batch // 2:
+                wake_at = min(wake_at, refill_at)
+            self.stats["in_memory"] = len(self._heap)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, wake_at - time.time()))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _pace(self):
+        """Не чаще rate отправок в секунду; после простоя пауза не копится. Спит, только когда накопилось
+        хотя бы PACE_MIN_SLEEP: таймеры event loop неточны на долях миллисекунды."""
+        loop = asyncio.get_running_loop()
+        self._next_send = max(self._next_send + 1 / self.rate, loop.time())
+        delay = self._next_send - loop.time()
+        if delay >= PACE_MIN_SLEEP:
+            await asyncio.sleep(delay)
+
+    async def _fire(self, user_id: int, kind: str, due_ts: int):
+        now = time.time()
+        next_ts = due_ts + DAY * (int(now - due_ts) // DAY + 1) if kind == DAILY else None
+        try:
+            if not await advance_reminder(user_id, kind, due_ts, next_ts):
+                return
+            if next_ts is not None:
+                self.schedule(user_id, kind, next_ts)
+            if now - due_ts > self.max_late:
+                self.stats["skipped"] += 1
+                return
+            await self.send(user_id, kind)
+            self.stats["sent"] += 1
+        except Exception as err:
+            self.stats["failed"] += 1
+            logging.error(f"Напоминание {kind} user_id={user_id}: {err}")
@@ -0,0 +1,106 @@
+import re
+from datetime import datetime as _datetime, timedelta
+from typing import NamedTuple
+
+from database import NOTES_TZ
+
+# Заметок на странице результатов /search
+SEARCH_PAGE_SIZE = 10
+# Самый длинный префикс слова в запросе: совпадает с наибольшим prefix= индекса notes_fts
+SEARCH_PREFIX_MAX = 6
+
+# Окончания, которые снимаются со слова запроса: падежи существительных и прилагательных, формы глаголов.
+# Снимается самое длинное подходящее, если основа остаётся не короче STEM_MIN
+ENDINGS = sorted({
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+    "ой", "ей", "ом", "ем", "ам", "ям", "ах", "ях", "ами", "ями", "ов", "ев", "ия", "ие", "ию", "ий",
+    "ый", "ая", "яя", "ое", "ее", "ые", "ого", "его", "ому", "ему", "ым", "им", "ую", "юю", "ых", "их", "ыми", "ими",
+    "ть", "ти", "ет", "ит", "ут", "ют", "ат", "ят", "ешь", "ишь", "ете", "ите", "ил", "ила", "ило", "или",
+    "ла", "ло", "ли", "ся", "сь", "ась", "ось", "ись", "ется", "ится", "лся", "лась", "лось", "лись",
+}, key=len, reverse=True)
+STEM_MIN = 3
+
+# Слова как их режет токенизатор unicode61: буквы и цифры, подчёркивание — разделитель
+WORD_RE = re.compile(r"[^\W_]+")
+# Фильтры в запросе: "сила:5-10", "с:01.03.2025", "по:2025" (и английские синонимы)
+FILTER_RE = re.compile(r"(?i)\b(сила|strength|с|from|по|to):(\S+)")
+FILTER_NAMES = {"сила": "strength", "strength": "strength", "с": "from", "from": "from", "по": "to", "to": "to"}
+
+
+class SearchQuery(NamedTuple):
+    terms: tuple[str, ...]               # префиксы слов для notes_fts
+    min_strength: int | None
+    max_strength: int | None
+    start: _datetime | None              # включительно
+    end: _datetime | None                # не включая
+
+
+def normalize(text: str) -> str:
+    """Вид текста в индексе notes_fts: «ё» -> «е» (регистр приводит сам токенизатор)."""
+    return text.lower().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    """Основа слова для поиска по префиксу: без известного окончания (ENDINGS) и не длиннее
+    SEARCH_PREFIX_MAX букв. «таблетку» -> «таблет», найдутся «таблетка», «таблеток»; «голова» -> «голов»,
+    но не «голо», совпадавшее с «голод». Слово с незнакомым окончанием ищется целиком.
+
+    Это не морфология: короткая основа всё равно может совпасть с чужим словом («боль» -> «бол» найдёт
+    и «болото»), а чередования вроде «день» — «дня» не находятся. Для поиска по своим комментариям
+    лишние совпадения дешевле пропущенных: их видно и они ранжируются ниже."""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= STEM_MIN:
+            word = word[:-len(ending)]
+            break
+    return word[:SEARCH_PREFIX_MAX]
+
+
+def _parse_date(value: str, upper: bool) -> _datetime:
+    """дд.мм.гггг, мм.гггг или гггг -> начало периода или (upper) начало следующего."""
+    parts = [int(part) for part in value.split(".")]
+    if len(parts) == 3:
+        day, month, year = parts
+        start = _datetime(year, month, day, tzinfo=NOTES_TZ)
+        return start + timedelta(days=1) if upper else start
+    if len(parts) == 2:
+        month, year = parts
+        start = _datetime(year, month, 1, tzinfo=NOTES_TZ)
+        return _datetime(year + month // 12, month % 12 + 1, 1, tzinfo=NOTES_TZ) if upper else start
+    if len(parts) == 1:
+        return _datetime(parts[0] + upper, 1, 1, tzinfo=NOTES_TZ)
+    raise ValueError
+
+
+def parse_query(text: str) -> SearchQuery:
+    """Разбирает строку /search: слова комментария и фильтры. ValueError с понятным текстом при ошибке."""
+    filters = {}
+    for name, value in FILTER_RE.findall(text):
+        filters[FILTER_NAMES[name.lower()]] = value
+    text = FILTER_RE.sub(" ", text)
+    min_strength = max_strength = start = end = None
+    if "strength" in filters:
+        low, _, high = filters["strength"].partition("-")
+        try:
+            min_strength = int(low)
+            max_strength = int(high) if high else min_strength
+        except ValueError:
+            raise ValueError("сила: нужно число или диапазон, например сила:5-10") from None
+        if not 1 <= min_strength <= max_strength <= 10:
+            raise ValueError("сила: диапазон должен быть внутри 1..10")
+    for name, upper in (("from", False), ("to", True)):
+        if name in filters:
+            try:
+                value = _parse_date(filters[name], upper)
+            except (ValueError, OverflowError):
+                raise ValueError(f"не удалось разобрать дату {filters[name]!r}: нужна дд.мм.гггг, мм.гггг или гггг") from None
+            if upper:
+                end = value
+            else:
+                start = value
+    # Однобуквенные слова (предлоги) совпали бы почти со всеми заметками
+    terms = tuple(dict.fromkeys(stem(word) for word in WORD_RE.findall(normalize(text)) if len(word) > 1))
+    return SearchQuery(terms, min_strength, max_strength, start, end)
+
+
+def has_conditions(query: SearchQuery) -> bool:
+    return bool(query.terms) or any(value is not None for value in query[1:])
@@ -0,0 +1,265 @@
+"""Многопроцессный режим: супервизор получает обновления и раздаёт их N воркерам
+по хэшу from_user.id, так что FSM и порядок записей пользователя остаются в одном процессе.
+
+Запуск: BOT_WORKERS=4 python supervisor.py
+"""
+import asyncio
+import atexit
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import secrets
+import signal
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+env_path = Path(__file__).parent / '.env'
+if env_path.exists():
+    load_dotenv(env_path)
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", str(os.cpu_count() or 1)))
+# Пауза перед перезапуском упавшего воркера, с
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", "1"))
+# Как часто воркер без обновлений проверяет, жив ли супервизор, с
+PARENT_CHECK_INTERVAL = 1.0
+LOG_FORMAT = "%(asctime)s %(processName)s %(levelname)s %(message)s"
+
+
+def shard_of(user_id: int, workers: int) -> int:
+    """Номер воркера, который обслуживает пользователя."""
+    return user_id % workers
+
+
+def update_user_id(update: dict) -> int:
+    """from_user.id события в сыром обновлении (0, если пользователя нет)."""
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        user = event.get("from") or event.get("user")
+        if user:
+            return user["id"]
+        chat = event.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+# ================= Воркер =====================
+
+def _next_update(updates) -> dict | None:
+    """Следующее обновление шарда; None — сигнал остановки или супервизор умер (например, SIGKILL)
+    и обновлений больше не будет."""
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return updates.get(timeout=PARENT_CHECK_INTERVAL)
+        except queue.Empty:
+            if parent is not None and not parent.is_alive():
+                logging.warning("Супервизор завершился, воркер останавливается")
+                return None
+
+
+def worker_main(index: int, workers: int, updates, log_queue):
+    # Логи воркера уходят в очередь супервизора; basicConfig в bot.py тогда ничего не делает
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    root.setLevel(logging.INFO)
+    os.environ["BOT_WORKER_INDEX"] = str(index)
+    os.environ["BOT_WORKERS"] = str(workers)
+    try:
+        asyncio.run(_worker_loop(updates))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(updates):
+    import bot as app
+
+    await app.init_db()
+    metrics_runner = await app.start_metrics_server()
+    # Каждый воркер отправляет напоминания только пользователям своего шарда
+    app.reminders.start()
+    loop = asyncio.get_running_loop()
+    # SIGTERM от Supervisor._reap — та же мягкая остановка, что и по сигналу в очереди:
+    # дождаться начатых обновлений и закрыть пул экспорта, не оставляя его процессы сиротами
+    loop.add_signal_handler(signal.SIGTERM, updates.put, None)
+    tasks = set()
+
+    async def process(update: dict):
+        try:
+            await app.dp.feed_raw_update(app.bot, update)
+        except Exception:
+            logging.exception(f"Ошибка обработки update_id={update.get('update_id')}")
+
+    logging.info("Воркер запущен")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, _next_update, updates)
+            if update is None:
+                break
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+    finally:
+        await app.reminders.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        app.shutdown_export_pool()
+        app.close_db()
+        await app.bot.session.close()
+    logging.info("Воркер остановлен")
+
+
+# ================= Супервизор =====================
+
+class Supervisor:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._ctx = multiprocessing.get_context("spawn")
+        self.log_queue = self._ctx.Queue()
+        self.queues = [self._ctx.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.stopping = False
+
+    def _start(self, index: int):
+        # Не daemon: у воркера свой пул процессов экспорта (export.py), а daemon-процессу нельзя
+        # заводить дочерние. Завершение воркеров — stop() или, при аварийном выходе, _reap()
+        proc = self._ctx.Process(target=worker_main, args=(index, self.workers, self.queues[index], self.log_queue),
+                                 name=f"worker-{index}")
+        proc.start()
+        self.processes[index] = proc
+
+    def start(self):
+        # atexit выполняется в обратном порядке: _reap успеет раньше, чем multiprocessing
+        # начнёт бесконечно ждать не-daemon воркеры
+        atexit.register(self._reap)
+        for index in range(self.workers):
+            self._start(index)
+
+    def dispatch(self, update: dict):
+        self.queues[shard_of(update_user_id(update), self.workers)].put(update)
+
+    async def watch(self):
+        """Перезапускает упавшие воркеры. Шард получает новую очередь: убитый процесс
+        мог умереть, удерживая блокировку чтения старой."""
+        while not self.stopping:
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            for index, proc in enumerate(self.processes):
+                if not self.stopping and not proc.is_alive():
+                    logging.warning(f"worker-{index} завершился с кодом {proc.exitcode}, перезапуск")
+                    self.queues[index].cancel_join_thread()
+                    self.queues[index] = self._ctx.Queue()
+                    self._start(index)
+
+    def stop(self, timeout: float = 15):
+        self.stopping = True
+        for q in self.queues:
+            q.put(None)
+        for proc in self.processes:
+            proc.join(timeout)
+        self._reap()
+
+    def _reap(self, timeout: float = 5):
+        """Завершает воркеры, которые ещё живы: SIGTERM, затем SIGKILL."""
+        self.stopping = True
+        alive = [proc for proc in self.processes if proc is not None and proc.is_alive()]
+        for proc in alive:
+            proc.terminate()
+        for proc in alive:
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+
+
+async def _poll(bot, supervisor: Supervisor, stop: asyncio.Event):
+    offset = None
+    await bot.delete_webhook()
+    while not stop.is_set():
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=["message", "callback_query"])
+        except Exception as err:
+            logging.error(f"getUpdates: {err}")
+            await asyncio.sleep(1)
+            continue
+        for update in updates:
+            supervisor.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(bot, supervisor: Supervisor, stop: asyncio.Event):
+    from aiohttp import web
+    import webhook
+
+    async def handle(request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if webhook.WEBHOOK_SECRET and not secrets.compare_digest(token, webhook.WEBHOOK_SECRET):
+            return web.Response(body="Unauthorized", status=401)
+        supervisor.dispatch(await request.json())
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(webhook.WEBHOOK_PATH, handle)
+    if webhook.WEBHOOK_URL:
+        await bot.set_webhook(webhook.WEBHOOK_URL.rstrip("/") + webhook.WEBHOOK_PATH,
+                              secret_token=webhook.WEBHOOK_SECRET, allowed_updates=["message", "callback_query"])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, webhook.WEBHOOK_HOST, webhook.WEBHOOK_PORT).start()
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def run_supervisor(workers: int = BOT_WORKERS):
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    import database
+
+    token = os.getenv("TELEGRAM_API_TOKEN")
+    if not token:
+        raise RuntimeError("Не найден TELEGRAM_API_TOKEN в переменных окружения или .env файле.")
+    api_server = os.getenv("TELEGRAM_API_SERVER")
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_server)) if api_server else None
+    bot = Bot(token=token, session=session)
+
+    # Миграции выполняются один раз до старта воркеров
+    await database.init_db()
+    database.close_db()
+
+    supervisor = Supervisor(workers)
+    listener = logging.handlers.QueueListener(supervisor.log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    supervisor.start()
+    logging.info(f"Супервизор: {workers} воркеров")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    watcher = asyncio.create_task(supervisor.watch())
+    feeder = _serve_webhook if os.getenv("BOT_MODE", "polling") == "webhook" else _poll
+    feed = asyncio.create_task(feeder(bot, supervisor, stop))
+    try:
+        await stop.wait()
+    finally:
+        feed.cancel()
+        watcher.cancel()
+        await asyncio.to_thread(supervisor.stop)
+        await bot.session.close()
+        listener.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, filename="logfile.log", filemode="w", format=LOG_FORMAT)
+    print(f"Запуск супервизора ({BOT_WORKERS} воркеров)...")
+    asyncio.run(run_supervisor())